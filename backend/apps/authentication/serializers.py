@@ -2,6 +2,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 User = get_user_model()
 
@@ -20,6 +21,21 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'is_verified', 'created_at', 'updated_at']
 
 
+class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Token serializer that adds profile claims to the tokens.
+    The chat WebSocket can build the user from them without the database.
+    """
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.username
+        token['first_name'] = user.first_name
+        token['last_name'] = user.last_name
+        token['avatar'] = user.avatar.name if user.avatar else ''
+        return token
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     """
     Serializer for user registration.
@@ -10,7 +10,8 @@ from .serializers import (
     UserSerializer,
     RegisterSerializer,
     ChangePasswordSerializer,
-    UserProfileSerializer
+    UserProfileSerializer,
+    CustomTokenObtainPairSerializer
 )
 
 User = get_user_model()
@@ -21,6 +22,8 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     Custom JWT token view that includes user data in response.
     Verifica que el usuario esté verificado antes de permitir el login.
     """
+    serializer_class = CustomTokenObtainPairSerializer
+    
     def post(self, request, *args, **kwargs):
         # Primero verificar si el usuario existe y está verificado
         username = request.data.get('username')
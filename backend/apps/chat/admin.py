@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
-from .models import Channel, Message, ChannelMembership
+from .models import Channel, Message, ChannelMembership, ArchiveSegment
 
 
 class MessageInline(admin.TabularInline):
@@ -17,16 +17,15 @@ class MessageInline(admin.TabularInline):
 
 @admin.register(Channel)
 class ChannelAdmin(admin.ModelAdmin):
-    list_display = ['name', 'description', 'created_by', 'is_active', 'created_at', 'member_count']
+    list_display = ['name', 'description', 'created_by', 'is_active', 'created_at', 'member_count', 'message_count', 'last_message_at']
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'description']
-    readonly_fields = ['created_at', 'created_by']
+    readonly_fields = [
+        'created_at', 'created_by', 'member_count', 'message_count',
+        'last_message_at', 'last_message_preview'
+    ]
     inlines = [MessageInline]
     
-    def member_count(self, obj):
-        return obj.get_member_count()
-    member_count.short_description = 'Miembros'
-    
     def save_model(self, request, obj, form, change):
         if not change:  # Si es un nuevo objeto
             obj.created_by = request.user
@@ -98,15 +97,24 @@ class MessageAdmin(admin.ModelAdmin):
 
 @admin.register(ChannelMembership)
 class ChannelMembershipAdmin(admin.ModelAdmin):
-    list_display = ['user', 'channel', 'joined_at', 'last_read_at', 'unread_count']
+    list_display = ['user', 'channel', 'joined_at', 'last_read_at', 'unread_count', 'has_posted']
     list_filter = ['channel', 'joined_at']
     search_fields = ['user__first_name', 'user__last_name', 'user__email', 'channel__name']
-    readonly_fields = ['joined_at']
-    
-    def unread_count(self, obj):
-        return obj.get_unread_count()
-    unread_count.short_description = 'Mensajes sin leer'
+    readonly_fields = ['joined_at', 'unread_count', 'has_posted']
     
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related('user', 'channel')
\ No newline at end of file
+        return qs.select_related('user', 'channel')
+
+
+@admin.register(ArchiveSegment)
+class ArchiveSegmentAdmin(admin.ModelAdmin):
+    list_display = ['channel', 'month', 'message_count', 'first_created_at', 'last_created_at', 'path']
+    list_filter = ['channel']
+    readonly_fields = [
+        'channel', 'month', 'path', 'message_count', 'first_message_id',
+        'last_message_id', 'first_created_at', 'last_created_at'
+    ]
+    
+    def has_add_permission(self, request):
+        return False
\ No newline at end of file
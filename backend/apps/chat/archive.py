@@ -0,0 +1,221 @@
+"""
+Archival of old chat messages into compressed NDJSON segments.
+
+Messages older than ``ARCHIVE_AFTER_DAYS`` are moved out of the ``Message``
+table, oldest first and in bounded batches, into one gzip-compressed
+NDJSON file per channel and month under ``ARCHIVE_ROOT``. Every batch is
+added as a new gzip member, and an ``ArchiveSegment`` row keeps each
+file's id and date bounds so readers never have to list the directory.
+
+Because archival always takes the oldest messages, everything archived in
+a channel is older than everything still live. ``MessageQuerySet.page``
+relies on that to continue a history page into the archive once the live
+table runs out, so the history cursor API reaches archived messages
+transparently. Archived messages are no longer searchable.
+"""
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import ArchiveSegment, Message
+from .search import get_backend as get_search_backend
+
+User = get_user_model()
+
+ARCHIVE_ROOT = getattr(settings, 'CHAT_ARCHIVE_ROOT', os.path.join(settings.BASE_DIR, 'archive', 'chat'))
+ARCHIVE_AFTER_DAYS = getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 365)
+ARCHIVE_BATCH_SIZE = 1000
+
+RECORD_FIELDS = [
+    'id', 'channel_id', 'user_id', 'content', 'file', 'file_type',
+    'file_name', 'created_at', 'edited_at', 'is_deleted'
+]
+
+
+def segment_path(channel_id, month):
+    """Segment file of a channel's month, relative to ``ARCHIVE_ROOT``."""
+    return os.path.join(str(channel_id), f"{month:%Y-%m}.ndjson.gz")
+
+
+def message_to_record(message):
+    record = {field: getattr(message, field) for field in RECORD_FIELDS}
+    record['file'] = message.file.name or None
+    # Full precision, as history cursors compare timestamps exactly
+    record['created_at'] = message.created_at.isoformat()
+    record['edited_at'] = message.edited_at.isoformat() if message.edited_at else None
+    return record
+
+
+def record_to_message(record):
+    """Unsaved ``Message`` rebuilt from an archived record."""
+    values = dict(record)
+    values['created_at'] = parse_datetime(values['created_at'])
+    values['edited_at'] = parse_datetime(values['edited_at']) if values['edited_at'] else None
+    message = Message(**values)
+    message._state.adding = False
+    return message
+
+
+def _key(message):
+    return (message.created_at, message.id)
+
+
+@lru_cache(maxsize=32)
+def _read_segment(path, mtime):
+    records = {}
+    with gzip.open(os.path.join(ARCHIVE_ROOT, path), 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                # A batch interrupted before its commit may have been written twice
+                records[record['id']] = record
+    return sorted(records.values(), key=lambda record: (record['created_at'], record['id']))
+
+
+def read_segment(segment):
+    """Messages of a segment, oldest first."""
+    path = os.path.join(ARCHIVE_ROOT, segment.path)
+    return [record_to_message(record) for record in _read_segment(segment.path, os.path.getmtime(path))]
+
+
+def attach_users(messages):
+    """Set ``user`` on archived messages with a single query."""
+    user_ids = {message.user_id for message in messages if message.user_id}
+    users = User.objects.in_bulk(user_ids)
+    for message in messages:
+        message.user = users.get(message.user_id)
+    return messages
+
+
+def find_archived(channel_id, message_id):
+    """Archived message of a channel, or None."""
+    segment = ArchiveSegment.objects.filter(
+        channel_id=channel_id,
+        first_message_id__lte=message_id,
+        last_message_id__gte=message_id
+    ).first()
+    if segment is None:
+        return None
+    for message in read_segment(segment):
+        if message.id == message_id:
+            return message
+    return None
+
+
+def archived_page(channel_id, before=None, after=None, limit=100):
+    """
+    Archived messages around a ``(created_at, id)`` key.
+
+    ``before`` returns up to ``limit`` messages older than the key, newest
+    first; ``after`` the ones newer than it, oldest first. With neither,
+    the newest archived messages are returned.
+    """
+    segments = ArchiveSegment.objects.filter(channel_id=channel_id)
+    if after:
+        segments = segments.filter(last_created_at__gte=after[0]).order_by('month')
+    else:
+        if before:
+            segments = segments.filter(first_created_at__lte=before[0])
+        segments = segments.order_by('-month')
+
+    messages = []
+    for segment in segments:
+        segment_messages = read_segment(segment)
+        if after:
+            messages.extend(m for m in segment_messages if _key(m) > after)
+        else:
+            messages.extend(m for m in reversed(segment_messages) if not before or _key(m) < before)
+        if len(messages) >= limit:
+            break
+    return attach_users(messages[:limit])
+
+
+def _write_records(path, records):
+    """
+    Add ``records`` to a segment as a new gzip member.
+
+    The segment is rewritten into a temporary file that replaces it once
+    complete, so a crash or a full disk never leaves a truncated member
+    that would make the records already archived unreadable.
+    """
+    full_path = os.path.join(ARCHIVE_ROOT, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(full_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if os.path.exists(full_path):
+                with open(full_path, 'rb') as existing:
+                    shutil.copyfileobj(existing, f)
+            with gzip.GzipFile(fileobj=f, mode='wb') as member:
+                for record in records:
+                    member.write((json.dumps(record) + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, full_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def archive_batch(older_than=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move up to ``batch_size`` of the oldest messages older than ``older_than``
+    into their segments. Returns the number of messages archived.
+    """
+    if older_than is None:
+        older_than = timezone.now() - datetime.timedelta(days=ARCHIVE_AFTER_DAYS)
+
+    messages = list(
+        Message.objects.filter(created_at__lt=older_than).order_by('created_at', 'id')[:batch_size]
+    )
+    if not messages:
+        return 0
+
+    groups = {}
+    for message in messages:
+        created_at = timezone.localtime(message.created_at)
+        month = datetime.date(created_at.year, created_at.month, 1)
+        groups.setdefault((message.channel_id, month), []).append(message)
+
+    # Files are written first; a failed commit only leaves duplicates that
+    # readers drop, never lost messages
+    for (channel_id, month), group in groups.items():
+        _write_records(segment_path(channel_id, month), [message_to_record(m) for m in group])
+
+    with transaction.atomic():
+        for (channel_id, month), group in groups.items():
+            segment, created = ArchiveSegment.objects.select_for_update().get_or_create(
+                channel_id=channel_id,
+                month=month,
+                defaults={
+                    'path': segment_path(channel_id, month),
+                    'first_message_id': group[0].id,
+                    'last_message_id': group[-1].id,
+                    'first_created_at': group[0].created_at,
+                    'last_created_at': group[-1].created_at,
+                }
+            )
+            segment.message_count += len(group)
+            segment.first_message_id = min(segment.first_message_id, group[0].id)
+            segment.last_message_id = max(segment.last_message_id, group[-1].id)
+            segment.first_created_at = min(segment.first_created_at, group[0].created_at)
+            segment.last_created_at = max(segment.last_created_at, group[-1].created_at)
+            segment.save()
+
+        message_ids = [message.id for message in messages]
+        search_backend = get_search_backend()
+        if search_backend:
+            search_backend.unindex_many(message_ids)
+        # django_cleanup skips deferred file fields, so it keeps the
+        # attachments that archived records still point to
+        Message.objects.filter(id__in=message_ids).defer('file').delete()
+
+    return len(messages)
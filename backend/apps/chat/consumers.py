@@ -1,13 +1,48 @@
 import json
-import base64
-import markdown2
-import bleach
+import asyncio
+import logging
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files import File
 from django.utils import timezone
-from .models import Channel, Message, ChannelMembership
-from apps.authentication.models import User
+from .models import Channel, Message, ChannelMembership, HISTORY_PAGE_SIZE
+from .db import db_executor_async
+from .events import encode_event, message_to_dict
+from .metrics import metrics
+from .notifications import user_group
+from .outbox import Outbox, OutboxOverflow, BATCH_WINDOW, publish_lag, forget_lag
+from .presence import presence, presence_broadcaster, HEARTBEAT_INTERVAL
+from .protocol import JSON, negotiate
+from .receipts import read_receipts
+from .rendering import render_markdown, RenderError
+from .replay import replay_buffer
+from .typing_indicators import typing_coalescer
+from .users import user_snapshots, user_snapshot
+from .uploads import (
+    ChunkedUpload,
+    UploadError,
+    parse_chunk,
+    CHUNK_SIZE,
+    MAX_CONCURRENT_UPLOADS
+)
+from .writer import MessageWriteError, message_writer, broadcast_message
+
+logger = logging.getLogger(__name__)
+
+# Channel groups a single socket may be subscribed to at once
+MAX_SUBSCRIPTIONS = getattr(settings, 'CHAT_MAX_SUBSCRIPTIONS', 20)
+
+# Close code and grace period for clients whose outbound queue overflowed
+RESYNC_CLOSE_CODE = 4008
+RESYNC_TIMEOUT = 5
+
+# Client frame types timed separately in the metrics
+HANDLED_TYPES = frozenset([
+    'send_message', 'mark_as_read', 'typing', 'delete_message', 'resume',
+    'load_history', 'subscribe', 'unsubscribe', 'heartbeat', 'upload_start',
+    'upload_commit', 'upload_abort',
+])
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -22,20 +57,42 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
-        self.channel_groups = []
+        # Channels the socket may subscribe to, and those it is subscribed to
+        self.channel_ids = []
+        self.subscribed_ids = set()
+        self.uploads = {}
+        self.typing_channels = set()
+        # Version of each user snapshot already sent to the client
+        self.user_versions = {}
+        
+        # Frames are encoded as the first supported subprotocol offered, or JSON
+        protocol = negotiate(self.scope.get('subprotocols', []))
+        self.protocol = protocol or JSON
         
         # Accept the connection
-        await self.accept()
+        await self.accept(protocol.name if protocol else None)
         
-        # Get all channels and add user to groups
+        # Frames are written by the outbox task, never inline; clients that
+        # connect with ?batch=1 get them gathered into array frames
+        self.outbox = Outbox(
+            self.write_frame,
+            batch_window=BATCH_WINDOW if self.wants_batching() else None,
+            protocol=self.protocol
+        )
+        self.protocol.sockets += 1
+        self.overflowed = False
+        metrics.incr("sockets.connects")
+        metrics.add_gauge("sockets.open", 1)
+        metrics.start_reporter()
+        
+        # Channel groups are joined on subscribe; other channels only
+        # report unread counters through the user's notification group
         channels = await self.get_all_channels()
-        for channel in channels:
-            group_name = f"chat_{channel.id}"
-            self.channel_groups.append(group_name)
-            await self.channel_layer.group_add(
-                group_name,
-                self.channel_name
-            )
+        self.channel_ids = [channel.id for channel in channels]
+        await self.channel_layer.group_add(
+            user_group(self.user.id),
+            self.channel_name
+        )
         
         # Add user to online users group
         await self.channel_layer.group_add(
@@ -43,59 +100,109 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
-        # Notify others that user is online
-        await self.channel_layer.group_send(
-            "online_users",
-            {
-                "type": "user_online",
-                "user_id": self.user.id,
-                "user_name": self.user.get_full_name(),
-                "user_avatar": self.user.avatar.url if self.user.avatar else None
-            }
-        )
+        # Register presence and keep it alive while the socket is open
+        came_online = await presence.connect(self.user.id, self.channel_name)
+        self.heartbeat_task = asyncio.ensure_future(self.heartbeat_loop())
+        
+        # Others are told in the next presence diff
+        if came_online:
+            presence_broadcaster.joined(self.user.id)
         
         # Send initial data
         await self.send_initial_data()
     
+    def wants_batching(self):
+        """Whether the client asked for batched frames when connecting."""
+        query_params = parse_qs(self.scope.get('query_string', b'').decode())
+        return query_params.get('batch', ['0'])[0] == '1'
+    
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
         if hasattr(self, 'user') and self.user.is_authenticated:
-            # Remove from all channel groups
-            for group_name in self.channel_groups:
+            heartbeat_task = getattr(self, 'heartbeat_task', None)
+            if heartbeat_task:
+                heartbeat_task.cancel()
+            
+            outbox = getattr(self, 'outbox', None)
+            if outbox:
+                outbox.close()
+                self.protocol.sockets -= 1
+                await forget_lag(self.channel_name)
+                metrics.add_gauge("sockets.open", -1)
+            
+            # Clear typing indicators left behind
+            for channel_id in getattr(self, 'typing_channels', ()):
+                await typing_coalescer.set_typing(
+                    channel_id, self.user.id, self.user.get_full_name(), False
+                )
+            
+            # Drop unfinished uploads
+            for upload_id in list(getattr(self, 'uploads', {})):
+                self.discard_upload(upload_id)
+            
+            # Remove from subscribed channel groups
+            subscribed_ids = getattr(self, 'subscribed_ids', set())
+            for channel_id in subscribed_ids:
                 await self.channel_layer.group_discard(
-                    group_name,
+                    f"chat_{channel_id}",
                     self.channel_name
                 )
+                metrics.add_gauge(f"groups.chat_{channel_id}", -1)
             
-            # Remove from online users
+            # Remove from notification and online users groups
+            await self.channel_layer.group_discard(
+                user_group(self.user.id),
+                self.channel_name
+            )
             await self.channel_layer.group_discard(
                 "online_users",
                 self.channel_name
             )
             
-            # Notify others that user is offline
-            await self.channel_layer.group_send(
-                "online_users",
-                {
-                    "type": "user_offline",
-                    "user_id": self.user.id
-                }
+            # Notify others only when the user's last connection is gone
+            went_offline = await presence.disconnect(
+                self.user.id, self.channel_name, subscribed_ids
             )
+            if went_offline:
+                presence_broadcaster.left(self.user.id)
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming WebSocket messages."""
+        if bytes_data is not None:
+            with metrics.timer("handler.upload_chunk"):
+                await self.handle_upload_chunk(bytes_data)
+            return
+        
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
+            handler_name = message_type if message_type in HANDLED_TYPES else 'unknown'
             
-            if message_type == 'send_message':
-                await self.handle_send_message(data)
-            elif message_type == 'mark_as_read':
-                await self.handle_mark_as_read(data)
-            elif message_type == 'typing':
-                await self.handle_typing(data)
-            elif message_type == 'delete_message':
-                await self.handle_delete_message(data)
+            with metrics.timer(f"handler.{handler_name}"):
+                if message_type == 'send_message':
+                    await self.handle_send_message(data)
+                elif message_type == 'mark_as_read':
+                    await self.handle_mark_as_read(data)
+                elif message_type == 'typing':
+                    await self.handle_typing(data)
+                elif message_type == 'delete_message':
+                    await self.handle_delete_message(data)
+                elif message_type == 'resume':
+                    await self.handle_resume(data)
+                elif message_type == 'load_history':
+                    await self.handle_load_history(data)
+                elif message_type == 'subscribe':
+                    await self.handle_subscribe(data)
+                elif message_type == 'unsubscribe':
+                    await self.handle_unsubscribe(data)
+                elif message_type == 'heartbeat':
+                    await self.handle_heartbeat(data)
+                elif message_type == 'upload_start':
+                    await self.handle_upload_start(data)
+                elif message_type == 'upload_commit':
+                    await self.handle_upload_commit(data)
+                elif message_type == 'upload_abort':
+                    await self.handle_upload_abort(data)
             
         except json.JSONDecodeError:
             await self.send_error("Invalid JSON")
@@ -106,102 +213,142 @@ class ChatConsumer(AsyncWebsocketConsumer):
         """Handle sending a new message."""
         channel_id = data.get('channel_id')
         content = data.get('content', '').strip()
-        file_data = data.get('file')
         
-        if not channel_id or (not content and not file_data):
-            await self.send_error("Canal y contenido/archivo requeridos")
+        if data.get('file'):
+            await self.send_error("Los archivos se envían con upload_start")
             return
         
-        # Sanitize content
-        if content:
-            # Convert markdown to HTML
-            html_content = markdown2.markdown(
-                content,
-                extras=['fenced-code-blocks', 'tables', 'break-on-newline']
-            )
-            # Sanitize HTML
-            allowed_tags = [
-                'p', 'br', 'strong', 'em', 'u', 's', 'code', 'pre',
-                'blockquote', 'ul', 'ol', 'li', 'a', 'img', 'table',
-                'thead', 'tbody', 'tr', 'th', 'td', 'h1', 'h2', 'h3',
-                'h4', 'h5', 'h6'
-            ]
-            allowed_attributes = {
-                'a': ['href', 'title'],
-                'img': ['src', 'alt', 'title'],
-                'code': ['class']
-            }
-            content = bleach.clean(
-                html_content,
-                tags=allowed_tags,
-                attributes=allowed_attributes,
-                strip=True
+        if not channel_id or not content:
+            await self.send_error("Canal y contenido requeridos")
+            return
+        
+        try:
+            content = await render_markdown(content)
+        except RenderError as e:
+            await self.send_error(str(e))
+            return
+        
+        # Saved in a batch with other messages and broadcast by the writer
+        try:
+            await message_writer.submit(self.user, channel_id, content)
+        except MessageWriteError as e:
+            await self.send_error(str(e))
+    
+    async def handle_upload_start(self, data):
+        """Start a chunked attachment upload."""
+        upload_id = data.get('upload_id')
+        channel_id = data.get('channel_id')
+        
+        if not channel_id:
+            await self.send_upload_error(upload_id, "Canal requerido")
+            return
+        if len(self.uploads) >= MAX_CONCURRENT_UPLOADS:
+            await self.send_upload_error(upload_id, "Demasiadas subidas simultáneas")
+            return
+        
+        try:
+            upload = ChunkedUpload(
+                upload_id,
+                channel_id=channel_id,
+                name=data.get('name'),
+                size=data.get('size'),
+                content=data.get('content', '').strip()
             )
+        except UploadError as e:
+            await self.send_upload_error(upload_id, str(e))
+            return
         
-        # Create message
-        message = await self.create_message(
-            channel_id=channel_id,
-            content=content,
-            file_data=file_data
-        )
+        if upload.upload_id in self.uploads:
+            upload.discard()
+            await self.send_upload_error(upload_id, "La subida ya existe")
+            return
         
-        if message:
-            # Prepare message data
-            message_data = {
-                "type": "new_message",
-                "message": {
-                    "id": message.id,
-                    "channel_id": message.channel_id,
-                    "user": {
-                        "id": message.user.id,
-                        "name": message.user.get_full_name(),
-                        "avatar": message.user.avatar.url if message.user.avatar else None
-                    },
-                    "content": message.content,
-                    "file": {
-                        "url": message.get_file_url(),
-                        "type": message.file_type,
-                        "name": message.file_name
-                    } if message.file else None,
-                    "created_at": message.created_at.isoformat(),
-                    "is_deleted": message.is_deleted
-                }
-            }
-            
-            # Send to channel group
-            await self.channel_layer.group_send(
-                f"chat_{channel_id}",
-                message_data
+        self.uploads[upload.upload_id] = upload
+        await self.send_payload({
+            "type": "upload_ready",
+            "upload_id": upload.upload_id,
+            "chunk_size": CHUNK_SIZE
+        })
+    
+    async def handle_upload_chunk(self, frame):
+        """Append a binary chunk to its upload."""
+        upload_id = None
+        try:
+            upload_id, seq, payload = parse_chunk(frame)
+            upload = self.uploads.get(upload_id)
+            if upload is None:
+                raise UploadError("Subida desconocida")
+            upload.write_chunk(seq, payload)
+        except UploadError as e:
+            self.discard_upload(upload_id)
+            await self.send_upload_error(upload_id, str(e))
+            return
+        
+        await self.send_payload({
+            "type": "upload_ack",
+            "upload_id": upload_id,
+            "seq": seq,
+            "received": upload.received
+        })
+    
+    async def handle_upload_commit(self, data):
+        """Create the message once every chunk has been received."""
+        upload_id = data.get('upload_id')
+        upload = self.uploads.pop(upload_id, None)
+        if upload is None:
+            await self.send_upload_error(upload_id, "Subida desconocida")
+            return
+        
+        try:
+            upload.finish()
+            message = await self.create_message(
+                channel_id=upload.channel_id,
+                content=await render_markdown(upload.content) if upload.content else '',
+                upload=upload
             )
+        except (UploadError, RenderError) as e:
+            await self.send_upload_error(upload_id, str(e))
+            return
+        finally:
+            upload.discard()
+        
+        if message:
+            await self.broadcast_message(message)
+        else:
+            await self.send_upload_error(upload_id, "No se pudo guardar el archivo")
+    
+    async def handle_upload_abort(self, data):
+        """Discard an upload in progress."""
+        self.discard_upload(data.get('upload_id'))
     
     async def handle_mark_as_read(self, data):
         """Handle marking channel as read."""
         channel_id = data.get('channel_id')
         
-        if channel_id:
-            await self.mark_channel_as_read(channel_id)
+        if channel_id in self.channel_ids:
+            # Written in the background with other read receipts
+            read_receipts.mark(self.user.id, channel_id)
             
             # Send confirmation
-            await self.send(text_data=json.dumps({
+            await self.send_payload({
                 "type": "marked_as_read",
                 "channel_id": channel_id
-            }))
+            })
     
     async def handle_typing(self, data):
         """Handle typing indicator."""
         channel_id = data.get('channel_id')
-        is_typing = data.get('is_typing', False)
+        is_typing = bool(data.get('is_typing', False))
         
-        if channel_id:
-            await self.channel_layer.group_send(
-                f"chat_{channel_id}",
-                {
-                    "type": "user_typing",
-                    "user_id": self.user.id,
-                    "user_name": self.user.get_full_name(),
-                    "channel_id": channel_id,
-                    "is_typing": is_typing
-                }
+        if channel_id in self.channel_ids:
+            if is_typing:
+                self.typing_channels.add(channel_id)
+            else:
+                self.typing_channels.discard(channel_id)
+            
+            # Coalesced into periodic typing_snapshot events
+            await typing_coalescer.set_typing(
+                channel_id, self.user.id, self.user.get_full_name(), is_typing
             )
     
     async def handle_delete_message(self, data):
@@ -215,93 +362,342 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 # Notify channel
                 message = await self.get_message(message_id)
                 if message:
+                    event = {
+                        "type": "message_deleted",
+                        "message_id": message.id,
+                        "channel_id": message.channel_id
+                    }
+                    await replay_buffer.append(message.channel_id, event)
                     await self.channel_layer.group_send(
                         f"chat_{message.channel_id}",
-                        {
-                            "type": "message_deleted",
-                            "message_id": message_id,
-                            "channel_id": message.channel_id
-                        }
+                        encode_event(event)
                     )
     
+    async def handle_resume(self, data):
+        """Replay events missed while the client was disconnected."""
+        last_seen = data.get('channels') or {}
+        
+        for channel_id, last_seen_message_id in last_seen.items():
+            channel_id = int(channel_id)
+            if channel_id not in self.channel_ids or not last_seen_message_id:
+                continue
+            
+            events = await replay_buffer.since(channel_id, int(last_seen_message_id))
+            source = "buffer"
+            has_more = False
+            
+            # The gap is larger than the buffer: read it from the database
+            if events is None:
+                source = "database"
+                async with replay_buffer.db_semaphore():
+                    messages, has_more = await self.get_history_page(
+                        channel_id,
+                        after_id=int(last_seen_message_id)
+                    )
+                events = [
+                    {"type": "new_message", "message": message}
+                    for message in messages
+                ]
+            
+            await self.send_users(
+                event["message"]["user_id"] for event in events if "message" in event
+            )
+            await self.send_payload({
+                "type": "catch_up",
+                "channel_id": channel_id,
+                "source": source,
+                "events": events,
+                "has_more": has_more,
+                # Deletions since the cursor are only in the buffer
+                "refresh": source == "database"
+            })
+    
+    async def handle_load_history(self, data):
+        """Send a keyset page of a channel's history."""
+        channel_id = data.get('channel_id')
+        if not channel_id:
+            await self.send_error("Canal requerido")
+            return
+        
+        if data.get('before_id') and data.get('after_id'):
+            await self.send_error("Usa before_id o after_id, no ambos")
+            return
+        
+        limit = max(1, min(int(data.get('limit') or HISTORY_PAGE_SIZE), HISTORY_PAGE_SIZE))
+        messages, has_more = await self.get_history_page(
+            channel_id,
+            before_id=data.get('before_id'),
+            after_id=data.get('after_id'),
+            limit=limit
+        )
+        
+        await self.send_users(message["user_id"] for message in messages)
+        await self.send_payload({
+            "type": "history",
+            "channel_id": channel_id,
+            "messages": messages,
+            "has_more": has_more
+        })
+    
+    async def handle_subscribe(self, data):
+        """Start receiving a channel's events."""
+        channel_id = data.get('channel_id')
+        
+        if channel_id not in self.channel_ids:
+            # Channels created after connecting are looked up once
+            if not channel_id or not await self.channel_exists(channel_id):
+                await self.send_error("Canal no encontrado")
+                return
+            self.channel_ids.append(channel_id)
+        
+        if channel_id not in self.subscribed_ids:
+            if len(self.subscribed_ids) >= MAX_SUBSCRIPTIONS:
+                await self.send_error("Demasiados canales abiertos")
+                return
+            self.subscribed_ids.add(channel_id)
+            await self.channel_layer.group_add(
+                f"chat_{channel_id}",
+                self.channel_name
+            )
+            metrics.add_gauge(f"groups.chat_{channel_id}", 1)
+            await presence.join_channel(self.user.id, channel_id, self.channel_name)
+        
+        await self.send_payload({
+            "type": "subscribed",
+            "channel_id": channel_id
+        })
+    
+    async def handle_unsubscribe(self, data):
+        """Stop receiving a channel's events."""
+        channel_id = data.get('channel_id')
+        
+        if channel_id in self.subscribed_ids:
+            self.subscribed_ids.discard(channel_id)
+            await self.channel_layer.group_discard(
+                f"chat_{channel_id}",
+                self.channel_name
+            )
+            metrics.add_gauge(f"groups.chat_{channel_id}", -1)
+            await presence.leave_channel(self.user.id, channel_id, self.channel_name)
+            
+            if channel_id in self.typing_channels:
+                self.typing_channels.discard(channel_id)
+                await typing_coalescer.set_typing(
+                    channel_id, self.user.id, self.user.get_full_name(), False
+                )
+        
+        await self.send_payload({
+            "type": "unsubscribed",
+            "channel_id": channel_id
+        })
+    
+    async def handle_heartbeat(self, data):
+        """Handle client heartbeat."""
+        await presence.heartbeat(self.user.id, self.channel_name, self.subscribed_ids)
+    
+    async def heartbeat_loop(self):
+        """Refresh presence periodically while connected."""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            await presence.heartbeat(self.user.id, self.channel_name, self.subscribed_ids)
+            await publish_lag(self.channel_name, self.outbox)
+    
+    # Outbound frames
+    async def send(self, text_data=None, bytes_data=None, close=False, droppable=False):
+        """Queue a frame; typing snapshots are ``droppable``."""
+        frame = text_data if text_data is not None else bytes_data
+        outbox = getattr(self, 'outbox', None)
+        if outbox is None or frame is None:
+            await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+            return
+        if self.overflowed:
+            return
+        
+        try:
+            outbox.put(frame, droppable)
+        except OutboxOverflow:
+            self.handle_overflow()
+    
+    async def send_payload(self, payload, droppable=False):
+        """Encode a payload with the negotiated protocol and queue it."""
+        await self.send_frame(self.protocol.encode(payload), droppable)
+    
+    async def send_event(self, event, droppable=False):
+        """Queue a group event in the encoding of the negotiated protocol."""
+        await self.send_frame(self.protocol.event_frame(event), droppable)
+    
+    async def send_frame(self, frame, droppable=False):
+        """Queue an encoded frame as text or binary, as the protocol dictates."""
+        if self.protocol.binary:
+            await self.send(bytes_data=frame, droppable=droppable)
+        else:
+            await self.send(text_data=frame, droppable=droppable)
+    
+    async def write_frame(self, frame):
+        """Write a frame to the socket; called by the outbox task."""
+        if isinstance(frame, bytes):
+            await super().send(bytes_data=frame)
+        else:
+            await super().send(text_data=frame)
+    
+    def handle_overflow(self):
+        """Drop the backlog, ask the client to resync and disconnect it."""
+        self.overflowed = True
+        metrics.incr("outbox.overflows")
+        logger.warning(
+            "Chat outbox overflow for user %s: %s",
+            self.user.id, self.outbox.stats()
+        )
+        self.outbox.reset(self.protocol.encode({
+            "type": "resync",
+            "reason": "overflow"
+        }))
+        asyncio.ensure_future(self.close_after_resync())
+    
+    async def close_after_resync(self):
+        """Close once the resync hint is out, or after RESYNC_TIMEOUT."""
+        try:
+            await self.outbox.drain(RESYNC_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        await self.close(code=RESYNC_CLOSE_CODE)
+    
     # WebSocket event handlers
+    # Group events arrive already encoded (see events.encode_event)
     async def new_message(self, event):
         """Send new message to WebSocket."""
-        await self.send(text_data=json.dumps(event))
-    
-    async def user_online(self, event):
-        """Send user online notification."""
-        await self.send(text_data=json.dumps(event))
+        await self.send_users(event.get("user_ids", ()))
+        await self.send_event(event)
     
-    async def user_offline(self, event):
-        """Send user offline notification."""
-        await self.send(text_data=json.dumps(event))
+    async def presence_diff(self, event):
+        """Send the users who came online or went offline."""
+        # Diffs build on each other, so unlike snapshots they are never dropped
+        await self.send_users(event.get("user_ids", ()))
+        await self.send_event(event)
     
-    async def user_typing(self, event):
-        """Send typing indicator."""
-        # Don't send typing indicator to the user who is typing
-        if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps(event))
+    async def typing_snapshot(self, event):
+        """Send the users typing in a channel."""
+        await self.send_event(event, droppable=True)
     
     async def message_deleted(self, event):
         """Send message deletion notification."""
-        await self.send(text_data=json.dumps(event))
+        await self.send_event(event)
+    
+    async def unread_counts(self, event):
+        """Send unread counters of channels the user is a member of."""
+        await self.send_event(event)
     
     # Helper methods
+    async def broadcast_message(self, message):
+        """Send a newly created message to its channel group."""
+        await broadcast_message(message)
+    
+    async def send_users(self, user_ids):
+        """Send the snapshots of users the client has not seen in their current version."""
+        snapshots = await user_snapshots.get_many(user_id for user_id in user_ids if user_id)
+        users = []
+        for user_id, (version, snapshot) in snapshots.items():
+            if self.user_versions.get(user_id) != version:
+                self.user_versions[user_id] = version
+                users.append(snapshot)
+        
+        if users:
+            await self.send_payload({
+                "type": "users",
+                "users": users
+            })
+    
+    def discard_upload(self, upload_id):
+        """Forget an upload and remove its temporary file."""
+        upload = self.uploads.pop(upload_id, None)
+        if upload:
+            upload.discard()
+    
+    async def send_upload_error(self, upload_id, error_message):
+        """Send an upload error to the client."""
+        await self.send_payload({
+            "type": "upload_error",
+            "upload_id": upload_id,
+            "message": error_message
+        })
+    
     async def send_error(self, error_message):
         """Send error message to client."""
-        await self.send(text_data=json.dumps({
+        await self.send_payload({
             "type": "error",
             "message": error_message
-        }))
+        })
     
     async def send_initial_data(self):
         """Send initial data when user connects."""
         channels = await self.get_channels_with_unread_count()
-        online_users = await self.get_online_users()
+        online_user_ids = await presence.online_user_ids()
+        
+        # Online users count as sent snapshots
+        snapshots = await user_snapshots.get_many(online_user_ids)
+        for user_id, (version, _) in snapshots.items():
+            self.user_versions[user_id] = version
         
-        await self.send(text_data=json.dumps({
+        await self.send_payload({
             "type": "initial_data",
             "channels": channels,
-            "online_users": online_users,
-            "current_user": {
-                "id": self.user.id,
-                "name": self.user.get_full_name(),
-                "avatar": self.user.avatar.url if self.user.avatar else None
-            }
-        }))
+            "online_users": [snapshot for _, snapshot in snapshots.values()],
+            "current_user": user_snapshot(self.user)
+        })
     
     # Database operations
-    @database_sync_to_async
-    def get_all_channels(self):
+    async def get_all_channels(self):
         """Get all active channels."""
-        return list(Channel.objects.filter(is_active=True))
+        return [channel async for channel in Channel.objects.filter(is_active=True)]
     
-    @database_sync_to_async
+    async def channel_exists(self, channel_id):
+        """Check that a channel exists and is active."""
+        return await Channel.objects.filter(id=channel_id, is_active=True).aexists()
+    
+    @db_executor_async
     def get_channels_with_unread_count(self):
         """Get channels with unread count for user."""
-        channels = []
-        for channel in Channel.objects.filter(is_active=True):
-            membership, created = ChannelMembership.objects.get_or_create(
-                user=self.user,
-                channel=channel
+        channels = list(
+            Channel.objects.filter(is_active=True).with_unread_count(self.user)
+        )
+        
+        # Create memberships for channels the user has never opened
+        missing = [channel for channel in channels if channel.user_unread_count is None]
+        if missing:
+            ChannelMembership.objects.bulk_create(
+                [ChannelMembership(user=self.user, channel=channel) for channel in missing],
+                ignore_conflicts=True
             )
-            channels.append({
+        
+        unread_counts = read_receipts.unread_counts(
+            (self.user.id, channel.id, channel.user_unread_count or 0, channel.last_message_at)
+            for channel in channels
+        )
+        return [
+            {
                 "id": channel.id,
                 "name": channel.name,
                 "description": channel.description,
-                "unread_count": membership.get_unread_count()
-            })
-        return channels
+                "unread_count": unread_counts[(self.user.id, channel.id)]
+            }
+            for channel in channels
+        ]
     
-    @database_sync_to_async
-    def get_online_users(self):
-        """Get list of online users."""
-        # This is a simplified version - in production you'd track this properly
-        return []
+    @db_executor_async
+    def get_history_page(self, channel_id, before_id=None, after_id=None, limit=HISTORY_PAGE_SIZE):
+        """Get a page of channel history as WebSocket payloads."""
+        if not Channel.objects.filter(id=channel_id, is_active=True).exists():
+            return [], False
+        messages, has_more = Message.objects.page(
+            channel_id,
+            before_id=before_id,
+            after_id=after_id,
+            limit=limit
+        )
+        return [message_to_dict(message) for message in messages], has_more
     
-    @database_sync_to_async
-    def create_message(self, channel_id, content, file_data=None):
+    @db_executor_async
+    def create_message(self, channel_id, content, upload=None):
         """Create a new message."""
         try:
             channel = Channel.objects.get(id=channel_id, is_active=True)
@@ -312,50 +708,32 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 content=content
             )
             
-            # Handle file upload
-            if file_data:
-                file_content = base64.b64decode(file_data['content'])
-                file_name = file_data['name']
-                message.file.save(file_name, ContentFile(file_content))
+            # Attach a completed upload, streaming it from its temporary file
+            if upload:
+                message.file_name = upload.name
+                with open(upload.path, 'rb') as f:
+                    message.file.save(upload.name, File(f), save=False)
             
             message.save()
             
             # Update membership
-            membership, created = ChannelMembership.objects.get_or_create(
-                user=self.user,
-                channel=channel
-            )
-            membership.mark_as_read()
+            read_receipts.mark(self.user.id, channel.id, message.created_at)
             
             return message
         except Channel.DoesNotExist:
             return None
-        except Exception as e:
-            print(f"Error creating message: {e}")
+        except Exception:
+            logger.exception("Could not create chat message in channel %s", channel_id)
             return None
     
-    @database_sync_to_async
-    def mark_channel_as_read(self, channel_id):
-        """Mark channel as read for user."""
-        try:
-            membership = ChannelMembership.objects.get(
-                user=self.user,
-                channel_id=channel_id
-            )
-            membership.mark_as_read()
-            return True
-        except ChannelMembership.DoesNotExist:
-            return False
-    
-    @database_sync_to_async
-    def get_message(self, message_id):
+    async def get_message(self, message_id):
         """Get a message by ID."""
         try:
-            return Message.objects.get(id=message_id)
+            return await Message.objects.aget(id=message_id)
         except Message.DoesNotExist:
             return None
     
-    @database_sync_to_async
+    @db_executor_async
     def delete_message(self, message_id):
         """Soft delete a message."""
         try:
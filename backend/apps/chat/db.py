@@ -0,0 +1,38 @@
+"""Database access from the chat's async code, on a pool of connection threads."""
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from channels.db import DatabaseSyncToAsync, database_sync_to_async
+from django.conf import settings
+
+DB_WORKERS = getattr(settings, 'CHAT_DB_WORKERS', 4)
+
+_executor = None
+_workers = DB_WORKERS
+
+
+def configure(workers):
+    """Resize the pool; 0 sends every call to the thread-sensitive executor."""
+    global _executor, _workers
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+    _workers = workers
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix='chat-db')
+    return _executor
+
+
+def db_executor_async(func):
+    """Like ``database_sync_to_async``, but running on the chat's thread pool."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if _workers <= 0:
+            return await database_sync_to_async(func)(*args, **kwargs)
+        return await DatabaseSyncToAsync(
+            func, thread_sensitive=False, executor=get_executor()
+        )(*args, **kwargs)
+    return wrapper
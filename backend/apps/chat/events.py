@@ -0,0 +1,31 @@
+"""Channel-layer events, encoded once by the sender for every receiving socket."""
+import json
+import msgpack
+from .protocol import MSGPACK
+
+
+def encode_event(payload, user_ids=None):
+    """Channel-layer event for ``payload``, handled by ``payload['type']``."""
+    event = {"type": payload["type"], "text": json.dumps(payload)}
+    if MSGPACK.sockets:
+        event["packed"] = msgpack.packb(payload)
+    if user_ids:
+        event["user_ids"] = list(user_ids)
+    return event
+
+
+def message_to_dict(message):
+    """WebSocket representation of a message."""
+    return {
+        "id": message.id,
+        "channel_id": message.channel_id,
+        "user_id": message.user_id,
+        "content": message.content,
+        "file": {
+            "url": message.get_file_url(),
+            "type": message.file_type,
+            "name": message.file_name
+        } if message.file else None,
+        "created_at": message.created_at.isoformat(),
+        "is_deleted": message.is_deleted
+    }
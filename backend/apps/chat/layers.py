@@ -0,0 +1,258 @@
+"""
+Sharded in-process channel layer for single-node deployments.
+
+``ShardedInMemoryChannelLayer`` keeps channels and groups in the memory of
+the process, like Channels' ``InMemoryChannelLayer``, so a single-node
+install pays no Redis round trip per ``group_send``. Unlike that layer:
+
+- Every channel has a bounded queue (``capacity``, or a matching
+  ``channel_capacity`` pattern). Sending to a full channel raises
+  ``ChannelFull``; group sends skip full members.
+- Messages expire after ``expiry`` seconds and group memberships after
+  ``group_expiry``. Queues drop expired messages whenever they are used,
+  and a sweep cleans one of ``shards`` shards of channels and groups
+  every ``expiry / shards`` seconds, so no call walks every channel. A
+  channel whose messages expire unread has lost its consumer and leaves
+  its groups.
+- A group send copies the message once and hands the same dict to every
+  member, so consumers must treat received messages as read-only; the
+  one exception is the MessagePack copy that ``protocol`` stores in the
+  event once, which every member would compute alike.
+- Sends, fan-out sizes, full channels and expired messages are recorded
+  in the chat metrics (see ``metrics``), and ``stats`` reports sizes.
+
+Everything lives in one process, and so does the chat store (see
+``store``): serve both HTTP and WebSockets from a single ASGI worker.
+"""
+import asyncio
+import random
+import string
+import time
+from collections import deque
+from copy import deepcopy
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from .metrics import metrics
+
+
+class ChannelQueue:
+    """Bounded queue of (expires_at, message) with the receivers waiting on it."""
+
+    __slots__ = ('messages', 'getters', 'capacity')
+
+    def __init__(self, capacity):
+        self.messages = deque()
+        self.getters = deque()
+        self.capacity = capacity
+
+    def expire(self, now):
+        """Drop expired messages; returns how many."""
+        expired = 0
+        while self.messages and self.messages[0][0] <= now:
+            self.messages.popleft()
+            expired += 1
+        return expired
+
+    def wake_next(self):
+        while self.getters:
+            getter = self.getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                return
+
+
+class ShardedInMemoryChannelLayer(BaseChannelLayer):
+    """In-process channel layer with bounded queues and sharded group maps."""
+
+    extensions = ["groups", "flush"]
+
+    def __init__(self, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None,
+                 shards=16, **kwargs):
+        super().__init__(
+            expiry=expiry,
+            capacity=capacity,
+            channel_capacity=channel_capacity,
+            **kwargs
+        )
+        self.group_expiry = group_expiry
+        self.shard_count = shards
+        self.sweep_interval = expiry / shards
+        self._reset()
+
+    def _reset(self):
+        # Channel name -> ChannelQueue and group -> {channel: joined_at}, per shard
+        self._channels = [{} for _ in range(self.shard_count)]
+        self._groups = [{} for _ in range(self.shard_count)]
+        # Channel name -> its groups, to leave them all when it expires
+        self._memberships = {}
+        self._next_sweep = time.monotonic() + self.sweep_interval
+        self._next_shard = 0
+
+    def _shard(self, name):
+        return hash(name) % self.shard_count
+
+    def _queue(self, channel):
+        shard = self._channels[self._shard(channel)]
+        queue = shard.get(channel)
+        if queue is None:
+            queue = shard[channel] = ChannelQueue(self.get_capacity(channel))
+        return queue
+
+    def _discard_if_idle(self, channel, queue):
+        if not queue.messages and not queue.getters:
+            self._channels[self._shard(channel)].pop(channel, None)
+
+    # Channel layer API
+    async def send(self, channel, message):
+        """Send a message onto a channel."""
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        assert "__asgi_channel__" not in message
+
+        now = time.monotonic()
+        try:
+            self._deliver(channel, deepcopy(message), now)
+        except ChannelFull:
+            metrics.incr("channel_layer.full")
+            raise
+        metrics.incr("channel_layer.sent")
+        self._maybe_sweep(now)
+
+    def _deliver(self, channel, message, now):
+        queue = self._queue(channel)
+        expired = queue.expire(now)
+        if expired:
+            self._on_expired(channel, expired)
+        if len(queue.messages) >= queue.capacity:
+            raise ChannelFull(channel)
+        queue.messages.append((now + self.expiry, message))
+        queue.wake_next()
+
+    async def receive(self, channel):
+        """Receive the first message that arrives on the channel."""
+        assert self.valid_channel_name(channel)
+
+        while True:
+            # Looked up again after waiting, as a sweep may have dropped it
+            queue = self._queue(channel)
+            now = time.monotonic()
+            expired = queue.expire(now)
+            if expired:
+                self._on_expired(channel, expired)
+            if queue.messages:
+                _, message = queue.messages.popleft()
+                self._discard_if_idle(channel, queue)
+                self._maybe_sweep(now)
+                return message
+
+            getter = asyncio.get_running_loop().create_future()
+            queue.getters.append(getter)
+            try:
+                await getter
+            except asyncio.CancelledError:
+                if getter in queue.getters:
+                    queue.getters.remove(getter)
+                elif queue.messages:
+                    # Woken but cancelled: pass the message on to the next receiver
+                    queue.wake_next()
+                self._discard_if_idle(channel, queue)
+                raise
+
+    async def new_channel(self, prefix="specific."):
+        """A new channel name for something in this process to receive on."""
+        return "%s.inmemory!%s" % (
+            prefix,
+            "".join(random.choice(string.ascii_letters) for _ in range(12)),
+        )
+
+    # Expiry
+    def _maybe_sweep(self, now):
+        """Clean the next shard once per ``sweep_interval``."""
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        index = self._next_shard
+        self._next_shard = (index + 1) % self.shard_count
+
+        for channel, queue in list(self._channels[index].items()):
+            expired = queue.expire(now)
+            if expired:
+                self._on_expired(channel, expired)
+            self._discard_if_idle(channel, queue)
+
+        joined_before = now - self.group_expiry
+        for group, members in list(self._groups[index].items()):
+            for channel, joined_at in list(members.items()):
+                if joined_at < joined_before:
+                    self._leave(group, channel)
+
+    def _on_expired(self, channel, count):
+        metrics.incr("channel_layer.expired", count)
+        for group in list(self._memberships.get(channel, ())):
+            self._leave(group, channel)
+
+    def _leave(self, group, channel):
+        groups = self._groups[self._shard(group)]
+        members = groups.get(group)
+        if members is not None:
+            members.pop(channel, None)
+            if not members:
+                del groups[group]
+        memberships = self._memberships.get(channel)
+        if memberships is not None:
+            memberships.discard(group)
+            if not memberships:
+                del self._memberships[channel]
+
+    # Flush extension
+    async def flush(self):
+        self._reset()
+
+    async def close(self):
+        pass
+
+    # Groups extension
+    async def group_add(self, group, channel):
+        """Add the channel to a group."""
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        groups = self._groups[self._shard(group)]
+        groups.setdefault(group, {})[channel] = time.monotonic()
+        self._memberships.setdefault(channel, set()).add(group)
+
+    async def group_discard(self, group, channel):
+        """Remove the channel from a group."""
+        assert self.valid_channel_name(channel), "Invalid channel name"
+        assert self.valid_group_name(group), "Invalid group name"
+        self._leave(group, channel)
+
+    async def group_send(self, group, message):
+        """Send one shared copy of a message to every channel of a group."""
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.valid_group_name(group), "Invalid group name"
+
+        now = time.monotonic()
+        members = self._groups[self._shard(group)].get(group)
+        if members:
+            message = deepcopy(message)
+            full = 0
+            # Delivery may expire members, which leave the group meanwhile
+            channels = list(members)
+            for channel in channels:
+                try:
+                    self._deliver(channel, message, now)
+                except ChannelFull:
+                    full += 1
+            if full:
+                metrics.incr("channel_layer.full", full)
+            metrics.incr("channel_layer.group_sends")
+            metrics.observe("channel_layer.fanout", len(channels))
+        self._maybe_sweep(now)
+
+    def stats(self):
+        """Sizes of the layer, for monitoring."""
+        return {
+            "channels": sum(len(shard) for shard in self._channels),
+            "groups": sum(len(shard) for shard in self._groups),
+            "memberships": len(self._memberships),
+        }
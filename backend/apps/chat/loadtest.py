@@ -0,0 +1,458 @@
+"""
+In-process load test of the chat WebSocket consumer.
+
+``ChatLoadTest`` opens N sockets against the ASGI application through
+``channels.testing``, spread over M channels (socket ``i`` subscribes to
+channel ``i % M``), and runs a sequence of scenarios:
+
+- ``connect``: all sockets connect at once (a connect storm).
+- ``burst``: every socket sends a batch of messages without waiting.
+- ``typing``: every socket toggles its typing indicator repeatedly.
+- ``reconnect``: half the sockets drop, the rest keep writing, and the
+  dropped ones reconnect and resume from their last seen messages.
+
+Each scenario reports its own figures: delivery latency percentiles
+(from the send until a subscriber receives the ``new_message``), messages
+per second and database queries per message, counted on every connection
+of the process, including the pool threads. ``run`` returns a plain dict
+that the ``loadtest_chat`` command writes as JSON, so runs can be
+compared. Sockets the server closes for falling behind are counted as
+``resyncs``. With ``batch`` the sockets connect with ``?batch=1``, and
+``protocol`` picks the subprotocol they ask for; compare the
+``frames_per_delivery`` and ``bytes_per_delivery`` of ``burst`` across runs.
+"""
+import asyncio
+import itertools
+import json
+import msgpack
+import re
+import threading
+import time
+from channels.layers import DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer, channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.authentication.models import User
+from .layers import ShardedInMemoryChannelLayer
+from .middleware import JWTAuthMiddlewareStack
+from .models import Channel, Message
+from .routing import websocket_urlpatterns
+from .search import get_backend as get_search_backend
+
+SCENARIOS = ['connect', 'burst', 'typing', 'reconnect']
+
+# Messages are tagged so receivers can find when they were sent
+TAG_PATTERN = re.compile(r'loadtest-(\d+)')
+
+# Long enough never to expire; a timeout would kill the application
+RECEIVE_TIMEOUT = 3600
+
+
+def percentile(values, p):
+    """Nearest-rank percentile, in milliseconds, of latencies in seconds."""
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, int(round(p / 100 * len(values))) - 1))
+    return round(values[index] * 1000, 3)
+
+
+def latency_summary(values):
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50),
+        "p99_ms": percentile(values, 99),
+        "max_ms": round(max(values) * 1000, 3) if values else None,
+    }
+
+
+class QueryCounter:
+    """Count the queries run on every database connection of the process."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def _install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def start(self):
+        for connection in connections.all():
+            self._install(connection)
+        connection_created.connect(self._install)
+
+    def stop(self):
+        connection_created.disconnect(self._install)
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+def install_channel_layer(layer, capacity=100000):
+    """Use an in-process ``memory`` or ``sharded`` layer; ``default`` keeps the configured one."""
+    if layer == 'memory':
+        channel_layers.set(DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer(capacity=capacity))
+    elif layer == 'sharded':
+        channel_layers.set(DEFAULT_CHANNEL_LAYER, ShardedInMemoryChannelLayer(capacity=capacity))
+
+
+class LoadFixtures:
+    """
+    Users and channels that load tests and benchmarks create in the real
+    database, named after ``prefix``, and their removal.
+    """
+
+    def __init__(self, prefix, users, channels):
+        self.prefix = prefix
+        self.user_count = users
+        self.channel_count = channels
+        self.users = []
+        self.channels = []
+
+    def create(self):
+        self.users = [
+            User.objects.get_or_create(
+                username=f'{self.prefix}_{i}',
+                defaults={
+                    'email': f'{self.prefix}_{i}@example.com',
+                    'first_name': self.prefix.title(),
+                    'last_name': str(i),
+                }
+            )[0]
+            for i in range(self.user_count)
+        ]
+        stamp = int(time.time())
+        self.channels = [
+            Channel.objects.create(name=f'{self.prefix}-{stamp}-{j}', created_by=self.users[0])
+            for j in range(self.channel_count)
+        ]
+
+    def token(self, user):
+        return str(AccessToken.for_user(user))
+
+    def cleanup(self):
+        search_backend = get_search_backend()
+        if search_backend:
+            search_backend.unindex_many(list(
+                Message.objects.filter(channel__in=self.channels).values_list('id', flat=True)
+            ))
+        Channel.objects.filter(id__in=[channel.id for channel in self.channels]).delete()
+        User.objects.filter(id__in=[user.id for user in self.users]).delete()
+
+
+class LoadSocket:
+    """One simulated client, reading its frames in the background."""
+
+    def __init__(self, test, user_id, token, channel_id):
+        self.test = test
+        self.user_id = user_id
+        self.token = token
+        self.channel_id = channel_id
+        self.client = None
+        self.reader = None
+        self.closed = False
+        self.last_seen = {}
+        self.waiters = {}
+
+    async def open(self):
+        """Connect and subscribe; returns the seconds until ``initial_data``."""
+        self.closed = False
+        start = time.perf_counter()
+        path = f'/ws/chat/?token={self.token}'
+        if self.test.batch:
+            path += '&batch=1'
+        self.client = WebsocketCommunicator(
+            self.test.application, path, subprotocols=[self.test.protocol]
+        )
+        connected, _ = await self.client.connect()
+        if not connected:
+            raise RuntimeError(f'Socket of user {self.user_id} was rejected')
+        initial_data = self.expect('initial_data')
+        self.reader = asyncio.ensure_future(self.read())
+        await initial_data
+        elapsed = time.perf_counter() - start
+
+        subscribed = self.expect('subscribed')
+        await self.send({'type': 'subscribe', 'channel_id': self.channel_id})
+        await subscribed
+        return elapsed
+
+    async def close(self):
+        if self.reader:
+            self.reader.cancel()
+            self.reader = None
+        if not self.closed:
+            self.closed = True
+            await self.client.disconnect()
+
+    def expect(self, frame_type):
+        """Future resolved with the next frame of ``frame_type``."""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(frame_type, []).append(future)
+        return future
+
+    async def send(self, payload):
+        await self.client.send_to(text_data=json.dumps(payload))
+
+    async def read(self):
+        while True:
+            output = await self.client.receive_output(RECEIVE_TIMEOUT)
+            if output['type'] == 'websocket.close':
+                self.closed = True
+                self.test.resyncs += 1
+                return
+            self.test.frames += 1
+            if output.get('bytes') is not None:
+                self.test.bytes_received += len(output['bytes'])
+                data = msgpack.unpackb(output['bytes'], strict_map_key=False)
+            else:
+                self.test.bytes_received += len(output['text'].encode())
+                data = json.loads(output['text'])
+            for frame in data if isinstance(data, list) else [data]:
+                self.handle(frame)
+
+    def handle(self, frame):
+        frame_type = frame.get('type')
+        if frame_type == 'new_message':
+            self.handle_message(frame['message'])
+        elif frame_type == 'catch_up':
+            for event in frame['events']:
+                if event['type'] == 'new_message':
+                    self.handle_message(event['message'], replayed=True)
+        elif frame_type == 'typing_snapshot':
+            self.test.typing_frames += 1
+
+        for future in self.waiters.pop(frame_type, []):
+            if not future.done():
+                future.set_result(frame)
+
+    def handle_message(self, message, replayed=False):
+        channel_id = message['channel_id']
+        self.last_seen[channel_id] = max(self.last_seen.get(channel_id, 0), message['id'])
+        match = TAG_PATTERN.search(message['content'])
+        if match is None:
+            return
+        self.test.delivered += 1
+        sent_at = self.test.sent_at.get(int(match.group(1)))
+        if sent_at is not None and not replayed:
+            self.test.latencies.append(time.perf_counter() - sent_at)
+
+
+class ChatLoadTest:
+    """Fixtures, scenarios and measurements of one load test run."""
+
+    def __init__(self, sockets=50, channels=5, messages=10, typing=20, layer='memory',
+                 timeout=60, batch=False, protocol='json'):
+        self.socket_count = sockets
+        self.channel_count = channels
+        self.messages = messages
+        self.typing = typing
+        self.layer = layer
+        self.timeout = timeout
+        self.batch = batch
+        self.protocol = protocol
+        self.application = JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        self.queries = QueryCounter()
+        self.tags = itertools.count(1)
+        self.fixtures = LoadFixtures('loadtest', sockets, channels)
+        self.sockets = []
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.sent_at = {}
+        self.latencies = []
+        self.delivered = 0
+        self.typing_frames = 0
+        self.frames = 0
+        self.bytes_received = 0
+        self.resyncs = 0
+
+    # Fixtures
+    def create_fixtures(self):
+        self.fixtures.create()
+        # One message per channel, so every socket has a position to resume from
+        Message.objects.bulk_create([
+            Message(channel=channel, user=self.fixtures.users[0], content='loadtest')
+            for channel in self.fixtures.channels
+        ])
+        self.sockets = [
+            LoadSocket(
+                self,
+                user.id,
+                self.fixtures.token(user),
+                self.fixtures.channels[i % self.channel_count].id
+            )
+            for i, user in enumerate(self.fixtures.users)
+        ]
+
+    def cleanup(self):
+        self.fixtures.cleanup()
+
+    # Running
+    async def run(self, scenarios=SCENARIOS):
+        install_channel_layer(self.layer)
+
+        results = {}
+        self.queries.start()
+        try:
+            for name in ['connect'] + [name for name in scenarios if name != 'connect']:
+                results[name] = await getattr(self, f'scenario_{name}')()
+        finally:
+            self.queries.stop()
+            await asyncio.gather(*[socket.close() for socket in self.sockets if socket.client])
+        return {
+            "config": {
+                "sockets": self.socket_count,
+                "channels": self.channel_count,
+                "messages_per_socket": self.messages,
+                "typing_per_socket": self.typing,
+                "channel_layer": self.layer,
+                "batch": self.batch,
+                "protocol": self.protocol,
+            },
+            "scenarios": results,
+        }
+
+    def subscribers(self, channel_id, sockets=None):
+        return sum(
+            1 for socket in (sockets or self.sockets)
+            if socket.channel_id == channel_id and not socket.closed
+        )
+
+    async def send_messages(self, sockets):
+        """Every socket sends its batch without waiting; returns the deliveries expected."""
+        expected = 0
+        for socket in sockets:
+            expected += self.messages * self.subscribers(socket.channel_id)
+
+        async def send_batch(socket):
+            for _ in range(self.messages):
+                tag = next(self.tags)
+                self.sent_at[tag] = time.perf_counter()
+                await socket.send({
+                    'type': 'send_message',
+                    'channel_id': socket.channel_id,
+                    'content': f'loadtest-{tag}'
+                })
+
+        await asyncio.gather(*[send_batch(socket) for socket in sockets])
+        return expected
+
+    async def wait_for(self, condition):
+        deadline = time.perf_counter() + self.timeout
+        while not condition() and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+
+    async def scenario_connect(self):
+        self.reset_counters()
+        queries = self.queries.count
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*[socket.open() for socket in self.sockets])
+        elapsed = time.perf_counter() - start
+        return {
+            "connect_latency": latency_summary(latencies),
+            "connects_per_second": round(len(self.sockets) / elapsed, 1),
+            "queries_per_connect": round((self.queries.count - queries) / len(self.sockets), 2),
+        }
+
+    async def scenario_burst(self):
+        self.reset_counters()
+        queries = self.queries.count
+        start = time.perf_counter()
+        expected = await self.send_messages(self.sockets)
+        await self.wait_for(lambda: self.delivered >= expected)
+        elapsed = time.perf_counter() - start
+        sent = len(self.sent_at)
+        return {
+            "messages": sent,
+            "deliveries": self.delivered,
+            "deliveries_expected": expected,
+            "delivery_latency": latency_summary(self.latencies),
+            "messages_per_second": round(sent / elapsed, 1),
+            "deliveries_per_second": round(self.delivered / elapsed, 1),
+            "frames_per_delivery": round(self.frames / self.delivered, 3) if self.delivered else None,
+            "bytes_per_delivery": round(self.bytes_received / self.delivered, 1) if self.delivered else None,
+            "queries_per_message": round((self.queries.count - queries) / sent, 2) if sent else None,
+            "resyncs": self.resyncs,
+        }
+
+    async def scenario_typing(self):
+        self.reset_counters()
+        queries = self.queries.count
+
+        async def toggle(socket):
+            for i in range(self.typing):
+                await socket.send({
+                    'type': 'typing',
+                    'channel_id': socket.channel_id,
+                    'is_typing': i % 2 == 0
+                })
+
+        await asyncio.gather(*[toggle(socket) for socket in self.sockets])
+        sent = len(self.sockets) * self.typing
+        # Let the coalescer publish its last snapshots
+        await asyncio.sleep(1)
+        return {
+            "typing_events": sent,
+            "snapshot_frames": self.typing_frames,
+            "snapshot_frames_per_event": round(self.typing_frames / sent, 3) if sent else None,
+            "queries": self.queries.count - queries,
+            "resyncs": self.resyncs,
+        }
+
+    async def scenario_reconnect(self):
+        self.reset_counters()
+        # Every other round of sockets drops, so channels keep some writers
+        dropped = [
+            socket for i, socket in enumerate(self.sockets)
+            if (i // self.channel_count) % 2 == 0
+        ]
+        writers = [socket for socket in self.sockets if socket not in dropped]
+        await asyncio.gather(*[socket.close() for socket in dropped])
+        for socket in dropped:
+            if socket.channel_id not in socket.last_seen:
+                socket.last_seen[socket.channel_id] = await Message.objects.filter(
+                    channel_id=socket.channel_id
+                ).order_by('-id').values_list('id', flat=True).afirst()
+
+        # Messages the dropped sockets miss while away
+        missed = sum(
+            self.messages * sum(1 for d in dropped if d.channel_id == socket.channel_id)
+            for socket in writers
+        )
+        live_expected = await self.send_messages(writers)
+        await self.wait_for(lambda: self.delivered >= live_expected)
+        self.delivered = 0
+
+        queries = self.queries.count
+        start = time.perf_counter()
+
+        async def resume(socket):
+            begin = time.perf_counter()
+            await socket.open()
+            if not socket.last_seen:
+                return time.perf_counter() - begin
+            catch_up = socket.expect('catch_up')
+            await socket.send({'type': 'resume', 'channels': socket.last_seen})
+            await asyncio.wait_for(catch_up, self.timeout)
+            return time.perf_counter() - begin
+
+        latencies = await asyncio.gather(*[resume(socket) for socket in dropped])
+        elapsed = time.perf_counter() - start
+        return {
+            "reconnects": len(dropped),
+            "reconnect_latency": latency_summary(latencies),
+            "reconnects_per_second": round(len(dropped) / elapsed, 1),
+            "messages_missed": missed,
+            "messages_recovered": self.delivered,
+            "queries_per_reconnect": round((self.queries.count - queries) / len(dropped), 2) if dropped else None,
+            "resyncs": self.resyncs,
+        }
@@ -0,0 +1,53 @@
+import datetime
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.chat.archive import archive_batch, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Archiva los mensajes antiguos del chat en segmentos NDJSON comprimidos, por lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=ARCHIVE_AFTER_DAYS,
+            help=f'Antigüedad mínima en días de los mensajes a archivar (por defecto, {ARCHIVE_AFTER_DAYS})'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ARCHIVE_BATCH_SIZE,
+            help=f'Mensajes por lote (por defecto, {ARCHIVE_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='Número máximo de lotes en esta ejecución (por defecto, hasta terminar)'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Segundos de espera entre lotes'
+        )
+
+    def handle(self, *args, **options):
+        older_than = timezone.now() - datetime.timedelta(days=options['days'])
+        archived = 0
+        batches = 0
+
+        while options['max_batches'] is None or batches < options['max_batches']:
+            count = archive_batch(older_than, batch_size=options['batch_size'])
+            if not count:
+                break
+            archived += count
+            batches += 1
+            self.stdout.write(f'Lote {batches}: {count} mensajes archivados')
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Total de mensajes archivados: {archived}')
+        )
@@ -0,0 +1,134 @@
+import asyncio
+import time
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from apps.chat import db
+from apps.chat.loadtest import LoadFixtures, install_channel_layer
+from apps.chat.middleware import JWTAuthMiddlewareStack
+from apps.chat.routing import websocket_urlpatterns
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide los mensajes por segundo que atiende un worker de WebSocket del chat, '
+        'comparando distintos tamaños del pool de base de datos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clients',
+            type=int,
+            default=20,
+            help='Conexiones simultáneas (por defecto, 20)'
+        )
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=50,
+            help='Mensajes que envía cada conexión (por defecto, 50)'
+        )
+        parser.add_argument(
+            '--history-every',
+            type=int,
+            default=5,
+            help='Pide una página de historial cada N mensajes; 0 para no pedirla (por defecto, 5)'
+        )
+        parser.add_argument(
+            '--db-workers',
+            default='0,4',
+            help='Tamaños del pool a comparar, separados por comas; 0 es el hilo único (por defecto, "0,4")'
+        )
+        parser.add_argument(
+            '--layer',
+            choices=['memory', 'default'],
+            default='memory',
+            help='Capa de canales: "memory" usa una en memoria, "default" la configurada'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Conserva los usuarios, el canal y los mensajes creados'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['db_workers'].split(',')]
+        except ValueError:
+            raise CommandError('--db-workers debe ser una lista de números separados por comas')
+
+        fixtures = LoadFixtures('benchmark', options['clients'], 1)
+        fixtures.create()
+        clients = [(user.id, fixtures.token(user)) for user in fixtures.users]
+
+        try:
+            results = asyncio.run(self.run_rounds(sizes, clients, fixtures.channels[0].id, options))
+        finally:
+            db.configure(db.DB_WORKERS)
+            if not options['keep']:
+                fixtures.cleanup()
+
+        baseline = results[0][1]
+        for workers, rate in results:
+            label = 'hilo único' if workers <= 0 else f'{workers} hilos'
+            self.stdout.write(
+                f'{label:>12}: {rate:8.1f} mensajes/s ({rate / baseline:.2f}x)'
+            )
+        self.stdout.write(self.style.SUCCESS('Benchmark terminado'))
+
+    async def run_rounds(self, sizes, clients, channel_id, options):
+        application = JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        results = []
+        for workers in sizes:
+            db.configure(workers)
+            install_channel_layer(options['layer'])
+            rate = await self.run_round(application, clients, channel_id, options)
+            results.append((workers, rate))
+        return results
+
+    async def run_round(self, application, users, channel_id, options):
+        clients = []
+        for user_id, token in users:
+            client = WebsocketCommunicator(application, f'/ws/chat/?token={token}')
+            connected, _ = await client.connect()
+            if not connected:
+                raise CommandError('No se pudo abrir la conexión de WebSocket')
+            await client.send_json_to({'type': 'subscribe', 'channel_id': channel_id})
+            await self.receive_until(client, lambda frame: frame.get('type') == 'subscribed')
+            clients.append((user_id, client))
+
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            self.run_client(client, user_id, channel_id, options) for user_id, client in clients
+        ])
+        elapsed = time.perf_counter() - start
+
+        for _, client in clients:
+            await client.disconnect()
+        return len(clients) * options['messages'] / elapsed
+
+    async def run_client(self, client, user_id, channel_id, options):
+        """Send messages one after another, each once the previous one is echoed."""
+        for i in range(options['messages']):
+            await client.send_json_to({
+                'type': 'send_message',
+                'channel_id': channel_id,
+                'content': f'Mensaje de prueba {i}'
+            })
+            await self.receive_until(
+                client,
+                lambda frame: (
+                    frame.get('type') == 'new_message'
+                    and frame['message']['user_id'] == user_id
+                )
+            )
+
+            if options['history_every'] and (i + 1) % options['history_every'] == 0:
+                await client.send_json_to({'type': 'load_history', 'channel_id': channel_id})
+                await self.receive_until(client, lambda frame: frame.get('type') == 'history')
+
+    async def receive_until(self, client, match, timeout=30):
+        while True:
+            frame = await client.receive_json_from(timeout=timeout)
+            if match(frame):
+                return frame
@@ -0,0 +1,126 @@
+import asyncio
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.chat import db
+from apps.chat.loadtest import ChatLoadTest, SCENARIOS
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga del WebSocket del chat en proceso: conexiones masivas, ráfagas '
+        'de mensajes, avisos de escritura y reconexiones. Guarda los resultados en JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sockets',
+            type=int,
+            default=50,
+            help='Conexiones simultáneas (por defecto, 50)'
+        )
+        parser.add_argument(
+            '--channels',
+            type=int,
+            default=5,
+            help='Canales entre los que se reparten las conexiones (por defecto, 5)'
+        )
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=10,
+            help='Mensajes que envía cada conexión en cada ráfaga (por defecto, 10)'
+        )
+        parser.add_argument(
+            '--typing',
+            type=int,
+            default=20,
+            help='Avisos de escritura que envía cada conexión (por defecto, 20)'
+        )
+        parser.add_argument(
+            '--scenarios',
+            default=','.join(SCENARIOS),
+            help=f'Escenarios a ejecutar, separados por comas (por defecto, "{",".join(SCENARIOS)}")'
+        )
+        parser.add_argument(
+            '--layer',
+            choices=['memory', 'sharded', 'default'],
+            default='memory',
+            help=(
+                'Capa de canales: "memory" usa la de Channels en memoria, "sharded" la del chat '
+                'en memoria y "default" la configurada (p. ej. Redis)'
+            )
+        )
+        parser.add_argument(
+            '--db-workers',
+            type=int,
+            help=f'Hilos del pool de base de datos del chat (por defecto, {db.DB_WORKERS})'
+        )
+        parser.add_argument(
+            '--batch',
+            action='store_true',
+            help='Conecta con ?batch=1 para recibir los eventos agrupados en tramas JSON'
+        )
+        parser.add_argument(
+            '--protocol',
+            choices=['json', 'msgpack'],
+            default='json',
+            help='Subprotocolo que piden las conexiones (por defecto, "json")'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=60,
+            help='Segundos de espera máxima por escenario (por defecto, 60)'
+        )
+        parser.add_argument(
+            '--output',
+            help='Fichero JSON de resultados (por defecto, loadtest-<fecha>.json)'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Conserva los usuarios, los canales y los mensajes creados'
+        )
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Escenarios desconocidos: {", ".join(sorted(unknown))}')
+        if options['sockets'] < 1 or options['channels'] < 1:
+            raise CommandError('Se necesita al menos una conexión y un canal')
+
+        db_workers = db.DB_WORKERS if options['db_workers'] is None else options['db_workers']
+        db.configure(db_workers)
+
+        test = ChatLoadTest(
+            sockets=options['sockets'],
+            channels=options['channels'],
+            messages=options['messages'],
+            typing=options['typing'],
+            layer=options['layer'],
+            timeout=options['timeout'],
+            batch=options['batch'],
+            protocol=options['protocol']
+        )
+        test.create_fixtures()
+        started_at = timezone.now()
+        try:
+            results = asyncio.run(test.run(scenarios))
+        finally:
+            if not options['keep']:
+                test.cleanup()
+
+        results = {
+            "started_at": started_at.isoformat(),
+            "config": dict(results["config"], db_workers=db_workers),
+            "scenarios": results["scenarios"],
+        }
+        output = options['output'] or f'loadtest-{started_at:%Y%m%d-%H%M%S}.json'
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+        for name, figures in results["scenarios"].items():
+            self.stdout.write(f'{name}: {json.dumps(figures)}')
+        self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {output}'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from apps.chat.models import Channel
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el resumen de los canales: último mensaje, número de mensajes y de miembros'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--channel',
+            type=int,
+            help='ID del canal a recalcular (por defecto, todos)'
+        )
+
+    def handle(self, *args, **options):
+        channels = Channel.objects.all()
+        if options['channel']:
+            channels = channels.filter(id=options['channel'])
+        
+        rebuilt = 0
+        for channel in channels.iterator():
+            channel.rebuild_summary()
+            rebuilt += 1
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Total de canales recalculados: {rebuilt}')
+        )
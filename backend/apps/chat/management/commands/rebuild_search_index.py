@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from apps.chat.models import Message
+from apps.chat.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de texto completo de los mensajes del chat'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if backend is None:
+            self.stdout.write(
+                self.style.WARNING(f'La base de datos {connection.vendor} no tiene índice de búsqueda')
+            )
+            return
+        
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                backend.drop_index(cursor)
+                backend.create_index(cursor)
+            
+            messages = Message.objects.filter(is_deleted=False).only(
+                'id', 'content', 'channel_id', 'is_deleted'
+            )
+            indexed = 0
+            for message in messages.iterator(chunk_size=1000):
+                backend.index(message)
+                indexed += 1
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Total de mensajes indexados: {indexed}')
+        )
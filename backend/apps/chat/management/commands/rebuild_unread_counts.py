@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from apps.chat.models import ChannelMembership
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores de mensajes sin leer de las membresías de canal'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--channel',
+            type=int,
+            help='ID del canal a recalcular (por defecto, todos)'
+        )
+
+    def handle(self, *args, **options):
+        memberships = ChannelMembership.objects.all()
+        if options['channel']:
+            memberships = memberships.filter(channel_id=options['channel'])
+        
+        updated = memberships.recount_unread()
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Total de membresías recalculadas: {updated}')
+        )
@@ -0,0 +1,215 @@
+"""
+Metrics of the chat WebSocket subsystem.
+
+The consumer, the outbox, the message writer and ``JWTAuthMiddleware``
+update a per-process registry of counters, gauges and histograms:
+
+- ``sockets.open``, ``groups.<group>``: live sockets and group members.
+- ``handler.<frame type>``: latency of each ``receive`` handler.
+- ``outbox.depth``: queue depth of a socket when a frame is queued.
+- ``channel_layer.rtt``: round trip of a probe through the channel layer,
+  and ``channel_layer.probe_failures``: probes that failed or got no reply
+  within ``PROBE_TIMEOUT`` seconds; the in-process layer (see ``layers``) adds its own ``channel_layer.*``
+  figures and sizes.
+- ``auth.*``: handshake authentication results and latency.
+- ``writer.*``: group commit batches.
+- ``render.*``: markdown renders, cache hits, rejections and timeouts.
+
+Metrics are exposed to staff at ``/api/v1/chat/metrics/`` and logged as
+one line every ``LOG_INTERVAL`` seconds. Both only describe the process
+that serves them. With ``CHAT_METRICS_ENABLED = False`` the registry is
+replaced by one whose methods do nothing.
+"""
+import asyncio
+import bisect
+import json
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ENABLED = getattr(settings, 'CHAT_METRICS_ENABLED', True)
+LOG_INTERVAL = getattr(settings, 'CHAT_METRICS_LOG_INTERVAL', 60)
+PROBE_TIMEOUT = getattr(settings, 'CHAT_METRICS_PROBE_TIMEOUT', 5)
+
+# Upper bounds, in milliseconds, of the latency histogram buckets
+LATENCY_BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+# Upper bounds of the bucket histograms of sizes (queue depths, batches)
+SIZE_BUCKETS = [0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+_NULL_TIMER = nullcontext()
+
+
+class Histogram:
+    """Bucketed distribution with count, sum and max."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                bound = self.buckets[index] if index < len(self.buckets) else self.max
+                return round(min(bound, self.max), 3)
+        return round(self.max, 3)
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 3) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "max": round(self.max, 3),
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms of this process."""
+
+    enabled = True
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._task = None
+
+    def incr(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_gauge(self, name, delta):
+        value = self.gauges.get(name, 0) + delta
+        if value:
+            self.gauges[name] = value
+        else:
+            # Keep one gauge per live group only
+            self.gauges.pop(name, None)
+
+    def observe(self, name, value, buckets=SIZE_BUCKETS):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(buckets)
+        histogram.observe(value)
+
+    def observe_latency(self, name, seconds):
+        self.observe(name, seconds * 1000, LATENCY_BUCKETS)
+
+    @contextmanager
+    def timer(self, name):
+        """Observe the latency of the block, in milliseconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_latency(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        snapshot = {
+            "enabled": True,
+            "uptime": round(time.time() - self.started_at, 1),
+            "counters": dict(sorted(self.counters.items())),
+            "gauges": dict(sorted(self.gauges.items())),
+            "histograms": {
+                name: histogram.snapshot()
+                for name, histogram in sorted(self.histograms.items())
+            },
+        }
+        channel_layer = get_channel_layer()
+        if hasattr(channel_layer, 'stats'):
+            snapshot["channel_layer"] = channel_layer.stats()
+        return snapshot
+
+    def summary(self):
+        """Compact form of the snapshot for the periodic log line."""
+        return {
+            "counters": self.counters,
+            "gauges": self.gauges,
+            "p50_p99": {
+                name: [histogram.quantile(0.5), histogram.quantile(0.99)]
+                for name, histogram in self.histograms.items()
+            },
+        }
+
+    # Periodic reporting
+    def start_reporter(self):
+        """Start logging the metrics of this process, once per event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._report())
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(LOG_INTERVAL)
+            try:
+                await self.probe_channel_layer()
+            except Exception:
+                self.incr("channel_layer.probe_failures")
+                logger.exception("Chat channel layer probe failed")
+            logger.info("Chat metrics %s", json.dumps(self.summary(), sort_keys=True))
+
+    async def probe_channel_layer(self):
+        """Time a message sent to a private channel and received back."""
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        channel = await channel_layer.new_channel()
+        start = time.perf_counter()
+        await channel_layer.send(channel, {"type": "metrics.probe"})
+        try:
+            await asyncio.wait_for(channel_layer.receive(channel), PROBE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.incr("channel_layer.probe_failures")
+            logger.warning("Chat channel layer probe got no reply in %ss", PROBE_TIMEOUT)
+            return
+        self.observe_latency("channel_layer.rtt", time.perf_counter() - start)
+
+
+class NullMetricsRegistry:
+    """Stand-in used when metrics are disabled; every update is a no-op."""
+
+    enabled = False
+
+    def incr(self, name, value=1):
+        pass
+
+    def add_gauge(self, name, delta):
+        pass
+
+    def observe(self, name, value, buckets=SIZE_BUCKETS):
+        pass
+
+    def observe_latency(self, name, seconds):
+        pass
+
+    def timer(self, name):
+        return _NULL_TIMER
+
+    def snapshot(self):
+        return {"enabled": False}
+
+    def start_reporter(self):
+        pass
+
+
+metrics = MetricsRegistry() if ENABLED else NullMetricsRegistry()
@@ -1,23 +1,172 @@
+import time
+from collections import OrderedDict
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from django.contrib.auth import get_user_model
+from django.db.models.fields.files import FieldFile
 from urllib.parse import parse_qs
+from .metrics import metrics
+from .store import get_store, get_sync_store
 
 User = get_user_model()
 
+# 'db' loads the user on every handshake, 'cache' keeps validated tokens
+# in memory and 'claims' builds the user from the token without the DB
+AUTH_MODE = getattr(settings, 'CHAT_WS_AUTH_MODE', 'cache')
+CACHE_TTL = getattr(settings, 'CHAT_WS_AUTH_CACHE_TTL', 300)
+CACHE_SIZE = getattr(settings, 'CHAT_WS_AUTH_CACHE_SIZE', 10000)
 
-@database_sync_to_async
-def get_user(token_key):
+CLAIM_FIELDS = ['username', 'first_name', 'last_name', 'avatar']
+
+
+def _version_key(user_id):
+    return f"auth:user_version:{user_id}"
+
+
+def user_to_snapshot(user):
+    """Field values needed to rebuild a user without the database."""
+    snapshot = {}
+    for field in User._meta.concrete_fields:
+        value = getattr(user, field.attname)
+        # Keep file names only; field files are bound to their instance
+        snapshot[field.attname] = value.name if isinstance(value, FieldFile) else value
+    return snapshot
+
+
+def user_from_snapshot(values):
+    """Build a user instance that behaves as if loaded from the database."""
+    user = User(**values)
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+class TokenUserCache:
+    """Bounded cache of token id -> user snapshot, honouring token expiry."""
+    
+    def __init__(self, ttl=CACHE_TTL, max_size=CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()
+        # User id -> ids of their cached tokens
+        self._user_tokens = {}
+    
+    def get(self, jti):
+        item = self._items.get(jti)
+        if item is None:
+            return None
+        if item['expires_at'] <= time.time():
+            self.discard(jti)
+            return None
+        self._items.move_to_end(jti)
+        return item
+    
+    def set(self, jti, snapshot, version, token_exp):
+        self._items[jti] = {
+            'snapshot': snapshot,
+            'version': version,
+            'expires_at': min(time.time() + self.ttl, token_exp),
+        }
+        self._items.move_to_end(jti)
+        self._user_tokens.setdefault(snapshot['id'], set()).add(jti)
+        while len(self._items) > self.max_size:
+            self.discard(next(iter(self._items)))
+    
+    def discard(self, jti):
+        item = self._items.pop(jti, None)
+        if item is not None:
+            user_id = item['snapshot']['id']
+            tokens = self._user_tokens.get(user_id)
+            if tokens is not None:
+                tokens.discard(jti)
+                if not tokens:
+                    del self._user_tokens[user_id]
+    
+    def invalidate_user(self, user_id):
+        for jti in self._user_tokens.pop(user_id, ()):
+            self._items.pop(jti, None)
+
+
+token_cache = TokenUserCache()
+
+
+async def load_user(user_id):
+    try:
+        return await User.objects.aget(id=user_id, is_active=True)
+    except User.DoesNotExist:
+        return None
+
+
+async def get_user_version(user_id):
+    """Version bumped by signals.invalidate_user on every user change."""
+    return int(await get_store().get(_version_key(user_id)) or 0)
+
+
+async def get_user_versions(user_ids):
+    """``{user_id: version}`` for several users, with one MGET per store shard."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    values = await get_store().mget([_version_key(user_id) for user_id in user_ids])
+    return {user_id: int(value or 0) for user_id, value in zip(user_ids, values)}
+
+
+def get_user_versions_sync(user_ids):
+    """Synchronous variant of ``get_user_versions``."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    values = get_sync_store().mget([_version_key(user_id) for user_id in user_ids])
+    return {user_id: int(value or 0) for user_id, value in zip(user_ids, values)}
+
+
+def get_claims_user(access_token):
+    """Lightweight user built from the token claims, or None if they are missing."""
+    if any(claim not in access_token for claim in CLAIM_FIELDS):
+        return None
+    values = {field: access_token[field] for field in CLAIM_FIELDS}
+    return user_from_snapshot(dict(values, id=access_token['user_id'], is_active=True))
+
+
+async def get_user(token_key):
     """Get user from JWT token."""
     try:
         access_token = AccessToken(token_key)
-        user = User.objects.get(id=access_token['user_id'])
-        return user
-    except (InvalidToken, TokenError, User.DoesNotExist):
+    except (InvalidToken, TokenError):
+        metrics.incr("auth.rejected")
+        return AnonymousUser()
+    
+    user_id = access_token['user_id']
+    
+    if AUTH_MODE == 'claims':
+        user = get_claims_user(access_token)
+        if user is not None:
+            metrics.incr("auth.claims")
+            return user
+    
+    if AUTH_MODE == 'db':
+        metrics.incr("auth.db")
+        return await load_user(user_id) or AnonymousUser()
+    
+    jti = access_token.get('jti')
+    version = await get_user_version(user_id)
+    item = token_cache.get(jti)
+    if item is not None:
+        if item['version'] == version:
+            metrics.incr("auth.cache_hit")
+            return user_from_snapshot(item['snapshot'])
+        token_cache.discard(jti)
+    metrics.incr("auth.cache_miss")
+    
+    # Read the version before the user so a concurrent change is not cached
+    user = await load_user(user_id)
+    if user is None:
         return AnonymousUser()
+    token_cache.set(jti, user_to_snapshot(user), version, access_token['exp'])
+    return user
 
 
 class JWTAuthMiddleware(BaseMiddleware):
@@ -30,7 +179,8 @@ class JWTAuthMiddleware(BaseMiddleware):
         token = query_params.get('token', [None])[0]
         
         if token:
-            scope['user'] = await get_user(token)
+            with metrics.timer("auth.latency"):
+                scope['user'] = await get_user(token)
         else:
             scope['user'] = AnonymousUser()
         
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counts(apps, schema_editor):
+    ChannelMembership = apps.get_model('chat', 'ChannelMembership')
+    Message = apps.get_model('chat', 'Message')
+    unread = Message.objects.filter(
+        channel=OuterRef('channel'),
+        created_at__gt=OuterRef('last_read_at'),
+        is_deleted=False
+    ).exclude(user=OuterRef('user')).order_by().values('channel').annotate(
+        total=Count('id')
+    ).values('total')
+    ChannelMembership.objects.update(unread_count=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channelmembership',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0, help_text='Contador mantenido al crear y eliminar mensajes', verbose_name='Mensajes sin leer'),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
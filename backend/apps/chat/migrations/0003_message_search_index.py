@@ -0,0 +1,51 @@
+from django.db import migrations
+from django.utils.html import strip_tags
+
+
+def get_search_backend(connection):
+    from apps.chat.search import SQLiteMessageSearch, PostgresMessageSearch
+    if connection.vendor == 'sqlite':
+        return SQLiteMessageSearch()
+    if connection.vendor == 'postgresql':
+        return PostgresMessageSearch()
+    return None
+
+
+def create_search_index(apps, schema_editor):
+    backend = get_search_backend(schema_editor.connection)
+    if backend is None:
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        backend.create_index(cursor)
+
+        if schema_editor.connection.vendor == 'sqlite':
+            Message = apps.get_model('chat', 'Message')
+            messages = Message.objects.filter(is_deleted=False).values_list(
+                'id', 'content', 'channel_id'
+            )
+            for message_id, content, channel_id in messages.iterator():
+                cursor.execute(
+                    'INSERT INTO chat_message_fts (rowid, content, channel_id) VALUES (%s, %s, %s)',
+                    [message_id, strip_tags(content), channel_id]
+                )
+
+
+def drop_search_index(apps, schema_editor):
+    backend = get_search_backend(schema_editor.connection)
+    if backend is None:
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        backend.drop_index(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_channelmembership_unread_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
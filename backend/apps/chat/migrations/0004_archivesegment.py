@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_message_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Mes')),
+                ('path', models.CharField(max_length=255, verbose_name='Ruta del segmento')),
+                ('message_count', models.PositiveIntegerField(default=0, verbose_name='Mensajes')),
+                ('first_message_id', models.BigIntegerField(verbose_name='Primer mensaje')),
+                ('last_message_id', models.BigIntegerField(verbose_name='Último mensaje')),
+                ('first_created_at', models.DateTimeField(verbose_name='Fecha del primer mensaje')),
+                ('last_created_at', models.DateTimeField(verbose_name='Fecha del último mensaje')),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_segments', to='chat.channel', verbose_name='Canal')),
+            ],
+            options={
+                'verbose_name': 'Segmento de archivo',
+                'verbose_name_plural': 'Segmentos de archivo',
+                'ordering': ['channel', 'month'],
+                'unique_together': {('channel', 'month')},
+            },
+        ),
+    ]
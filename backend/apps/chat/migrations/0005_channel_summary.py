@@ -0,0 +1,56 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:22
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+
+def backfill_channel_summary(apps, schema_editor):
+    # Live messages only; run rebuild_channel_summaries to include archives
+    Channel = apps.get_model('chat', 'Channel')
+    Message = apps.get_model('chat', 'Message')
+    for channel in Channel.objects.all():
+        messages = Message.objects.filter(channel=channel)
+        latest = messages.order_by('-created_at', '-id').first()
+        preview = messages.filter(is_deleted=False).order_by('-created_at', '-id').first()
+        text = ''
+        if preview:
+            text = ' '.join(strip_tags(preview.content).split()) or preview.file_name
+        channel.last_message_at = latest.created_at if latest else None
+        channel.last_message_preview = Truncator(text).chars(100)
+        channel.message_count = messages.filter(is_deleted=False).count()
+        channel.member_count = messages.exclude(user=None).values('user').distinct().count()
+        channel.save(update_fields=[
+            'last_message_at', 'last_message_preview', 'message_count', 'member_count'
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_archivesegment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Último mensaje'),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Vista previa del último mensaje'),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, help_text='Usuarios que han escrito en el canal', verbose_name='Miembros'),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Mensajes'),
+        ),
+        migrations.RunPython(backfill_channel_summary, migrations.RunPython.noop),
+    ]
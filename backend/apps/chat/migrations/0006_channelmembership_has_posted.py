@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:26
+
+from django.db import migrations, models
+
+
+def backfill_has_posted(apps, schema_editor):
+    # Live messages only, like member_count in 0005; run
+    # rebuild_channel_summaries to include archives
+    ChannelMembership = apps.get_model('chat', 'ChannelMembership')
+    Message = apps.get_model('chat', 'Message')
+    senders = set(
+        Message.objects.exclude(user=None).values_list('channel_id', 'user_id').distinct()
+    )
+    ChannelMembership.objects.bulk_create(
+        [ChannelMembership(channel_id=channel_id, user_id=user_id) for channel_id, user_id in senders],
+        ignore_conflicts=True
+    )
+    for channel_id, user_id in senders:
+        ChannelMembership.objects.filter(channel_id=channel_id, user_id=user_id).update(has_posted=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_channel_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channelmembership',
+            name='has_posted',
+            field=models.BooleanField(default=False, help_text='Cuenta en los miembros del canal, aunque sus mensajes se hayan archivado', verbose_name='Ha escrito'),
+        ),
+        migrations.RunPython(backfill_has_posted, migrations.RunPython.noop),
+    ]
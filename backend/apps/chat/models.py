@@ -3,19 +3,76 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import FileExtensionValidator
 from django.core.exceptions import ValidationError
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
 import os
+from .search import get_backend as get_search_backend
 
 User = get_user_model()
 
+MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB
+ALLOWED_FILE_EXTENSIONS = ['png', 'jpg', 'jpeg', 'gif', 'pdf', 'docx', 'xlsx', 'doc', 'xls']
+IMAGE_EXTENSIONS = ['png', 'jpg', 'jpeg', 'gif']
+HISTORY_PAGE_SIZE = 100  # Max messages per history page
+PREVIEW_LENGTH = 100  # Characters of the last message kept on the channel
+
 
 def validate_file_size(file):
     """Validate that file size is not greater than 20MB."""
-    limit = 20 * 1024 * 1024  # 20MB
-    if file.size > limit:
+    if file.size > MAX_FILE_SIZE:
         raise ValidationError('El archivo no puede superar los 20MB.')
 
 
+class ChannelQuerySet(models.QuerySet):
+    """QuerySet for channels."""
+    
+    def with_unread_count(self, user):
+        """Annotate the user's stored unread counter as ``user_unread_count``."""
+        memberships = ChannelMembership.objects.filter(
+            channel=models.OuterRef('pk'),
+            user=user
+        ).values('unread_count')[:1]
+        return self.annotate(user_unread_count=models.Subquery(memberships))
+    
+    def record_new_messages(self, channel_id, messages):
+        """Apply newly created messages to the channel's summary fields."""
+        latest = max(messages, key=lambda message: (message.created_at, message.id))
+        sender_ids = {message.user_id for message in messages if message.user_id}
+        new_senders = 0
+        if sender_ids:
+            # Senders are members; their has_posted flag, unlike their older
+            # messages, survives archival
+            ChannelMembership.objects.bulk_create(
+                [ChannelMembership(user_id=user_id, channel_id=channel_id) for user_id in sender_ids],
+                ignore_conflicts=True
+            )
+            new_senders = ChannelMembership.objects.filter(
+                channel_id=channel_id,
+                user_id__in=sender_ids,
+                has_posted=False
+            ).update(has_posted=True)
+        return self.filter(id=channel_id).update(
+            last_message_at=latest.created_at,
+            last_message_preview=latest.get_preview(),
+            message_count=models.F('message_count') + sum(
+                1 for message in messages if not message.is_deleted
+            ),
+            member_count=models.F('member_count') + new_senders
+        )
+    
+    def refresh_last_message_preview(self, channel_id):
+        """Preview the latest message that has not been deleted."""
+        latest = Message.objects.filter(
+            channel_id=channel_id,
+            is_deleted=False
+        ).order_by('-created_at', '-id').first()
+        return self.filter(id=channel_id).update(
+            last_message_preview=latest.get_preview() if latest else ''
+        )
+
+
 class Channel(models.Model):
     """Model for chat channels."""
     name = models.CharField(
@@ -42,6 +99,28 @@ class Channel(models.Model):
         default=True,
         verbose_name='Activo'
     )
+    last_message_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+        verbose_name='Último mensaje'
+    )
+    last_message_preview = models.CharField(
+        max_length=PREVIEW_LENGTH,
+        blank=True,
+        verbose_name='Vista previa del último mensaje'
+    )
+    message_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Mensajes'
+    )
+    member_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Miembros',
+        help_text='Usuarios que han escrito en el canal'
+    )
+    
+    objects = ChannelQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Canal'
@@ -53,12 +132,42 @@ class Channel(models.Model):
     
     def get_online_users(self):
         """Get users currently online in this channel."""
-        # This will be implemented with WebSocket tracking
-        return User.objects.none()
+        from .presence import presence
+        return User.objects.filter(id__in=presence.online_user_ids_sync(self.id))
     
     def get_member_count(self):
         """Get total number of members who have sent messages in this channel."""
-        return self.messages.values('user').distinct().count()
+        return self.member_count
+    
+    def rebuild_summary(self):
+        """Recompute the summary fields from live and archived messages."""
+        from .archive import read_segment
+        
+        messages = self.messages.all()
+        sender_ids = set(messages.exclude(user=None).values_list('user_id', flat=True).distinct())
+        message_count = messages.filter(is_deleted=False).count()
+        latest = messages.order_by('-created_at', '-id').first()
+        for segment in self.archive_segments.all():
+            for message in read_segment(segment):
+                if message.user_id:
+                    sender_ids.add(message.user_id)
+                if not message.is_deleted:
+                    message_count += 1
+                if latest is None or (message.created_at, message.id) > (latest.created_at, latest.id):
+                    latest = message
+        
+        ChannelMembership.objects.bulk_create(
+            [ChannelMembership(user_id=user_id, channel=self) for user_id in sender_ids],
+            ignore_conflicts=True
+        )
+        self.memberships.filter(user_id__in=sender_ids).update(has_posted=True)
+        self.memberships.exclude(user_id__in=sender_ids).update(has_posted=False)
+        
+        self.member_count = len(sender_ids)
+        self.message_count = message_count
+        self.last_message_at = latest.created_at if latest else None
+        self.save(update_fields=['member_count', 'message_count', 'last_message_at'])
+        Channel.objects.refresh_last_message_preview(self.id)
 
 
 def message_file_path(instance, filename):
@@ -68,6 +177,73 @@ def message_file_path(instance, filename):
     return os.path.join('chat', str(instance.channel.id), filename)
 
 
+class MessageQuerySet(models.QuerySet):
+    """QuerySet for messages."""
+    
+    def page(self, channel_id, before_id=None, after_id=None, limit=HISTORY_PAGE_SIZE):
+        """
+        Keyset page of a channel's history ordered by ``(created_at, id)``.
+        
+        ``before_id`` returns the messages just older than that message and
+        ``after_id`` the ones just newer; with neither, the latest messages
+        are returned; giving both raises ``ValueError``. Returns
+        ``(messages, has_more)`` with messages oldest first and ``has_more``
+        telling whether the page was cut at ``limit``. Pages continue into
+        the archive (see ``archive``) where needed.
+        """
+        if before_id and after_id:
+            raise ValueError("before_id and after_id cannot be combined")
+        
+        queryset = self.filter(channel_id=channel_id)
+        cursor_id = before_id or after_id
+        cursor_key = None
+        cursor_archived = False
+        
+        if cursor_id:
+            cursor = self.filter(channel_id=channel_id, id=cursor_id).values('created_at').first()
+            if cursor is None:
+                # The cursor may have been archived already
+                from .archive import find_archived
+                archived = find_archived(channel_id, int(cursor_id))
+                if archived is None:
+                    return [], False
+                cursor = {'created_at': archived.created_at}
+                cursor_archived = True
+            created_at = cursor['created_at']
+            cursor_key = (created_at, int(cursor_id))
+            if before_id:
+                queryset = queryset.filter(
+                    models.Q(created_at__lt=created_at) |
+                    models.Q(created_at=created_at, id__lt=cursor_id)
+                )
+            else:
+                queryset = queryset.filter(
+                    models.Q(created_at__gt=created_at) |
+                    models.Q(created_at=created_at, id__gt=cursor_id)
+                )
+        
+        # Archived messages are all older than the live ones of the channel,
+        # so they come before the live table going forward and after it
+        # going back
+        from .archive import archived_page
+        
+        if after_id:
+            messages = []
+            if cursor_archived:
+                messages = archived_page(channel_id, after=cursor_key, limit=limit + 1)
+            if len(messages) <= limit:
+                messages += list(queryset.order_by('created_at', 'id')[:limit + 1 - len(messages)])
+            has_more = len(messages) > limit
+            return messages[:limit], has_more
+        
+        messages = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+        if len(messages) <= limit:
+            oldest = (messages[-1].created_at, messages[-1].id) if messages else cursor_key
+            messages += archived_page(channel_id, before=oldest, limit=limit + 1 - len(messages))
+        has_more = len(messages) > limit
+        return messages[:limit][::-1], has_more
+
+
 class Message(models.Model):
     """Model for chat messages."""
     FILE_TYPE_CHOICES = [
@@ -99,7 +275,7 @@ class Message(models.Model):
         null=True,
         validators=[
             FileExtensionValidator(
-                allowed_extensions=['png', 'jpg', 'jpeg', 'gif', 'pdf', 'docx', 'xlsx', 'doc', 'xls']
+                allowed_extensions=ALLOWED_FILE_EXTENSIONS
             ),
             validate_file_size
         ],
@@ -130,6 +306,8 @@ class Message(models.Model):
         verbose_name='Eliminado'
     )
     
+    objects = MessageQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Mensaje'
         verbose_name_plural = 'Mensajes'
@@ -146,7 +324,7 @@ class Message(models.Model):
         # Determine file type based on extension
         if self.file and not self.file_type:
             ext = self.file.name.split('.')[-1].lower()
-            if ext in ['png', 'jpg', 'jpeg', 'gif']:
+            if ext in IMAGE_EXTENSIONS:
                 self.file_type = 'image'
             else:
                 self.file_type = 'document'
@@ -155,14 +333,62 @@ class Message(models.Model):
         if self.file and not self.file_name:
             self.file_name = os.path.basename(self.file.name)
         
+        is_new = self._state.adding
         super().save(*args, **kwargs)
+        
+        # Keep the full-text index in sync (deleted messages are dropped)
+        search_backend = get_search_backend()
+        if search_backend:
+            search_backend.index(self)
+        
+        if is_new:
+            Channel.objects.record_new_messages(self.channel_id, [self])
+        elif not self.is_deleted:
+            # Edits of the latest message change the channel preview;
+            # soft_delete picks the previous message instead
+            Channel.objects.filter(
+                id=self.channel_id,
+                last_message_at=self.created_at
+            ).update(last_message_preview=self.get_preview())
+        
+        if is_new and not self.is_deleted:
+            # Everyone else in the channel has one more unread message
+            ChannelMembership.objects.filter(
+                channel_id=self.channel_id
+            ).exclude(user_id=self.user_id).update(
+                unread_count=models.F('unread_count') + 1
+            )
     
     def soft_delete(self):
         """Soft delete the message."""
+        was_deleted = self.is_deleted
         self.is_deleted = True
         self.content = "[Mensaje eliminado]"
         self.file = None
         self.save()
+        
+        if not was_deleted:
+            Channel.objects.filter(
+                id=self.channel_id,
+                message_count__gt=0
+            ).update(message_count=models.F('message_count') - 1)
+            Channel.objects.refresh_last_message_preview(self.channel_id)
+            
+            # Members who had not read it yet lose one unread message
+            ChannelMembership.objects.filter(
+                channel_id=self.channel_id,
+                last_read_at__lt=self.created_at,
+                unread_count__gt=0
+            ).exclude(user_id=self.user_id).update(
+                unread_count=models.F('unread_count') - 1
+            )
+    
+    def get_preview(self):
+        """Plain-text excerpt shown in channel lists."""
+        text = ' '.join(strip_tags(self.content).split())
+        if not text and self.file_name:
+            text = self.file_name
+        return Truncator(text).chars(PREVIEW_LENGTH)
     
     def get_file_url(self):
         """Get the full URL for the file."""
@@ -171,6 +397,21 @@ class Message(models.Model):
         return None
 
 
+class ChannelMembershipQuerySet(models.QuerySet):
+    """QuerySet for channel memberships."""
+    
+    def recount_unread(self):
+        """Recompute ``unread_count`` from the messages after ``last_read_at``."""
+        unread = Message.objects.filter(
+            channel=models.OuterRef('channel'),
+            created_at__gt=models.OuterRef('last_read_at'),
+            is_deleted=False
+        ).exclude(user=models.OuterRef('user')).order_by().values('channel').annotate(
+            total=models.Count('id')
+        ).values('total')
+        return self.update(unread_count=Coalesce(models.Subquery(unread), 0))
+
+
 class ChannelMembership(models.Model):
     """Track user membership and read status in channels."""
     user = models.ForeignKey(
@@ -193,6 +434,18 @@ class ChannelMembership(models.Model):
         auto_now_add=True,
         verbose_name='Fecha de unión'
     )
+    unread_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Mensajes sin leer',
+        help_text='Contador mantenido al crear y eliminar mensajes'
+    )
+    has_posted = models.BooleanField(
+        default=False,
+        verbose_name='Ha escrito',
+        help_text='Cuenta en los miembros del canal, aunque sus mensajes se hayan archivado'
+    )
+    
+    objects = ChannelMembershipQuerySet.as_manager()
     
     class Meta:
         verbose_name = 'Membresía de canal'
@@ -203,7 +456,14 @@ class ChannelMembership(models.Model):
         return f"{self.user.get_full_name()} - {self.channel.name}"
     
     def get_unread_count(self):
-        """Get count of unread messages."""
+        """Get count of unread messages, including reads not written yet."""
+        from .receipts import read_receipts
+        return read_receipts.unread_count(
+            self.user_id, self.channel_id, self.unread_count, self.channel.last_message_at
+        )
+    
+    def count_unread_messages(self):
+        """Count unread messages from the message table (used for repairs)."""
         return self.channel.messages.filter(
             created_at__gt=self.last_read_at,
             is_deleted=False
@@ -212,4 +472,47 @@ class ChannelMembership(models.Model):
     def mark_as_read(self):
         """Mark channel as read up to now."""
         self.last_read_at = timezone.now()
-        self.save(update_fields=['last_read_at'])
\ No newline at end of file
+        self.unread_count = 0
+        self.save(update_fields=['last_read_at', 'unread_count'])
+
+
+class ArchiveSegment(models.Model):
+    """Compressed NDJSON file holding a channel's archived messages for one month."""
+    channel = models.ForeignKey(
+        Channel,
+        on_delete=models.CASCADE,
+        related_name='archive_segments',
+        verbose_name='Canal'
+    )
+    month = models.DateField(
+        verbose_name='Mes'
+    )
+    path = models.CharField(
+        max_length=255,
+        verbose_name='Ruta del segmento'
+    )
+    message_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Mensajes'
+    )
+    first_message_id = models.BigIntegerField(
+        verbose_name='Primer mensaje'
+    )
+    last_message_id = models.BigIntegerField(
+        verbose_name='Último mensaje'
+    )
+    first_created_at = models.DateTimeField(
+        verbose_name='Fecha del primer mensaje'
+    )
+    last_created_at = models.DateTimeField(
+        verbose_name='Fecha del último mensaje'
+    )
+    
+    class Meta:
+        verbose_name = 'Segmento de archivo'
+        verbose_name_plural = 'Segmentos de archivo'
+        unique_together = ['channel', 'month']
+        ordering = ['channel', 'month']
+    
+    def __str__(self):
+        return f"{self.channel.name} - {self.month:%Y-%m}"
\ No newline at end of file
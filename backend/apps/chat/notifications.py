@@ -0,0 +1,81 @@
+"""
+Unread counters for channels a socket is not subscribed to.
+
+Sockets only join the groups of the channels they are viewing. Every
+other channel is tracked through the per-user group ``user_<id>``, which
+receives ``unread_counts`` events carrying counters only. New messages
+mark their channel as dirty; a periodic flush reads the stored counters
+of online users for all dirty channels in one query and sends each user a
+single event.
+"""
+import asyncio
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .db import db_executor_async
+from .events import encode_event
+from .models import ChannelMembership
+from .presence import presence
+from .receipts import read_receipts
+
+NOTIFY_INTERVAL = getattr(settings, 'CHAT_UNREAD_NOTIFY_INTERVAL', 1.0)
+
+
+def user_group(user_id):
+    """Name of the per-user notification group."""
+    return f"user_{user_id}"
+
+
+class UnreadNotifier:
+    """Coalesce unread counter updates into one event per user and interval."""
+
+    def __init__(self, interval=NOTIFY_INTERVAL):
+        self.interval = interval
+        self._dirty = set()
+        self._task = None
+
+    def channel_changed(self, channel_id):
+        """Schedule an update of the channel's counters."""
+        self._dirty.add(channel_id)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while self._dirty:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    @db_executor_async
+    def get_counts(self, channel_ids, user_ids):
+        counts = {}
+        memberships = ChannelMembership.objects.filter(
+            channel_id__in=channel_ids,
+            user_id__in=user_ids
+        ).values_list('user_id', 'channel_id', 'unread_count', 'channel__last_message_at')
+        unread_counts = read_receipts.unread_counts(memberships)
+        for (user_id, channel_id), unread_count in unread_counts.items():
+            counts.setdefault(user_id, {})[channel_id] = unread_count
+        return counts
+
+    async def flush(self):
+        """Send the current counters of dirty channels to online users."""
+        dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+
+        online_user_ids = await presence.online_user_ids()
+        if not online_user_ids:
+            return
+
+        counts = await self.get_counts(dirty, online_user_ids)
+        channel_layer = get_channel_layer()
+        for user_id, user_counts in counts.items():
+            await channel_layer.group_send(
+                user_group(user_id),
+                encode_event({
+                    "type": "unread_counts",
+                    "counts": user_counts
+                })
+            )
+
+
+unread_notifier = UnreadNotifier()
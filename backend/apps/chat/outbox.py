@@ -0,0 +1,144 @@
+"""Bounded outbound queue per WebSocket connection, written out by its own task."""
+import asyncio
+import time
+from collections import deque
+from django.conf import settings
+from .metrics import metrics
+from .presence import PRESENCE_TTL
+from .protocol import JSON
+from .store import get_store
+
+QUEUE_SIZE = getattr(settings, 'CHAT_OUTBOX_SIZE', 256)
+BATCH_WINDOW = getattr(settings, 'CHAT_BATCH_WINDOW', 0.02)
+LAG_KEY = 'outbox:lag'
+LAG_EXPIRES_KEY = 'outbox:lag:expires'
+
+
+class OutboxOverflow(Exception):
+    """The queue is full of frames that cannot be dropped."""
+    pass
+
+
+class Outbox:
+    """Queue of encoded frames drained by its own writer task."""
+
+    def __init__(self, send, max_size=QUEUE_SIZE, batch_window=None, protocol=JSON):
+        self._send = send
+        self.max_size = max_size
+        # Seconds to gather frames into one array frame; None sends them one by one
+        self.batch_window = batch_window
+        self.protocol = protocol
+        # (enqueued_at, frame, droppable) in send order
+        self._frames = deque()
+        self._ready = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self.sent = 0
+        self.dropped = 0
+        self.max_lag = 0.0
+        self._task = asyncio.ensure_future(self._run())
+
+    @property
+    def depth(self):
+        return len(self._frames)
+
+    def put(self, frame, droppable=False):
+        """Queue a frame; raises OutboxOverflow when it cannot fit."""
+        metrics.observe("outbox.depth", len(self._frames))
+        if len(self._frames) >= self.max_size:
+            if droppable:
+                self.dropped += 1
+                metrics.incr("outbox.dropped")
+                return
+            if not self._evict_droppable():
+                raise OutboxOverflow()
+        self._frames.append((time.monotonic(), frame, droppable))
+        self._drained.clear()
+        self._ready.set()
+
+    def _evict_droppable(self):
+        for index, (_, _, droppable) in enumerate(self._frames):
+            if droppable:
+                del self._frames[index]
+                self.dropped += 1
+                metrics.incr("outbox.dropped")
+                return True
+        return False
+
+    def reset(self, frame):
+        """Discard everything queued and send ``frame`` next."""
+        self.dropped += len(self._frames)
+        self._frames.clear()
+        self._frames.append((time.monotonic(), frame, False))
+        self._drained.clear()
+        self._ready.set()
+
+    async def drain(self, timeout=None):
+        """Wait until every queued frame has been written."""
+        await asyncio.wait_for(self._drained.wait(), timeout)
+
+    async def _run(self):
+        while True:
+            if not self._frames:
+                self._ready.clear()
+                self._drained.set()
+                await self._ready.wait()
+                continue
+            if self.batch_window is not None:
+                await self._send_batch()
+                continue
+            enqueued_at, frame, _ = self._frames.popleft()
+            await self._send(frame)
+            self.sent += 1
+            self.max_lag = max(self.max_lag, time.monotonic() - enqueued_at)
+
+    async def _send_batch(self):
+        if self.batch_window:
+            await asyncio.sleep(self.batch_window)
+        frames = list(self._frames)
+        self._frames.clear()
+        if not frames:
+            return
+        metrics.observe("outbox.batch_size", len(frames))
+        if len(frames) == 1:
+            await self._send(frames[0][1])
+        else:
+            await self._send(self.protocol.join([frame for _, frame, _ in frames]))
+        self.sent += len(frames)
+        self.max_lag = max(self.max_lag, time.monotonic() - frames[0][0])
+
+    def close(self):
+        """Stop the writer task; queued frames are discarded."""
+        self._task.cancel()
+
+    def stats(self, reset=False):
+        """Counters of this connection; ``reset`` starts a new lag window."""
+        stats = {
+            "depth": len(self._frames),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+        }
+        if reset:
+            self.max_lag = 0.0
+        return stats
+
+
+async def publish_lag(connection_id, outbox):
+    """Record the connection's worst lag since the last call."""
+    store = get_store()
+    now = time.time()
+    await store.zadd(LAG_KEY, {connection_id: outbox.stats(reset=True)["max_lag_ms"]})
+    await store.zadd(LAG_EXPIRES_KEY, {connection_id: now + PRESENCE_TTL})
+
+    # Drop the entries of connections that stopped publishing
+    expired = await store.zrangebyscore(LAG_EXPIRES_KEY, '-inf', now)
+    if expired:
+        await store.zrem(LAG_KEY, *expired)
+        await store.zremrangebyscore(LAG_EXPIRES_KEY, '-inf', now)
+
+
+async def forget_lag(connection_id):
+    store = get_store()
+    await store.zrem(LAG_KEY, connection_id)
+    await store.zrem(LAG_EXPIRES_KEY, connection_id)
@@ -0,0 +1,182 @@
+"""
+Presence registry for the chat.
+
+Every WebSocket connection registers itself with a heartbeat deadline.
+The registry keeps three sorted-set indexes in the chat store, scored by
+expiry time, so "who is online" never needs a scan:
+
+- ``presence:conns:<user_id>``: live connections of a user.
+- ``presence:users``: users with at least one live connection.
+- ``presence:channel:<channel_id>``: online users of a channel.
+- ``presence:subs:<user_id>:<channel_id>``: connections of a user
+  subscribed to a channel, so the user leaves the channel index only when
+  the last of them unsubscribes.
+
+Entries that miss their heartbeat simply expire; they are pruned lazily
+whenever an index is read.
+
+Users coming online or going offline are not announced one by one: the
+broadcaster collects them and sends the ``online_users`` group one
+``presence_diff`` per ``BROADCAST_INTERVAL`` with the ids that ``joined``
+and ``left``. A user who disconnects and reconnects within the same
+interval (or the other way round) appears in neither.
+"""
+import asyncio
+import time
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .events import encode_event
+from .store import get_store, get_sync_store
+
+PRESENCE_TTL = getattr(settings, 'CHAT_PRESENCE_TTL', 60)
+HEARTBEAT_INTERVAL = getattr(settings, 'CHAT_PRESENCE_HEARTBEAT_INTERVAL', 20)
+BROADCAST_INTERVAL = getattr(settings, 'CHAT_PRESENCE_BROADCAST_INTERVAL', 1.0)
+
+USERS_KEY = 'presence:users'
+
+
+def _conns_key(user_id):
+    return f"presence:conns:{user_id}"
+
+
+def _channel_key(channel_id):
+    return f"presence:channel:{channel_id}"
+
+
+def _subs_key(user_id, channel_id):
+    return f"presence:subs:{user_id}:{channel_id}"
+
+
+class PresenceRegistry:
+    """Track online users per connection, with heartbeats and expiry."""
+
+    def __init__(self, store=None, ttl=PRESENCE_TTL):
+        self._store = store
+        self.ttl = ttl
+
+    @property
+    def store(self):
+        return self._store or get_store()
+
+    async def _touch(self, user_id, connection_id, channel_ids):
+        """Extend every index entry of a connection; returns the users added."""
+        expires = time.time() + self.ttl
+        await self.store.zadd(_conns_key(user_id), {connection_id: expires})
+        added = await self.store.zadd(USERS_KEY, {user_id: expires})
+        for channel_id in channel_ids:
+            await self._subscribe(user_id, channel_id, connection_id, expires)
+        return added
+
+    async def _subscribe(self, user_id, channel_id, connection_id, expires):
+        await self.store.zadd(_subs_key(user_id, channel_id), {connection_id: expires})
+        await self.store.zadd(_channel_key(channel_id), {user_id: expires})
+
+    async def connect(self, user_id, connection_id, channel_ids=()):
+        """Register a connection. Returns True if the user just came online."""
+        # Expired users are dropped first, so that adding the user back is
+        # what tells, in one step, whether they were offline
+        await self.store.zremrangebyscore(USERS_KEY, '-inf', time.time())
+        return bool(await self._touch(user_id, connection_id, channel_ids))
+
+    async def heartbeat(self, user_id, connection_id, channel_ids=()):
+        """Extend the deadline of a live connection."""
+        await self._touch(user_id, connection_id, channel_ids)
+
+    async def disconnect(self, user_id, connection_id, channel_ids=()):
+        """Remove a connection. Returns True if the user went offline."""
+        for channel_id in channel_ids:
+            await self.leave_channel(user_id, channel_id, connection_id)
+        key = _conns_key(user_id)
+        await self.store.zrem(key, connection_id)
+        await self.store.zremrangebyscore(key, '-inf', time.time())
+        if await self.store.zcard(key):
+            return False
+        await self.store.zrem(USERS_KEY, user_id)
+        return True
+
+    async def join_channel(self, user_id, channel_id, connection_id):
+        """Add a connection of an online user to a channel index."""
+        await self._subscribe(user_id, channel_id, connection_id, time.time() + self.ttl)
+
+    async def leave_channel(self, user_id, channel_id, connection_id):
+        """
+        Remove a connection from a channel index.
+
+        The user stays in the index while another of their connections is
+        subscribed to the channel. Returns True if the user left it.
+        """
+        key = _subs_key(user_id, channel_id)
+        await self.store.zrem(key, connection_id)
+        await self.store.zremrangebyscore(key, '-inf', time.time())
+        if await self.store.zcard(key):
+            return False
+        await self.store.zrem(_channel_key(channel_id), user_id)
+        return True
+
+    async def is_online(self, user_id):
+        score = await self.store.zscore(USERS_KEY, user_id)
+        return score is not None and float(score) > time.time()
+
+    async def online_user_ids(self, channel_id=None):
+        """Ids of online users, globally or for one channel."""
+        key = USERS_KEY if channel_id is None else _channel_key(channel_id)
+        current = time.time()
+        await self.store.zremrangebyscore(key, '-inf', current)
+        members = await self.store.zrangebyscore(key, current, '+inf')
+        return [int(member) for member in members]
+
+    def online_user_ids_sync(self, channel_id=None):
+        """Synchronous variant for views and model methods."""
+        store = get_sync_store(self._store)
+        key = USERS_KEY if channel_id is None else _channel_key(channel_id)
+        current = time.time()
+        store.zremrangebyscore(key, '-inf', current)
+        return [int(member) for member in store.zrangebyscore(key, current, '+inf')]
+
+
+class PresenceBroadcaster:
+    """Collect presence changes and broadcast them as periodic diffs."""
+
+    def __init__(self, interval=BROADCAST_INTERVAL):
+        self.interval = interval
+        # user_id -> (online at the start of the interval, online now)
+        self._changes = {}
+        self._task = None
+
+    def joined(self, user_id):
+        self._record(user_id, True)
+
+    def left(self, user_id):
+        self._record(user_id, False)
+
+    def _record(self, user_id, online):
+        was_online, _ = self._changes.get(user_id, (not online, None))
+        self._changes[user_id] = (was_online, online)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while self._changes:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        """Send the changes collected so far, leaving out flapping users."""
+        changes, self._changes = self._changes, {}
+        joined = [user_id for user_id, (before, now) in changes.items() if now and not before]
+        left = [user_id for user_id, (before, now) in changes.items() if before and not now]
+        if not joined and not left:
+            return
+
+        await get_channel_layer().group_send(
+            "online_users",
+            encode_event({
+                "type": "presence_diff",
+                "joined": joined,
+                "left": left
+            }, user_ids=joined)
+        )
+
+
+presence = PresenceRegistry()
+presence_broadcaster = PresenceBroadcaster()
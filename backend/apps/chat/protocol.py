@@ -0,0 +1,73 @@
+"""
+Encodings of the frames the chat server sends, chosen by the first supported
+WebSocket subprotocol the client offers: ``msgpack``, or ``json`` by default.
+"""
+import json
+import msgpack
+from django.conf import settings
+
+MSGPACK_ENABLED = getattr(settings, 'CHAT_MSGPACK_ENABLED', True)
+
+_packer = msgpack.Packer()
+
+
+class JSONProtocol:
+    """JSON text frames."""
+
+    name = 'json'
+    binary = False
+
+    def __init__(self):
+        # Sockets of this process using the protocol
+        self.sockets = 0
+
+    def encode(self, payload):
+        return json.dumps(payload)
+
+    def event_frame(self, event):
+        return event["text"]
+
+    def join(self, frames):
+        """One array frame out of several encoded frames."""
+        return "[" + ",".join(frames) + "]"
+
+
+class MsgpackProtocol:
+    """Binary MessagePack frames."""
+
+    name = 'msgpack'
+    binary = True
+
+    def __init__(self):
+        # Sockets of this process using the protocol
+        self.sockets = 0
+
+    def encode(self, payload):
+        return msgpack.packb(payload)
+
+    def event_frame(self, event):
+        packed = event.get("packed")
+        if packed is None:
+            # Sent by a process without MessagePack sockets
+            packed = event["packed"] = msgpack.packb(json.loads(event["text"]))
+        return packed
+
+    def join(self, frames):
+        """One array frame out of several encoded frames."""
+        return _packer.pack_array_header(len(frames)) + b"".join(frames)
+
+
+JSON = JSONProtocol()
+MSGPACK = MsgpackProtocol()
+
+PROTOCOLS = {protocol.name: protocol for protocol in [JSON, MSGPACK]}
+if not MSGPACK_ENABLED:
+    del PROTOCOLS[MSGPACK.name]
+
+
+def negotiate(subprotocols):
+    """The first supported subprotocol offered by the client, or None."""
+    for name in subprotocols:
+        if name in PROTOCOLS:
+            return PROTOCOLS[name]
+    return None
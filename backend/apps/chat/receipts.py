@@ -0,0 +1,190 @@
+"""
+Write-behind buffer for chat read receipts.
+
+Marking a channel as read is the most frequent write of the chat, so it
+no longer touches the database directly. The latest read time per
+(user, channel) is kept in memory, only ever moving forward, and a
+background thread writes every pending receipt each ``FLUSH_INTERVAL``
+seconds: one UPDATE sets ``last_read_at`` on all of them and a second one
+recounts their unread messages.
+
+Until a receipt is written, ``unread_counts`` merges it into what was read
+from the database, so counters stay correct in the meantime: a receipt
+that is newer than the channel's latest message leaves nothing unread,
+and the rest are recounted together in one query. Receipts are held per
+process; other processes see them after the next flush.
+"""
+import atexit
+import logging
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, models, transaction
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import Channel, Message, ChannelMembership
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+FLUSH_INTERVAL = getattr(settings, 'CHAT_READ_FLUSH_INTERVAL', 2.0)
+# Receipts per UPDATE statement
+FLUSH_BATCH_SIZE = 500
+# Pending receipts recounted per query by unread_counts
+RECOUNT_BATCH_SIZE = 100
+
+
+def write_receipts(receipts):
+    """Persist ``{(user_id, channel_id): read_at}``; read times never go back."""
+    user_ids = {user_id for user_id, _ in receipts}
+    channel_ids = {channel_id for _, channel_id in receipts}
+    existing_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    existing_channels = set(Channel.objects.filter(id__in=channel_ids).values_list('id', flat=True))
+    items = [
+        (user_id, channel_id, read_at)
+        for (user_id, channel_id), read_at in receipts.items()
+        if user_id in existing_users and channel_id in existing_channels
+    ]
+
+    for start in range(0, len(items), FLUSH_BATCH_SIZE):
+        batch = items[start:start + FLUSH_BATCH_SIZE]
+        pairs = models.Q()
+        for user_id, channel_id, _ in batch:
+            pairs |= models.Q(user_id=user_id, channel_id=channel_id)
+
+        with transaction.atomic():
+            ChannelMembership.objects.bulk_create(
+                [
+                    ChannelMembership(user_id=user_id, channel_id=channel_id, last_read_at=read_at)
+                    for user_id, channel_id, read_at in batch
+                ],
+                ignore_conflicts=True
+            )
+            memberships = ChannelMembership.objects.filter(pairs)
+            memberships.update(last_read_at=Greatest(
+                'last_read_at',
+                models.Case(
+                    *[
+                        models.When(user_id=user_id, channel_id=channel_id, then=models.Value(read_at))
+                        for user_id, channel_id, read_at in batch
+                    ],
+                    output_field=models.DateTimeField()
+                )
+            ))
+            memberships.recount_unread()
+
+
+class ReadReceiptBuffer:
+    """Latest read time per (user, channel), written in the background."""
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self._pending = {}
+        # Receipts being written, still visible to readers
+        self._flushing = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def mark(self, user_id, channel_id, read_at=None):
+        """Record that the user has read the channel up to ``read_at``."""
+        key = (user_id, int(channel_id))
+        read_at = read_at or timezone.now()
+        with self._lock:
+            if key not in self._pending or self._pending[key] < read_at:
+                self._pending[key] = read_at
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='chat-read-receipts', daemon=True
+                )
+                self._thread.start()
+
+    def read_at(self, user_id, channel_id):
+        """Pending read time of the channel, or None."""
+        key = (user_id, int(channel_id))
+        with self._lock:
+            times = [t for t in (self._pending.get(key), self._flushing.get(key)) if t]
+        return max(times) if times else None
+
+    def unread_count(self, user_id, channel_id, stored, last_message_at):
+        """Unread counter merged with a pending receipt; see ``unread_counts``."""
+        counts = self.unread_counts([(user_id, channel_id, stored, last_message_at)])
+        return counts[(user_id, int(channel_id))]
+
+    def unread_counts(self, rows):
+        """
+        Unread counters of ``(user_id, channel_id, stored, last_message_at)``
+        rows, keyed by ``(user_id, channel_id)``.
+
+        Rows without a pending receipt keep their ``stored`` counter. A
+        pending receipt at or after the channel's latest message means
+        nothing is unread; the others are recounted in one query.
+        """
+        counts = {}
+        stale = []
+        for user_id, channel_id, stored, last_message_at in rows:
+            key = (user_id, int(channel_id))
+            read_at = self.read_at(user_id, channel_id)
+            if read_at is None:
+                counts[key] = stored
+            elif last_message_at is None or read_at >= last_message_at:
+                counts[key] = 0
+            else:
+                stale.append((key, read_at))
+
+        for start in range(0, len(stale), RECOUNT_BATCH_SIZE):
+            batch = stale[start:start + RECOUNT_BATCH_SIZE]
+            recounts = Message.objects.filter(
+                channel_id__in={channel_id for (_, channel_id), _ in batch},
+                is_deleted=False
+            ).aggregate(**{
+                f"unread_{index}": models.Count('id', filter=(
+                    models.Q(channel_id=channel_id, created_at__gt=read_at) &
+                    ~models.Q(user_id=user_id)
+                ))
+                for index, ((user_id, channel_id), read_at) in enumerate(batch)
+            })
+            for index, (key, _) in enumerate(batch):
+                counts[key] = recounts[f"unread_{index}"]
+        return counts
+
+    def flush(self):
+        """Write every pending receipt."""
+        with self._lock:
+            receipts, self._pending = self._pending, {}
+            self._flushing = receipts
+        if not receipts:
+            return
+
+        try:
+            write_receipts(receipts)
+        except Exception:
+            # Keep them for the next attempt
+            with self._lock:
+                for key, read_at in receipts.items():
+                    if key not in self._pending or self._pending[key] < read_at:
+                        self._pending[key] = read_at
+            raise
+        finally:
+            with self._lock:
+                self._flushing = {}
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not write chat read receipts")
+            finally:
+                close_old_connections()
+
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+
+
+read_receipts = ReadReceiptBuffer()
+atexit.register(read_receipts.flush)
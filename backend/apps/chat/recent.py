@@ -0,0 +1,129 @@
+"""Cache of the latest messages of each channel, already serialized."""
+import json
+from .models import Message, HISTORY_PAGE_SIZE
+from .serializers import CompactMessageSerializer
+from .store import get_store, get_sync_store
+
+# One more than a page, to tell whether older history exists
+CACHE_SIZE = HISTORY_PAGE_SIZE + 1
+
+
+def _list_key(channel_id):
+    return f"recent:messages:{channel_id}"
+
+
+def _seq_key(channel_id):
+    return f"recent:seq:{channel_id}"
+
+
+def _entry(message):
+    return json.dumps({
+        "key": [message.created_at.timestamp(), message.id],
+        "message": CompactMessageSerializer(message).data
+    })
+
+
+def _replaced(raw_entries, message_id, entry):
+    """Cached entries of a message that differ from its new ``entry``."""
+    return [
+        raw for raw in raw_entries
+        if raw != entry and json.loads(raw)["message"]["id"] == message_id
+    ]
+
+
+def _parsed(raw_entries):
+    """Cached entries oldest first, without duplicates."""
+    # Concurrent fills and appends can leave duplicates, and a
+    # replacement briefly keeps the old entry after the new one
+    entries = {}
+    for raw in raw_entries:
+        entry = json.loads(raw)
+        entries.setdefault(entry["message"]["id"], entry)
+    return sorted(entries.values(), key=lambda entry: entry["key"])
+
+
+class RecentMessagesCache:
+    """Bounded list of serialized recent messages per channel."""
+
+    def __init__(self, store=None, size=CACHE_SIZE):
+        self._store = store
+        self.size = size
+
+    @property
+    def store(self):
+        return self._store or get_store()
+
+    @property
+    def sync_store(self):
+        return get_sync_store(self._store)
+
+    async def append(self, message):
+        """Push a new message onto its channel's list, if the list is cached."""
+        await self.store.incr(_seq_key(message.channel_id))
+        key = _list_key(message.channel_id)
+        if await self.store.lpushx(key, _entry(message)):
+            # One spare entry for a replacement in progress (see ``update``)
+            await self.store.ltrim(key, 0, self.size)
+
+    def append_sync(self, message):
+        """Synchronous variant of ``append``."""
+        self.sync_store.incr(_seq_key(message.channel_id))
+        key = _list_key(message.channel_id)
+        if self.sync_store.lpushx(key, _entry(message)):
+            self.sync_store.ltrim(key, 0, self.size)
+
+    async def update(self, message):
+        """Replace the entry of an edited or deleted message, if it is cached."""
+        await self.store.incr(_seq_key(message.channel_id))
+        key = _list_key(message.channel_id)
+        entry = _entry(message)
+        # Inserted next to the old entry, so appends from other workers cannot shift it
+        for raw in _replaced(await self.store.lrange(key, 0, -1), message.id, entry):
+            if await self.store.linsert(key, 'BEFORE', raw, entry) > 0:
+                await self.store.lrem(key, 1, raw)
+
+    def update_sync(self, message):
+        """Synchronous variant of ``update``."""
+        self.sync_store.incr(_seq_key(message.channel_id))
+        key = _list_key(message.channel_id)
+        entry = _entry(message)
+        for raw in _replaced(self.sync_store.lrange(key, 0, -1), message.id, entry):
+            if self.sync_store.linsert(key, 'BEFORE', raw, entry) > 0:
+                self.sync_store.lrem(key, 1, raw)
+
+    def latest(self, channel_id, limit=HISTORY_PAGE_SIZE, request=None):
+        """
+        Latest ``limit`` messages of a channel as REST payloads, oldest
+        first, and whether older ones exist. Fills the cache on a miss.
+        """
+        store = self.sync_store
+        key = _list_key(channel_id)
+        entries = _parsed(store.lrange(key, 0, -1))
+        if not entries:
+            seq = store.get(_seq_key(channel_id))
+            messages, _ = Message.objects.page(channel_id, limit=self.size)
+            raw_entries = [_entry(message) for message in reversed(messages)]
+            store.delete(key)
+            if raw_entries:
+                store.rpush(key, *raw_entries)
+            # A fill that overlapped a change is dropped rather than kept
+            if store.get(_seq_key(channel_id)) != seq:
+                store.delete(key)
+            entries = [json.loads(raw) for raw in reversed(raw_entries)]
+
+        page = [entry["message"] for entry in entries[-limit:]]
+        if request:
+            page = [absolute_file_urls(payload, request) for payload in page]
+        return page, len(entries) > limit
+
+
+def absolute_file_urls(payload, request):
+    """Cached payloads hold relative file URLs, as serialized without a request."""
+    payload = dict(payload)
+    for field in ("file", "file_url"):
+        if payload[field]:
+            payload[field] = request.build_absolute_uri(payload[field])
+    return payload
+
+
+recent_messages = RecentMessagesCache()
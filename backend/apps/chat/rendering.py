@@ -0,0 +1,152 @@
+"""Markdown rendering for chat messages, in a bounded worker pool with an LRU cache."""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import bleach
+import markdown2
+from django.conf import settings
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_INPUT_SIZE = getattr(settings, 'CHAT_RENDER_MAX_INPUT_SIZE', 20000)
+RENDER_TIMEOUT = getattr(settings, 'CHAT_RENDER_TIMEOUT', 2.0)
+RENDER_WORKERS = getattr(settings, 'CHAT_RENDER_WORKERS', 2)
+RENDER_EXECUTOR = getattr(settings, 'CHAT_RENDER_EXECUTOR', 'thread')
+CACHE_SIZE = getattr(settings, 'CHAT_RENDER_CACHE_SIZE', 1024)
+
+ALLOWED_TAGS = [
+    'p', 'br', 'strong', 'em', 'u', 's', 'code', 'pre',
+    'blockquote', 'ul', 'ol', 'li', 'a', 'img', 'table',
+    'thead', 'tbody', 'tr', 'th', 'td', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6'
+]
+ALLOWED_ATTRIBUTES = {
+    'a': ['href', 'title'],
+    'img': ['src', 'alt', 'title'],
+    'code': ['class']
+}
+
+
+class RenderError(Exception):
+    """Raised when a message cannot be rendered."""
+
+
+def render_markdown_sync(content):
+    """Convert markdown to sanitized HTML."""
+    html_content = markdown2.markdown(
+        content,
+        extras=['fenced-code-blocks', 'tables', 'break-on-newline']
+    )
+    return bleach.clean(
+        html_content,
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        strip=True
+    )
+
+
+class RenderCache:
+    """Thread-safe LRU cache of rendered HTML keyed by content hash."""
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(content):
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            html = self._items.get(key)
+            if html is not None:
+                self._items.move_to_end(key)
+            return html
+
+    def set(self, key, html):
+        with self._lock:
+            self._items[key] = html
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+cache = RenderCache()
+_executor = None
+_slots = {}
+
+
+def get_executor():
+    """Return the shared render pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        if RENDER_EXECUTOR == 'process':
+            _executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=RENDER_WORKERS,
+                thread_name_prefix='chat-render'
+            )
+    return _executor
+
+
+def get_slots():
+    """Semaphore of free render workers on this loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _slots:
+        _slots[loop] = asyncio.Semaphore(RENDER_WORKERS)
+    return _slots[loop]
+
+
+def _release(loop, slots):
+    if not loop.is_closed():
+        loop.call_soon_threadsafe(slots.release)
+
+
+async def render_markdown(content):
+    """Render a message in the worker pool, using the cache when possible."""
+    if len(content) > MAX_INPUT_SIZE:
+        metrics.incr("render.rejected")
+        raise RenderError(
+            f"El mensaje no puede superar los {MAX_INPUT_SIZE} caracteres"
+        )
+
+    key = cache.key(content)
+    html = cache.get(key)
+    if html is not None:
+        metrics.incr("render.cache_hits")
+        return html
+
+    slots = get_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=RENDER_TIMEOUT)
+    except asyncio.TimeoutError:
+        metrics.incr("render.busy")
+        logger.warning("Chat markdown render pool busy (%d chars)", len(content))
+        raise RenderError("El mensaje tardó demasiado en procesarse")
+
+    # The slot is freed when the worker is done, even after a timeout
+    loop = asyncio.get_running_loop()
+    future = get_executor().submit(render_markdown_sync, content)
+    future.add_done_callback(lambda _: _release(loop, slots))
+
+    started = time.monotonic()
+    try:
+        html = await asyncio.wait_for(asyncio.wrap_future(future), timeout=RENDER_TIMEOUT)
+    except asyncio.TimeoutError:
+        metrics.incr("render.timeouts")
+        logger.warning("Chat markdown render timed out (%d chars)", len(content))
+        raise RenderError("El mensaje tardó demasiado en procesarse")
+
+    metrics.observe_latency("render.latency", time.monotonic() - started)
+    cache.set(key, html)
+    return html
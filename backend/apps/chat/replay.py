@@ -0,0 +1,63 @@
+"""Per-channel buffer of recent events, replayed to clients that reconnect."""
+import asyncio
+import json
+from django.conf import settings
+from .store import get_store
+
+BUFFER_SIZE = getattr(settings, 'CHAT_REPLAY_BUFFER_SIZE', 200)
+DB_FALLBACK_CONCURRENCY = getattr(settings, 'CHAT_REPLAY_DB_CONCURRENCY', 4)
+
+
+def _buffer_key(channel_id):
+    return f"replay:buffer:{channel_id}"
+
+
+class ReplayBuffer:
+    """Bounded log of recent events per channel."""
+
+    def __init__(self, store=None, size=BUFFER_SIZE):
+        self._store = store
+        self.size = size
+        self._db_semaphores = {}
+
+    @property
+    def store(self):
+        return self._store or get_store()
+
+    def db_semaphore(self):
+        """Semaphore limiting concurrent database fallbacks on this loop."""
+        loop = asyncio.get_running_loop()
+        if loop not in self._db_semaphores:
+            self._db_semaphores[loop] = asyncio.Semaphore(DB_FALLBACK_CONCURRENCY)
+        return self._db_semaphores[loop]
+
+    async def append(self, channel_id, event):
+        """Record an event broadcast to a channel."""
+        entry = {"event": event}
+        if event.get("type") == "new_message":
+            entry["message_id"] = event["message"]["id"]
+        key = _buffer_key(channel_id)
+        await self.store.lpush(key, json.dumps(entry))
+        await self.store.ltrim(key, 0, self.size - 1)
+
+    async def since(self, channel_id, last_seen_message_id):
+        """
+        Events that followed ``last_seen_message_id``, oldest first.
+
+        Returns None when the buffer does not reach back to that message,
+        in which case the caller has to read the database instead.
+        """
+        raw_entries = await self.store.lrange(_buffer_key(channel_id), 0, -1)
+        entries = [json.loads(raw) for raw in reversed(raw_entries)]
+
+        start = None
+        for index, entry in enumerate(entries):
+            message_id = entry.get("message_id")
+            if message_id is not None and message_id <= last_seen_message_id:
+                start = index + 1
+        if start is None:
+            return None
+        return [entry["event"] for entry in entries[start:]]
+
+
+replay_buffer = ReplayBuffer()
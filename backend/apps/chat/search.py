@@ -0,0 +1,206 @@
+"""
+Full-text search over chat messages.
+
+SQLite keeps an FTS5 table (``chat_message_fts``) whose rowid is the
+message id; it is updated from ``Message.save`` so creates, edits and soft
+deletes stay in sync. PostgreSQL uses a GIN index on
+``to_tsvector(config, content)``, which the database maintains by itself.
+
+Results are ranked (bm25 on SQLite, ``ts_rank`` on PostgreSQL), come with
+a highlighted snippet and are paginated with an opaque ``(score, id)``
+keyset cursor. Messages whose author's first or last name contains the
+query also match, after the content matches and without a snippet.
+"""
+import re
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils.html import strip_tags
+
+FTS_TABLE = 'chat_message_fts'
+POSTGRES_CONFIG = getattr(settings, 'CHAT_SEARCH_POSTGRES_CONFIG', 'spanish')
+SEARCH_PAGE_SIZE = 50
+# Messages per statement of index_many, within SQLite's 999 parameters
+INDEX_BATCH_SIZE = 300
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    """Words of a user query, with search syntax stripped out."""
+    return TOKEN_RE.findall(query)[:10]
+
+
+def name_pattern(query):
+    """LIKE pattern matching names that contain ``query``, as icontains does."""
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def encode_cursor(score, message_id):
+    return f"{score!r}:{message_id}"
+
+
+def decode_cursor(cursor):
+    """Parse a cursor; raises ValueError when it is malformed."""
+    score, message_id = cursor.rsplit(':', 1)
+    return float(score), int(message_id)
+
+
+class SQLiteMessageSearch:
+    """FTS5-backed search for SQLite."""
+
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "content, channel_id UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+    def drop_index(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+    def index(self, message):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [message.id])
+            if not message.is_deleted:
+                cursor.execute(
+                    f"INSERT INTO {FTS_TABLE} (rowid, content, channel_id) VALUES (%s, %s, %s)",
+                    [message.id, strip_tags(message.content), message.channel_id]
+                )
+
+    def index_many(self, messages):
+        """Index messages with one DELETE and one INSERT per batch."""
+        with connection.cursor() as cursor:
+            for start in range(0, len(messages), INDEX_BATCH_SIZE):
+                batch = messages[start:start + INDEX_BATCH_SIZE]
+                cursor.execute(
+                    f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(batch))})",
+                    [message.id for message in batch]
+                )
+                rows = [message for message in batch if not message.is_deleted]
+                if rows:
+                    cursor.execute(
+                        f"INSERT INTO {FTS_TABLE} (rowid, content, channel_id) VALUES "
+                        + ", ".join(["(%s, %s, %s)"] * len(rows)),
+                        [
+                            value
+                            for message in rows
+                            for value in (message.id, strip_tags(message.content), message.channel_id)
+                        ]
+                    )
+
+    def unindex_many(self, message_ids):
+        with connection.cursor() as cursor:
+            for start in range(0, len(message_ids), 500):
+                batch = message_ids[start:start + 500]
+                cursor.execute(
+                    f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(batch))})",
+                    batch
+                )
+
+    def search(self, query, channel_id=None, after=None, limit=SEARCH_PAGE_SIZE):
+        terms = ' '.join(f'"{token}"*' for token in tokenize(query))
+        if not terms:
+            return []
+
+        channel_params = [int(channel_id)] if channel_id else []
+        pattern = name_pattern(query)
+        sql = (
+            f"SELECT f.id, f.score, f.snippet FROM ("
+            f"  SELECT rowid AS id, rank AS score, "
+            f"         snippet({FTS_TABLE}, 0, '<mark>', '</mark>', '…', 12) AS snippet"
+            f"  FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+            f"{' AND channel_id = %s' if channel_id else ''}"
+            f"  UNION ALL"
+            # Authors' names; bm25 ranks are negative, so these come last
+            f"  SELECT m.id, 0.0, NULL FROM chat_message m"
+            f"  JOIN {get_user_model()._meta.db_table} u ON u.id = m.user_id"
+            f"  WHERE (u.first_name LIKE %s ESCAPE '\\' OR u.last_name LIKE %s ESCAPE '\\')"
+            f"{' AND m.channel_id = %s' if channel_id else ''}"
+            f"    AND m.id NOT IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)"
+            f") f "
+            f"JOIN chat_message m ON m.id = f.id "
+            f"JOIN chat_channel c ON c.id = m.channel_id "
+            f"WHERE c.is_active AND NOT m.is_deleted"
+        )
+        params = [terms] + channel_params + [pattern, pattern] + channel_params + [terms]
+        return _run_ranked(sql, params, after, limit)
+
+
+class PostgresMessageSearch:
+    """tsvector/GIN-backed search for PostgreSQL."""
+
+    index_name = 'chat_message_content_fts'
+
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.index_name} ON chat_message "
+            f"USING GIN (to_tsvector('{POSTGRES_CONFIG}', content))"
+        )
+
+    def drop_index(self, cursor):
+        cursor.execute(f"DROP INDEX IF EXISTS {self.index_name}")
+
+    def index(self, message):
+        # The expression index is maintained by PostgreSQL
+        pass
+
+    def index_many(self, messages):
+        pass
+
+    def unindex_many(self, message_ids):
+        pass
+
+    def search(self, query, channel_id=None, after=None, limit=SEARCH_PAGE_SIZE):
+        terms = ' & '.join(f"{token}:*" for token in tokenize(query))
+        if not terms:
+            return []
+
+        pattern = name_pattern(query)
+        sql = (
+            f"SELECT f.id, f.score, f.snippet FROM ("
+            f"  SELECT m.id, "
+            f"         CASE WHEN to_tsvector('{POSTGRES_CONFIG}', m.content) @@ q "
+            f"              THEN -ts_rank(to_tsvector('{POSTGRES_CONFIG}', m.content), q) "
+            # Authors' names only; after every content match
+            f"              ELSE 0 END AS score, "
+            f"         CASE WHEN to_tsvector('{POSTGRES_CONFIG}', m.content) @@ q "
+            f"              THEN ts_headline('{POSTGRES_CONFIG}', m.content, q, "
+            f"                               'StartSel=<mark>, StopSel=</mark>, MaxFragments=1') "
+            f"              END AS snippet"
+            f"  FROM chat_message m "
+            f"  JOIN chat_channel c ON c.id = m.channel_id "
+            f"  JOIN {get_user_model()._meta.db_table} u ON u.id = m.user_id, "
+            f"       to_tsquery('{POSTGRES_CONFIG}', %s) q "
+            f"  WHERE (to_tsvector('{POSTGRES_CONFIG}', m.content) @@ q "
+            f"         OR u.first_name ILIKE %s OR u.last_name ILIKE %s) "
+            f"    AND c.is_active AND NOT m.is_deleted"
+            f"{' AND m.channel_id = %s' if channel_id else ''}"
+            f") f WHERE TRUE"
+        )
+        params = [terms, pattern, pattern] + ([int(channel_id)] if channel_id else [])
+        return _run_ranked(sql, params, after, limit)
+
+
+def _run_ranked(sql, params, after, limit):
+    """Apply the keyset cursor and ordering shared by both backends."""
+    if after:
+        score, message_id = after
+        sql += " AND (f.score > %s OR (f.score = %s AND f.id > %s))"
+        params = params + [score, score, message_id]
+    sql += " ORDER BY f.score, f.id LIMIT %s"
+    params = params + [limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def get_backend():
+    """Search backend for the default database, or None if unsupported."""
+    if connection.vendor == 'sqlite':
+        return SQLiteMessageSearch()
+    if connection.vendor == 'postgresql':
+        return PostgresMessageSearch()
+    return None
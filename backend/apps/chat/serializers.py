@@ -1,27 +1,67 @@
 from rest_framework import serializers
-from .models import Channel, Message, ChannelMembership
+from .models import (
+    Channel,
+    Message,
+    ChannelMembership,
+    MAX_FILE_SIZE,
+    ALLOWED_FILE_EXTENSIONS
+)
+from .receipts import read_receipts
 from apps.authentication.serializers import UserSerializer
 
 
+class ChannelListSerializer(serializers.ListSerializer):
+    """Lists of channels, with the unread counters of the page merged at once."""
+    
+    def to_representation(self, data):
+        channels = list(data.all() if hasattr(data, 'all') else data)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            self.child.unread_counts = read_receipts.unread_counts(
+                (request.user.id, channel.id, channel.user_unread_count or 0, channel.last_message_at)
+                for channel in channels
+                if hasattr(channel, 'user_unread_count')
+            )
+        return super().to_representation(channels)
+
+
 class ChannelSerializer(serializers.ModelSerializer):
     """Serializer for chat channels."""
     created_by_name = serializers.CharField(source='created_by.get_full_name', read_only=True)
-    member_count = serializers.SerializerMethodField()
     unread_count = serializers.SerializerMethodField()
+    # Set by ChannelListSerializer for the channels being listed
+    unread_counts = None
     
     class Meta:
         model = Channel
+        list_serializer_class = ChannelListSerializer
         fields = [
             'id', 'name', 'description', 'created_by', 'created_by_name',
-            'created_at', 'is_active', 'member_count', 'unread_count'
+            'created_at', 'is_active', 'member_count', 'message_count',
+            'last_message_at', 'last_message_preview', 'unread_count'
+        ]
+        read_only_fields = [
+            'created_by', 'created_at', 'member_count', 'message_count',
+            'last_message_at', 'last_message_preview'
         ]
-        read_only_fields = ['created_by', 'created_at']
-    
-    def get_member_count(self, obj):
-        return obj.get_member_count()
     
     def get_unread_count(self, obj):
         request = self.context.get('request')
+        
+        # Set by ChannelMembershipSerializer, already merged with receipts
+        if getattr(obj, 'merged_unread_count', None) is not None:
+            return obj.merged_unread_count
+        
+        # Querysets annotated with ``with_unread_count`` need no extra query
+        if hasattr(obj, 'user_unread_count'):
+            if request and request.user.is_authenticated:
+                if self.unread_counts is not None:
+                    return self.unread_counts[(request.user.id, obj.id)]
+                return read_receipts.unread_count(
+                    request.user.id, obj.id, obj.user_unread_count or 0, obj.last_message_at
+                )
+            return obj.user_unread_count or 0
+        
         if request and request.user.is_authenticated:
             try:
                 membership = ChannelMembership.objects.get(
@@ -56,6 +96,18 @@ class MessageSerializer(serializers.ModelSerializer):
         return None
 
 
+class CompactMessageSerializer(MessageSerializer):
+    """Message with its user as an id; user snapshots are sent alongside."""
+    user = None
+    user_id = serializers.IntegerField(read_only=True)
+    
+    class Meta(MessageSerializer.Meta):
+        fields = [
+            'id', 'channel', 'user_id', 'content', 'file', 'file_url',
+            'file_type', 'file_name', 'created_at', 'edited_at', 'is_deleted'
+        ]
+
+
 class MessageCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating messages."""
     
@@ -75,18 +127,43 @@ class MessageCreateSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class ChannelMembershipListSerializer(serializers.ListSerializer):
+    """Lists of memberships, with their unread counters merged at once."""
+    
+    def to_representation(self, data):
+        memberships = list(data.all() if hasattr(data, 'all') else data)
+        self.child.unread_counts = read_receipts.unread_counts(
+            (membership.user_id, membership.channel_id, membership.unread_count,
+             membership.channel.last_message_at)
+            for membership in memberships
+        )
+        return super().to_representation(memberships)
+
+
 class ChannelMembershipSerializer(serializers.ModelSerializer):
     """Serializer for channel memberships."""
     channel = ChannelSerializer(read_only=True)
     unread_count = serializers.SerializerMethodField()
+    # Set by ChannelMembershipListSerializer for the memberships being listed
+    unread_counts = None
     
     class Meta:
         model = ChannelMembership
+        list_serializer_class = ChannelMembershipListSerializer
         fields = ['id', 'channel', 'last_read_at', 'joined_at', 'unread_count']
         read_only_fields = ['joined_at']
     
     def get_unread_count(self, obj):
-        return obj.get_unread_count()
+        return obj.channel.merged_unread_count
+    
+    def to_representation(self, instance):
+        # Merged once, for this field and the nested channel
+        if self.unread_counts is not None:
+            count = self.unread_counts[(instance.user_id, instance.channel_id)]
+        else:
+            count = instance.get_unread_count()
+        instance.channel.merged_unread_count = count
+        return super().to_representation(instance)
 
 
 class FileUploadSerializer(serializers.Serializer):
@@ -95,15 +172,14 @@ class FileUploadSerializer(serializers.Serializer):
     
     def validate_file(self, value):
         # Check file size
-        if value.size > 20 * 1024 * 1024:  # 20MB
+        if value.size > MAX_FILE_SIZE:
             raise serializers.ValidationError("El archivo no puede superar los 20MB.")
         
         # Check file extension
         ext = value.name.split('.')[-1].lower()
-        allowed_extensions = ['png', 'jpg', 'jpeg', 'gif', 'pdf', 'docx', 'xlsx', 'doc', 'xls']
-        if ext not in allowed_extensions:
+        if ext not in ALLOWED_FILE_EXTENSIONS:
             raise serializers.ValidationError(
-                f"Tipo de archivo no permitido. Extensiones permitidas: {', '.join(allowed_extensions)}"
+                f"Tipo de archivo no permitido. Extensiones permitidas: {', '.join(ALLOWED_FILE_EXTENSIONS)}"
             )
         
         return value
\ No newline at end of file
@@ -0,0 +1,49 @@
+import logging
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .middleware import token_cache, _version_key
+from .models import Message
+from .recent import recent_messages
+from .users import user_snapshots
+from .store import get_sync_store
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+# Saves limited to these fields leave the cached users valid, so logging in
+# (which only updates last_login) keeps the caches
+UNCACHED_USER_FIELDS = frozenset(['last_login'])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, update_fields=None, **kwargs):
+    """Drop cached WebSocket authentication and snapshots of a changed or deleted user."""
+    if update_fields and UNCACHED_USER_FIELDS.issuperset(update_fields):
+        return
+    user_id = instance.pk
+    # After the commit, so no cache is refilled with the old values meanwhile
+    transaction.on_commit(lambda: _invalidate_user(user_id))
+
+
+def _invalidate_user(user_id):
+    token_cache.invalidate_user(user_id)
+    user_snapshots.discard(user_id)
+    # Other workers notice the new version on their next lookup; until the
+    # store is back they keep their caches, as for any stale version
+    try:
+        get_sync_store().incr(_version_key(user_id))
+    except Exception:
+        logger.exception("Could not bump the chat version of user %s", user_id)
+
+
+@receiver(post_save, sender=Message)
+def update_recent_messages(sender, instance, created, **kwargs):
+    """Replace the cached entry of an edited or deleted message."""
+    # New messages are appended where they are broadcast or posted
+    if created:
+        return
+    recent_messages.update_sync(instance)
@@ -0,0 +1,391 @@
+"""
+Shared state store for the chat subsystem.
+
+Chat features that need state shared between sockets (presence, buffers,
+caches) keep it here. When the channel layer is backed by Redis the same
+server is reused; otherwise an in-process store with the same interface is
+used, which is enough for development and single-worker deployments.
+
+Synchronous code (views, signal handlers, management commands) uses
+``get_sync_store``, a blocking twin with the same commands. With Redis it
+has its own synchronous client, so sync paths never start an event loop
+just to reach the store.
+"""
+import redis
+import redis.sentinel
+from channels.layers import get_channel_layer
+
+
+class MemoryStore:
+    """In-process stand-in for the Redis commands used by the chat."""
+
+    def __init__(self):
+        self._data = {}
+
+    def _zset(self, key):
+        return self._data.setdefault(key, {})
+
+    async def zadd(self, key, mapping):
+        zset = self._zset(key)
+        added = sum(1 for member in mapping if str(member) not in zset)
+        zset.update({str(m): score for m, score in mapping.items()})
+        return added
+
+    async def zrem(self, key, *members):
+        zset = self._data.get(key, {})
+        removed = sum(1 for member in members if zset.pop(str(member), None) is not None)
+        if not zset:
+            # Redis drops empty sorted sets
+            self._data.pop(key, None)
+        return removed
+
+    async def zscore(self, key, member):
+        return self._data.get(key, {}).get(str(member))
+
+    async def zcard(self, key):
+        return len(self._data.get(key, {}))
+
+    async def zrangebyscore(self, key, min_score, max_score):
+        min_score, max_score = float(min_score), float(max_score)
+        zset = self._data.get(key, {})
+        return [
+            member for member, score in sorted(zset.items(), key=lambda item: item[1])
+            if min_score <= score <= max_score
+        ]
+
+    async def zremrangebyscore(self, key, min_score, max_score):
+        min_score, max_score = float(min_score), float(max_score)
+        zset = self._data.get(key, {})
+        expired = [m for m, score in zset.items() if min_score <= score <= max_score]
+        for member in expired:
+            del zset[member]
+        return len(expired)
+
+    async def get(self, key):
+        return self._data.get(key)
+
+    async def mget(self, keys):
+        return [self._data.get(key) for key in keys]
+
+    async def incr(self, key):
+        self._data[key] = self._data.get(key, 0) + 1
+        return self._data[key]
+
+    async def lpush(self, key, *values):
+        items = self._data.setdefault(key, [])
+        for value in values:
+            items.insert(0, value)
+        return len(items)
+
+    async def lpushx(self, key, *values):
+        if key not in self._data:
+            return 0
+        return await self.lpush(key, *values)
+
+    async def rpush(self, key, *values):
+        items = self._data.setdefault(key, [])
+        items.extend(values)
+        return len(items)
+
+    async def linsert(self, key, where, pivot, value):
+        items = self._data.get(key)
+        if items is None:
+            return 0
+        if pivot not in items:
+            return -1
+        index = items.index(pivot)
+        items.insert(index if where.upper() == 'BEFORE' else index + 1, value)
+        return len(items)
+
+    async def lrem(self, key, count, value):
+        items = self._data.get(key, [])
+        removed = 0
+        while value in items and (count == 0 or removed < abs(count)):
+            items.remove(value)
+            removed += 1
+        return removed
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+    async def ltrim(self, key, start, stop):
+        items = self._data.get(key)
+        if items is not None:
+            self._data[key] = items[start:stop + 1 if stop != -1 else None]
+
+    async def lrange(self, key, start, stop):
+        return self._data.get(key, [])[start:stop + 1 if stop != -1 else None]
+
+
+class RedisStore:
+    """Store backed by the Redis server of a ``RedisChannelLayer``."""
+
+    def __init__(self, channel_layer, prefix='chat'):
+        self.channel_layer = channel_layer
+        self.prefix = f"{channel_layer.prefix}:{prefix}"
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def _connection(self, key):
+        index = self.channel_layer.consistent_hash(key)
+        return self.channel_layer.connection(index)
+
+    async def zadd(self, key, mapping):
+        key = self._key(key)
+        return await self._connection(key).zadd(key, mapping)
+
+    async def zrem(self, key, *members):
+        key = self._key(key)
+        if not members:
+            return 0
+        return await self._connection(key).zrem(key, *members)
+
+    async def zscore(self, key, member):
+        key = self._key(key)
+        return await self._connection(key).zscore(key, member)
+
+    async def zcard(self, key):
+        key = self._key(key)
+        return await self._connection(key).zcard(key)
+
+    async def zrangebyscore(self, key, min_score, max_score):
+        key = self._key(key)
+        members = await self._connection(key).zrangebyscore(key, min_score, max_score)
+        return [m.decode() if isinstance(m, bytes) else m for m in members]
+
+    async def zremrangebyscore(self, key, min_score, max_score):
+        key = self._key(key)
+        return await self._connection(key).zremrangebyscore(key, min_score, max_score)
+
+    async def get(self, key):
+        key = self._key(key)
+        value = await self._connection(key).get(key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def mget(self, keys):
+        """Values of ``keys`` in order, one MGET per Redis shard."""
+        by_shard = {}
+        for position, key in enumerate(keys):
+            key = self._key(key)
+            shard = by_shard.setdefault(self.channel_layer.consistent_hash(key), ([], []))
+            shard[0].append(position)
+            shard[1].append(key)
+
+        values = [None] * len(keys)
+        for index, (positions, shard_keys) in by_shard.items():
+            shard_values = await self.channel_layer.connection(index).mget(shard_keys)
+            for position, value in zip(positions, shard_values):
+                values[position] = value.decode() if isinstance(value, bytes) else value
+        return values
+
+    async def incr(self, key):
+        key = self._key(key)
+        return await self._connection(key).incr(key)
+
+    async def lpush(self, key, *values):
+        key = self._key(key)
+        return await self._connection(key).lpush(key, *values)
+
+    async def lpushx(self, key, *values):
+        key = self._key(key)
+        return await self._connection(key).lpushx(key, *values)
+
+    async def rpush(self, key, *values):
+        key = self._key(key)
+        return await self._connection(key).rpush(key, *values)
+
+    async def linsert(self, key, where, pivot, value):
+        key = self._key(key)
+        return await self._connection(key).linsert(key, where, pivot, value)
+
+    async def lrem(self, key, count, value):
+        key = self._key(key)
+        return await self._connection(key).lrem(key, count, value)
+
+    async def delete(self, key):
+        key = self._key(key)
+        await self._connection(key).delete(key)
+
+    async def ltrim(self, key, start, stop):
+        key = self._key(key)
+        await self._connection(key).ltrim(key, start, stop)
+
+    async def lrange(self, key, start, stop):
+        key = self._key(key)
+        values = await self._connection(key).lrange(key, start, stop)
+        return [v.decode() if isinstance(v, bytes) else v for v in values]
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _sync_client(host):
+    """Blocking Redis client for a host of the channel layer's ``hosts``."""
+    host = dict(host)
+    if 'address' in host:
+        return redis.Redis.from_url(host.pop('address'), **host)
+    master_name = host.pop('master_name', None)
+    if master_name is not None:
+        sentinel = redis.sentinel.Sentinel(
+            host.pop('sentinels'), sentinel_kwargs=host.pop('sentinel_kwargs', None)
+        )
+        return sentinel.master_for(master_name, **host)
+    return redis.Redis(**host)
+
+
+class SyncRedisStore:
+    """Blocking twin of ``RedisStore``, with the same keys and shards."""
+
+    def __init__(self, store):
+        self.source = store
+        self.channel_layer = store.channel_layer
+        self.prefix = store.prefix
+        self._clients = {}
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def _connection(self, key):
+        return self._shard(self.channel_layer.consistent_hash(key))
+
+    def _shard(self, index):
+        if index not in self._clients:
+            self._clients[index] = _sync_client(self.channel_layer.hosts[index])
+        return self._clients[index]
+
+    def zadd(self, key, mapping):
+        key = self._key(key)
+        return self._connection(key).zadd(key, mapping)
+
+    def zrem(self, key, *members):
+        key = self._key(key)
+        if not members:
+            return 0
+        return self._connection(key).zrem(key, *members)
+
+    def zscore(self, key, member):
+        key = self._key(key)
+        return self._connection(key).zscore(key, member)
+
+    def zcard(self, key):
+        key = self._key(key)
+        return self._connection(key).zcard(key)
+
+    def zrangebyscore(self, key, min_score, max_score):
+        key = self._key(key)
+        return [_decode(m) for m in self._connection(key).zrangebyscore(key, min_score, max_score)]
+
+    def zremrangebyscore(self, key, min_score, max_score):
+        key = self._key(key)
+        return self._connection(key).zremrangebyscore(key, min_score, max_score)
+
+    def get(self, key):
+        key = self._key(key)
+        return _decode(self._connection(key).get(key))
+
+    def mget(self, keys):
+        """Values of ``keys`` in order, one MGET per Redis shard."""
+        by_shard = {}
+        for position, key in enumerate(keys):
+            key = self._key(key)
+            shard = by_shard.setdefault(self.channel_layer.consistent_hash(key), ([], []))
+            shard[0].append(position)
+            shard[1].append(key)
+
+        values = [None] * len(keys)
+        for index, (positions, shard_keys) in by_shard.items():
+            for position, value in zip(positions, self._shard(index).mget(shard_keys)):
+                values[position] = _decode(value)
+        return values
+
+    def incr(self, key):
+        key = self._key(key)
+        return self._connection(key).incr(key)
+
+    def lpush(self, key, *values):
+        key = self._key(key)
+        return self._connection(key).lpush(key, *values)
+
+    def lpushx(self, key, *values):
+        key = self._key(key)
+        return self._connection(key).lpushx(key, *values)
+
+    def rpush(self, key, *values):
+        key = self._key(key)
+        return self._connection(key).rpush(key, *values)
+
+    def linsert(self, key, where, pivot, value):
+        key = self._key(key)
+        return self._connection(key).linsert(key, where, pivot, value)
+
+    def lrem(self, key, count, value):
+        key = self._key(key)
+        return self._connection(key).lrem(key, count, value)
+
+    def delete(self, key):
+        key = self._key(key)
+        self._connection(key).delete(key)
+
+    def ltrim(self, key, start, stop):
+        key = self._key(key)
+        self._connection(key).ltrim(key, start, stop)
+
+    def lrange(self, key, start, stop):
+        key = self._key(key)
+        return [_decode(v) for v in self._connection(key).lrange(key, start, stop)]
+
+
+class SyncMemoryStore:
+    """Blocking view of a ``MemoryStore``, whose commands never wait on anything."""
+
+    def __init__(self, store):
+        self.source = store
+
+    def __getattr__(self, name):
+        command = getattr(self.source, name)
+
+        def run(*args):
+            coroutine = command(*args)
+            try:
+                coroutine.send(None)
+            except StopIteration as done:
+                return done.value
+            coroutine.close()
+            raise RuntimeError(f"MemoryStore.{name} did not complete")
+        return run
+
+
+_store = None
+_sync_store = None
+
+
+def get_store():
+    """Return the store shared by this process, creating it on first use."""
+    global _store
+    if _store is None:
+        channel_layer = get_channel_layer()
+        if channel_layer is not None and hasattr(channel_layer, 'connection'):
+            _store = RedisStore(channel_layer)
+        else:
+            _store = MemoryStore()
+    return _store
+
+
+def _sync_twin(store):
+    if isinstance(store, RedisStore):
+        return SyncRedisStore(store)
+    return SyncMemoryStore(store)
+
+
+def get_sync_store(store=None):
+    """Blocking twin of ``store``, by default of ``get_store()``, for synchronous code."""
+    global _sync_store
+    if store is not None:
+        return _sync_twin(store)
+    store = get_store()
+    if _sync_store is None or _sync_store.source is not store:
+        _sync_store = _sync_twin(store)
+    return _sync_store
+
@@ -0,0 +1,83 @@
+"""Shared setup of the chat tests."""
+from unittest import mock
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.authentication.models import User
+from apps.chat import store
+from apps.chat.models import Channel, ChannelMembership, Message
+from apps.chat.receipts import read_receipts
+from core.asgi import application
+
+IN_MEMORY_CHANNEL_LAYERS = {
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+}
+
+
+class ChatTestMixin:
+    """An empty chat store per test, and helpers to create chat data."""
+
+    def setUp(self):
+        super().setUp()
+        store._store = store.MemoryStore()
+        self.addCleanup(setattr, store, '_store', None)
+        # Read receipts are written at the end of each test rather than by
+        # the background thread, which would write into other tests
+        patcher = mock.patch.object(read_receipts, 'interval', 3600)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(read_receipts.flush)
+
+    def create_user(self, username, **fields):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com', password='secret', **fields
+        )
+
+    def create_channel(self, name='general', members=()):
+        channel = Channel.objects.create(name=name, created_by=members[0] if members else None)
+        for user in members:
+            ChannelMembership.objects.create(channel=channel, user=user)
+        return channel
+
+    def create_messages(self, channel, user, count):
+        return [
+            Message.objects.create(channel=channel, user=user, content=f'mensaje {i}')
+            for i in range(count)
+        ]
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ChatTestCase(ChatTestMixin, TestCase):
+    """TestCase with an in-memory channel layer and an empty chat store."""
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ChatConsumerTestCase(ChatTestMixin, TransactionTestCase):
+    """
+    TransactionTestCase for tests that talk to the WebSocket consumer.
+
+    The consumer, like everything using ``db.db_executor_async``, reads the
+    database from its own threads, which would not see the data of a
+    TestCase transaction.
+    """
+
+    async def connect(self, user, subprotocols=None, query=''):
+        """A communicator connected as ``user``; disconnect it at the end."""
+        token = str(AccessToken.for_user(user))
+        communicator = WebsocketCommunicator(
+            application,
+            f'/ws/chat/?token={token}{query}',
+            headers=[(b'origin', b'http://localhost'), (b'host', b'localhost')],
+            subprotocols=subprotocols,
+        )
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        communicator.subprotocol = subprotocol
+        return communicator
+
+    async def receive_until(self, communicator, frame_type, timeout=2):
+        """The next JSON frame of ``frame_type``, skipping any other."""
+        while True:
+            frame = await communicator.receive_json_from(timeout=timeout)
+            if frame.get('type') == frame_type:
+                return frame
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from django.utils import timezone
+from apps.chat import archive
+from apps.chat.models import ArchiveSegment, Message
+from .base import ChatTestCase
+
+
+class ArchiveBatchTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        archive_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.addCleanup(shutil.rmtree, archive_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch.object(archive, 'ARCHIVE_ROOT', archive_root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = self.create_user('ana')
+        self.channel = self.create_channel(members=[self.user])
+
+    def archive_all(self):
+        # Runs the on-commit hooks too, where django_cleanup deletes files
+        with self.captureOnCommitCallbacks(execute=True):
+            return archive.archive_batch(older_than=timezone.now() + timedelta(seconds=1))
+
+    def test_moves_messages_into_segments(self):
+        messages = self.create_messages(self.channel, self.user, 3)
+
+        self.assertEqual(self.archive_all(), 3)
+
+        self.assertFalse(Message.objects.exists())
+        segment = ArchiveSegment.objects.get()
+        self.assertEqual(segment.message_count, 3)
+        self.assertEqual(
+            [message.id for message in archive.read_segment(segment)],
+            [message.id for message in messages]
+        )
+        self.assertEqual(archive.find_archived(self.channel.id, messages[1].id).content, 'mensaje 1')
+
+    def test_history_pages_continue_into_the_archive(self):
+        archived = self.create_messages(self.channel, self.user, 2)
+        self.archive_all()
+        live = self.create_messages(self.channel, self.user, 2)
+
+        page, has_more = Message.objects.page(self.channel.id, before_id=live[0].id, limit=5)
+
+        self.assertEqual([message.id for message in page], [message.id for message in archived])
+        self.assertFalse(has_more)
+
+    def test_archived_attachments_are_kept(self):
+        message = Message(channel=self.channel, user=self.user, content='adjunto')
+        message.file.save('nota.txt', ContentFile(b'contenido'), save=False)
+        message.save()
+        storage, name = message.file.storage, message.file.name
+
+        self.archive_all()
+
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(archive.find_archived(self.channel.id, message.id).file.name, name)
+
+    def test_a_failed_write_keeps_the_segment_readable(self):
+        archived = self.create_messages(self.channel, self.user, 2)
+        self.archive_all()
+        self.create_messages(self.channel, self.user, 2)
+        segment = ArchiveSegment.objects.get()
+
+        with mock.patch.object(archive.os, 'fsync', side_effect=OSError(28, 'No space left on device')):
+            with self.assertRaises(OSError):
+                self.archive_all()
+
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertEqual(
+            [message.id for message in archive.read_segment(segment)],
+            [message.id for message in archived]
+        )
+        # No temporary file is left behind
+        directory = os.path.join(archive.ARCHIVE_ROOT, str(self.channel.id))
+        self.assertEqual(os.listdir(directory), [os.path.basename(segment.path)])
+
+        self.archive_all()
+        segment.refresh_from_db()
+        self.assertEqual(len(archive.read_segment(segment)), 4)
@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.utils import timezone
+from apps.chat import archive
+from apps.chat.models import Channel, ChannelMembership, Message
+from apps.chat.writer import persist_messages
+from .base import ChatTestCase
+
+
+class ChannelSummaryTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        archive_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_root)
+        patcher = mock.patch.object(archive, 'ARCHIVE_ROOT', archive_root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.ana = self.create_user('ana')
+        self.luis = self.create_user('luis')
+        self.channel = self.create_channel(members=[self.ana, self.luis])
+
+    def summary(self):
+        channel = Channel.objects.get(id=self.channel.id)
+        return {
+            'message_count': channel.message_count,
+            'member_count': channel.member_count,
+            'last_message_at': channel.last_message_at,
+            'last_message_preview': channel.last_message_preview,
+        }
+
+    def archive_all(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive_batch(older_than=timezone.now() + timedelta(seconds=1))
+
+    def test_new_messages_update_the_summary(self):
+        Message.objects.create(channel=self.channel, user=self.ana, content='hola')
+        messages = persist_messages([
+            (self.ana, self.channel.id, 'otra vez'),
+            (self.luis, self.channel.id, '<b>último</b>'),
+        ])
+
+        self.assertEqual(self.summary(), {
+            'message_count': 3,
+            'member_count': 2,
+            'last_message_at': messages[1].created_at,
+            'last_message_preview': 'último',
+        })
+
+    def test_soft_delete_updates_the_count_and_preview(self):
+        first = Message.objects.create(channel=self.channel, user=self.ana, content='primero')
+        last = Message.objects.create(channel=self.channel, user=self.luis, content='segundo')
+
+        last.soft_delete()
+        last.soft_delete()
+
+        self.assertEqual(self.summary(), {
+            'message_count': 1,
+            # Members who wrote still count, and the latest message is kept
+            'member_count': 2,
+            'last_message_at': last.created_at,
+            'last_message_preview': first.content,
+        })
+
+    def test_senders_with_archived_messages_are_not_counted_again(self):
+        self.create_messages(self.channel, self.ana, 2)
+        self.archive_all()
+
+        Message.objects.create(channel=self.channel, user=self.ana, content='de vuelta')
+        persist_messages([(self.ana, self.channel.id, 'y otra')])
+
+        self.assertEqual(self.summary()['member_count'], 1)
+        self.assertEqual(self.summary()['message_count'], 4)
+
+    def test_rebuild_matches_the_kept_summary(self):
+        self.create_messages(self.channel, self.ana, 2)
+        self.archive_all()
+        self.create_messages(self.channel, self.luis, 2)[1].soft_delete()
+        kept = self.summary()
+
+        Channel.objects.filter(id=self.channel.id).update(
+            message_count=0, member_count=0, last_message_at=None, last_message_preview=''
+        )
+        ChannelMembership.objects.update(has_posted=False)
+        self.channel.rebuild_summary()
+
+        self.assertEqual(self.summary(), kept)
+        self.assertEqual(ChannelMembership.objects.filter(has_posted=True).count(), 2)
+
+    def test_first_message_makes_the_sender_a_member(self):
+        eva = self.create_user('eva')
+
+        Message.objects.create(channel=self.channel, user=eva, content='hola')
+
+        membership = ChannelMembership.objects.get(channel=self.channel, user=eva)
+        self.assertTrue(membership.has_posted)
+        self.assertEqual(self.summary()['member_count'], 1)
@@ -0,0 +1,61 @@
+from rest_framework.test import APIClient
+from apps.chat.models import Message
+from .base import ChatTestCase
+
+
+class MessagePageTests(ChatTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('ana')
+        self.channel = self.create_channel(members=[self.user])
+        self.messages = self.create_messages(self.channel, self.user, 12)
+        self.ids = [message.id for message in self.messages]
+
+    def page_ids(self, **kwargs):
+        messages, has_more = Message.objects.page(self.channel.id, **kwargs)
+        return [message.id for message in messages], has_more
+
+    def test_latest_page(self):
+        self.assertEqual(self.page_ids(limit=5), (self.ids[-5:], True))
+        self.assertEqual(self.page_ids(limit=20), (self.ids, False))
+
+    def test_before_cursor(self):
+        self.assertEqual(self.page_ids(before_id=self.ids[7], limit=5), (self.ids[2:7], True))
+        self.assertEqual(self.page_ids(before_id=self.ids[2], limit=5), (self.ids[:2], False))
+
+    def test_after_cursor(self):
+        self.assertEqual(self.page_ids(after_id=self.ids[3], limit=5), (self.ids[4:9], True))
+        self.assertEqual(self.page_ids(after_id=self.ids[8], limit=5), (self.ids[9:], False))
+
+    def test_unknown_cursor(self):
+        self.assertEqual(self.page_ids(before_id=self.ids[-1] + 1000), ([], False))
+
+    def test_both_cursors_are_rejected(self):
+        with self.assertRaises(ValueError):
+            Message.objects.page(self.channel.id, before_id=self.ids[5], after_id=self.ids[2])
+
+
+class ChannelMessagesViewTests(ChatTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('ana', first_name='Ana')
+        self.channel = self.create_channel(members=[self.user])
+        self.messages = self.create_messages(self.channel, self.user, 3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/v1/chat/channels/{self.channel.id}/messages/'
+
+    def test_latest_page_with_user_snapshots(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['id'] for m in response.data['results']], [m.id for m in self.messages])
+        self.assertEqual([u['name'] for u in response.data['users']], ['Ana'])
+
+    def test_both_cursors_are_rejected(self):
+        response = self.client.get(self.url, {
+            'before_id': self.messages[2].id,
+            'after_id': self.messages[0].id,
+        })
+        self.assertEqual(response.status_code, 400)
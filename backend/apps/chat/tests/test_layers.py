@@ -0,0 +1,90 @@
+import asyncio
+from unittest import mock
+from channels.exceptions import ChannelFull
+from django.test import SimpleTestCase
+from apps.chat import layers
+from apps.chat.layers import ShardedInMemoryChannelLayer
+
+
+class ShardedInMemoryChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(layers.time, 'monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.layer = ShardedInMemoryChannelLayer(expiry=60, group_expiry=3600, capacity=2, shards=4)
+
+    async def test_send_and_receive(self):
+        await self.layer.send('inbox', {'type': 'a'})
+        await self.layer.send('inbox', {'type': 'b'})
+
+        self.assertEqual(await self.layer.receive('inbox'), {'type': 'a'})
+        self.assertEqual(await self.layer.receive('inbox'), {'type': 'b'})
+        self.assertEqual(self.layer.stats()['channels'], 0)
+
+    async def test_receive_waits_for_a_message(self):
+        receiving = asyncio.ensure_future(self.layer.receive('inbox'))
+        await asyncio.sleep(0)
+
+        await self.layer.send('inbox', {'type': 'a'})
+
+        self.assertEqual(await asyncio.wait_for(receiving, 1), {'type': 'a'})
+
+    async def test_full_channels_reject_sends_and_skip_group_sends(self):
+        await self.layer.group_add('chat_1', 'full')
+        await self.layer.group_add('chat_1', 'idle')
+        await self.layer.send('full', {'type': 'a'})
+        await self.layer.send('full', {'type': 'b'})
+
+        with self.assertRaises(ChannelFull):
+            await self.layer.send('full', {'type': 'c'})
+        await self.layer.group_send('chat_1', {'type': 'event'})
+
+        self.assertEqual(await self.layer.receive('idle'), {'type': 'event'})
+        self.assertEqual(await self.layer.receive('full'), {'type': 'a'})
+
+    async def test_group_send_shares_one_copy(self):
+        await self.layer.group_add('chat_1', 'one')
+        await self.layer.group_add('chat_1', 'two')
+        message = {'type': 'event', 'data': [1]}
+
+        await self.layer.group_send('chat_1', message)
+
+        received = [await self.layer.receive('one'), await self.layer.receive('two')]
+        self.assertEqual(received[0], message)
+        self.assertIsNot(received[0], message)
+        self.assertIs(received[0], received[1])
+
+    async def test_channels_with_expired_messages_leave_their_groups(self):
+        await self.layer.group_add('chat_1', 'gone')
+        await self.layer.group_add('chat_1', 'live')
+        await self.layer.group_send('chat_1', {'type': 'event'})
+        await self.layer.receive('live')
+
+        self.now += 61
+        # Each send sweeps one of the four shards once its turn is due
+        for tick in range(4):
+            self.now += 15
+            await self.layer.send(f'tick{tick}', {'type': 'tick'})
+
+        self.assertEqual(self.layer.stats()['memberships'], 1)
+        await self.layer.group_send('chat_1', {'type': 'event'})
+        self.assertEqual(await self.layer.receive('live'), {'type': 'event'})
+
+    async def test_group_memberships_expire(self):
+        await self.layer.group_add('chat_1', 'old')
+
+        self.now += 3601
+        for tick in range(4):
+            self.now += 15
+            await self.layer.send(f'tick{tick}', {'type': 'tick'})
+
+        self.assertEqual(self.layer.stats()['groups'], 0)
+
+    async def test_flush_empties_the_layer(self):
+        await self.layer.group_add('chat_1', 'one')
+        await self.layer.send('one', {'type': 'a'})
+
+        await self.layer.flush()
+
+        self.assertEqual(self.layer.stats(), {'channels': 0, 'groups': 0, 'memberships': 0})
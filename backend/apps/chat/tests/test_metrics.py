@@ -0,0 +1,81 @@
+import asyncio
+from unittest import mock
+from django.test import SimpleTestCase
+from rest_framework.test import APIClient
+from apps.chat import metrics as metrics_module
+from apps.chat.metrics import Histogram, MetricsRegistry
+from .base import ChatTestCase
+
+
+class HistogramTests(SimpleTestCase):
+    def test_quantiles_are_bucket_bounds_capped_by_the_max(self):
+        histogram = Histogram([1, 5, 10])
+        for value in [0.5, 0.8, 3, 4, 7]:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.quantile(0.5), 5)
+        self.assertEqual(histogram.quantile(0.99), 7)
+        self.assertEqual(histogram.snapshot()["buckets"], {"1": 2, "5": 2, "10": 1, "+Inf": 0})
+        self.assertIsNone(Histogram([1]).quantile(0.5))
+
+
+class MetricsRegistryTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.registry = MetricsRegistry()
+
+    def test_gauges_at_zero_are_dropped(self):
+        self.registry.incr("sockets.connects")
+        self.registry.incr("sockets.connects", 2)
+        self.registry.add_gauge("groups.chat_1", 1)
+        self.registry.add_gauge("groups.chat_2", 1)
+        self.registry.add_gauge("groups.chat_1", -1)
+
+        snapshot = self.registry.snapshot()
+
+        self.assertEqual(snapshot["counters"], {"sockets.connects": 3})
+        self.assertEqual(snapshot["gauges"], {"groups.chat_2": 1})
+
+    def test_timer_observes_milliseconds(self):
+        with mock.patch.object(metrics_module.time, 'perf_counter', side_effect=[1.0, 1.25]):
+            with self.registry.timer("handler.typing"):
+                pass
+
+        histogram = self.registry.snapshot()["histograms"]["handler.typing"]
+        self.assertEqual((histogram["count"], histogram["max"]), (1, 250))
+
+    async def test_probe_times_the_round_trip(self):
+        await self.registry.probe_channel_layer()
+
+        self.assertEqual(self.registry.histograms["channel_layer.rtt"].count, 1)
+        self.assertNotIn("channel_layer.probe_failures", self.registry.counters)
+
+    async def test_probe_without_reply_is_a_failure(self):
+        async def never(channel):
+            await asyncio.Event().wait()
+
+        layer = metrics_module.get_channel_layer()
+        with mock.patch.object(metrics_module, 'PROBE_TIMEOUT', 0.01), \
+                mock.patch.object(layer, 'receive', never):
+            await self.registry.probe_channel_layer()
+
+        self.assertEqual(self.registry.counters, {"channel_layer.probe_failures": 1})
+        self.assertNotIn("channel_layer.rtt", self.registry.histograms)
+
+
+class ChatMetricsViewTests(ChatTestCase):
+    url = '/api/v1/chat/metrics/'
+
+    def test_only_staff_can_read_the_metrics(self):
+        client = APIClient()
+        self.assertEqual(client.get(self.url).status_code, 401)
+
+        client.force_authenticate(self.create_user('ana'))
+        self.assertEqual(client.get(self.url).status_code, 403)
+
+        client.force_authenticate(self.create_user('admin', is_staff=True))
+        with mock.patch.object(metrics_module.metrics, 'counters', {"sockets.connects": 2}):
+            response = client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["counters"], {"sockets.connects": 2})
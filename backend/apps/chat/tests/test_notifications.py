@@ -0,0 +1,61 @@
+import json
+from channels.layers import get_channel_layer
+from apps.chat.models import Message
+from apps.chat.notifications import UnreadNotifier, user_group
+from apps.chat.presence import presence
+from apps.chat.writer import persist_messages
+from .base import ChatConsumerTestCase, ChatTestCase
+
+
+class UnreadCounterTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ana = self.create_user('ana')
+        self.luis = self.create_user('luis')
+        self.eva = self.create_user('eva')
+        self.channel = self.create_channel(members=[self.ana, self.luis, self.eva])
+
+    def unread(self, user):
+        return self.channel.memberships.get(user=user).unread_count
+
+    def test_new_messages_count_for_everyone_but_the_sender(self):
+        Message.objects.create(channel=self.channel, user=self.luis, content='hola')
+        persist_messages([(self.luis, self.channel.id, 'uno'), (self.ana, self.channel.id, 'dos')])
+
+        self.assertEqual(self.unread(self.eva), 3)
+        # Senders have read up to their own last message
+        self.assertEqual(self.unread(self.ana), 0)
+        self.assertEqual(self.unread(self.luis), 1)
+
+    def test_deleted_messages_are_not_unread_after_a_recount(self):
+        message = Message.objects.create(channel=self.channel, user=self.luis, content='hola')
+        message.soft_delete()
+        membership = self.channel.memberships.get(user=self.ana)
+
+        self.assertEqual(membership.count_unread_messages(), 0)
+
+
+class UnreadNotifierTests(ChatConsumerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ana = self.create_user('ana')
+        self.luis = self.create_user('luis')
+        self.channel = self.create_channel(members=[self.ana, self.luis])
+        Message.objects.create(channel=self.channel, user=self.luis, content='hola')
+
+    async def test_sends_the_counters_of_online_users(self):
+        layer = get_channel_layer()
+        inbox = await layer.new_channel()
+        await layer.group_add(user_group(self.ana.id), inbox)
+        await presence.connect(self.ana.id, inbox)
+
+        notifier = UnreadNotifier()
+        # Flushed right away rather than by its periodic task
+        notifier._dirty.add(self.channel.id)
+        await notifier.flush()
+
+        event = await layer.receive(inbox)
+        self.assertEqual(json.loads(event['text']), {
+            'type': 'unread_counts',
+            'counts': {str(self.channel.id): 1},
+        })
@@ -0,0 +1,69 @@
+import asyncio
+from unittest import mock
+from apps.chat import outbox as outbox_module
+from apps.chat.outbox import LAG_KEY, Outbox, OutboxOverflow, forget_lag, publish_lag
+from apps.chat.store import get_store
+from .base import ChatTestCase
+
+
+class OutboxTests(ChatTestCase):
+    async def test_full_queue_evicts_droppable_frames_first(self):
+        sent = []
+        blocked = asyncio.Event()
+
+        async def send(frame):
+            await blocked.wait()
+            sent.append(frame)
+
+        outbox = Outbox(send, max_size=3)
+        outbox.put('a')
+        # Let the writer take 'a' and block on it
+        await asyncio.sleep(0)
+        outbox.put('typing 1', droppable=True)
+        outbox.put('b')
+        outbox.put('c')
+        # Full: an incoming droppable frame is dropped...
+        outbox.put('typing 2', droppable=True)
+        # ...and an essential one evicts the queued droppable frame
+        outbox.put('d')
+        with self.assertRaises(OutboxOverflow):
+            outbox.put('e')
+
+        blocked.set()
+        await outbox.drain(timeout=1)
+        outbox.close()
+        self.assertEqual(sent, ['a', 'b', 'c', 'd'])
+        self.assertEqual(outbox.dropped, 2)
+
+    async def test_batching_joins_queued_frames(self):
+        sent = []
+
+        async def send(frame):
+            sent.append(frame)
+
+        outbox = Outbox(send, batch_window=0.01)
+        for frame in ['{"n":1}', '{"n":2}', '{"n":3}']:
+            outbox.put(frame)
+        await outbox.drain(timeout=1)
+        outbox.close()
+
+        self.assertEqual(sent, ['[{"n":1},{"n":2},{"n":3}]'])
+        self.assertEqual(outbox.sent, 3)
+
+
+class LagTests(ChatTestCase):
+    async def test_lag_of_silent_connections_expires(self):
+        outbox = Outbox(mock.AsyncMock())
+        outbox.max_lag = 0.25
+        await publish_lag('stale', outbox)
+        store = get_store()
+        self.assertEqual(await store.zscore(LAG_KEY, 'stale'), 250.0)
+
+        with mock.patch.object(outbox_module.time, 'time', return_value=outbox_module.time.time() + 3600):
+            await publish_lag('live', outbox)
+
+        outbox.close()
+        self.assertEqual(await store.zrangebyscore(LAG_KEY, '-inf', '+inf'), ['live'])
+
+        await forget_lag('live')
+        self.assertEqual(await store.zcard(LAG_KEY), 0)
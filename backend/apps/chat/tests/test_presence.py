@@ -0,0 +1,134 @@
+import asyncio
+import json
+from unittest import mock
+from channels.layers import get_channel_layer
+from apps.chat import presence as presence_module
+from apps.chat.presence import PresenceBroadcaster, PresenceRegistry
+from .base import ChatTestCase
+
+
+class PresenceRegistryTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = mock.patch.object(presence_module.time, 'time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.presence = PresenceRegistry(ttl=60)
+
+    async def test_connections_without_heartbeat_expire(self):
+        self.assertTrue(await self.presence.connect(1, 'socket-1', [10]))
+        self.assertFalse(await self.presence.connect(1, 'socket-2', [10]))
+        await self.presence.connect(2, 'socket-3', [10])
+
+        self.now += 45
+        await self.presence.heartbeat(2, 'socket-3', [10])
+        self.now += 30
+
+        self.assertEqual(await self.presence.online_user_ids(), [2])
+        self.assertEqual(await self.presence.online_user_ids(10), [2])
+        self.assertFalse(await self.presence.is_online(1))
+
+    async def test_user_stays_online_until_the_last_connection_leaves(self):
+        await self.presence.connect(1, 'socket-1', [10])
+        await self.presence.connect(1, 'socket-2', [10])
+
+        self.assertFalse(await self.presence.disconnect(1, 'socket-1', [10]))
+        self.assertEqual(await self.presence.online_user_ids(10), [1])
+        self.assertTrue(await self.presence.disconnect(1, 'socket-2', [10]))
+        self.assertEqual(await self.presence.online_user_ids(), [])
+        self.assertEqual(await self.presence.online_user_ids(10), [])
+
+    async def test_expired_connections_do_not_keep_the_user_online(self):
+        await self.presence.connect(1, 'crashed', [10])
+        self.now += 61
+        await self.presence.connect(1, 'socket', [10])
+
+        self.assertTrue(await self.presence.disconnect(1, 'socket', [10]))
+
+    async def test_simultaneous_connections_announce_one_join(self):
+        came_online = await asyncio.gather(
+            self.presence.connect(1, 'socket-1'),
+            self.presence.connect(1, 'socket-2'),
+        )
+
+        self.assertEqual(sorted(came_online), [False, True])
+
+    async def test_user_stays_in_a_channel_while_another_socket_is_subscribed(self):
+        await self.presence.connect(1, 'socket-1')
+        await self.presence.connect(1, 'socket-2')
+        await self.presence.join_channel(1, 10, 'socket-1')
+        await self.presence.join_channel(1, 10, 'socket-2')
+
+        self.assertFalse(await self.presence.leave_channel(1, 10, 'socket-1'))
+        self.assertEqual(await self.presence.online_user_ids(10), [1])
+        self.assertTrue(await self.presence.leave_channel(1, 10, 'socket-2'))
+        self.assertEqual(await self.presence.online_user_ids(10), [])
+
+    async def test_closing_a_tab_keeps_the_channels_of_the_other(self):
+        await self.presence.connect(1, 'socket-1')
+        await self.presence.connect(1, 'socket-2')
+        await self.presence.join_channel(1, 10, 'socket-1')
+        await self.presence.join_channel(1, 11, 'socket-2')
+
+        self.assertFalse(await self.presence.disconnect(1, 'socket-1', [10]))
+
+        self.assertEqual(await self.presence.online_user_ids(10), [])
+        self.assertEqual(await self.presence.online_user_ids(11), [1])
+
+
+class PresenceBroadcasterTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        # Flushed by the tests themselves, not at the end of the interval
+        self.broadcaster = PresenceBroadcaster(interval=3600)
+
+    def tearDown(self):
+        if self.broadcaster._task is not None:
+            self.broadcaster._task.cancel()
+        super().tearDown()
+
+    async def diffs(self):
+        """Presence diffs sent to the online users by one flush."""
+        layer = get_channel_layer()
+        inbox = await layer.new_channel()
+        await layer.group_add("online_users", inbox)
+        await self.broadcaster.flush()
+        frames = []
+        while True:
+            try:
+                event = await asyncio.wait_for(layer.receive(inbox), 0.05)
+            except asyncio.TimeoutError:
+                return frames
+            frames.append(json.loads(event["text"]))
+
+    async def test_changes_in_an_interval_become_one_diff(self):
+        self.broadcaster.joined(1)
+        self.broadcaster.joined(2)
+        self.broadcaster.left(3)
+
+        self.assertEqual(await self.diffs(), [{
+            "type": "presence_diff",
+            "joined": [1, 2],
+            "left": [3],
+        }])
+        self.assertEqual(await self.diffs(), [])
+
+    async def test_joining_and_leaving_within_an_interval_is_not_sent(self):
+        self.broadcaster.joined(1)
+        self.broadcaster.left(1)
+        self.broadcaster.left(2)
+        self.broadcaster.joined(2)
+
+        self.assertEqual(await self.diffs(), [])
+
+    async def test_user_who_ends_up_online_is_sent_once(self):
+        self.broadcaster.joined(1)
+        self.broadcaster.left(1)
+        self.broadcaster.joined(1)
+
+        self.assertEqual(await self.diffs(), [{
+            "type": "presence_diff",
+            "joined": [1],
+            "left": [],
+        }])
@@ -0,0 +1,67 @@
+import json
+from unittest import mock
+import msgpack
+from django.test import SimpleTestCase
+from apps.chat.events import encode_event
+from apps.chat.protocol import JSON, MSGPACK, negotiate
+from .base import ChatConsumerTestCase
+
+
+class NegotiateTests(SimpleTestCase):
+    def test_first_supported_subprotocol_wins(self):
+        self.assertIs(negotiate(['v2.chat', 'msgpack', 'json']), MSGPACK)
+        self.assertIs(negotiate(['json', 'msgpack']), JSON)
+        self.assertIsNone(negotiate(['v2.chat']))
+        self.assertIsNone(negotiate([]))
+
+
+class EventEncodingTests(SimpleTestCase):
+    payload = {"type": "typing_snapshot", "channel_id": 1, "users": []}
+
+    def test_packs_only_while_msgpack_sockets_are_open(self):
+        with mock.patch.object(MSGPACK, 'sockets', 0):
+            self.assertNotIn("packed", encode_event(self.payload))
+        with mock.patch.object(MSGPACK, 'sockets', 1):
+            event = encode_event(self.payload)
+        self.assertEqual(msgpack.unpackb(event["packed"]), self.payload)
+        self.assertEqual(JSON.event_frame(event), json.dumps(self.payload))
+
+    def test_first_msgpack_send_stores_the_packed_copy(self):
+        with mock.patch.object(MSGPACK, 'sockets', 0):
+            event = encode_event(self.payload)
+
+        frame = MSGPACK.event_frame(event)
+
+        self.assertEqual(msgpack.unpackb(frame), self.payload)
+        self.assertIs(event["packed"], frame)
+        self.assertIs(MSGPACK.event_frame(event), frame)
+
+
+class MsgpackSocketTests(ChatConsumerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('ana')
+        self.channel = self.create_channel(members=[self.user])
+
+    async def test_msgpack_sockets_get_binary_frames(self):
+        communicator = await self.connect(self.user, subprotocols=['msgpack', 'json'])
+        self.assertEqual(communicator.subprotocol, 'msgpack')
+        self.assertEqual(MSGPACK.sockets, 1)
+
+        while True:
+            frame = msgpack.unpackb(await communicator.receive_from())
+            if frame["type"] == "initial_data":
+                break
+        await communicator.disconnect()
+
+        self.assertEqual([channel["id"] for channel in frame["channels"]], [self.channel.id])
+        self.assertEqual(MSGPACK.sockets, 0)
+
+    async def test_json_is_the_default(self):
+        communicator = await self.connect(self.user)
+        self.assertIsNone(communicator.subprotocol)
+
+        frame = await self.receive_until(communicator, "initial_data")
+        await communicator.disconnect()
+
+        self.assertEqual([channel["id"] for channel in frame["channels"]], [self.channel.id])
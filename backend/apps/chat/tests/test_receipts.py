@@ -0,0 +1,124 @@
+from datetime import timedelta
+from django.utils import timezone
+from rest_framework.test import APIClient
+from apps.chat.models import ChannelMembership
+from apps.chat.receipts import ReadReceiptBuffer, read_receipts
+from .base import ChatTestCase
+
+
+class ReadReceiptBufferTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ana = self.create_user('ana')
+        self.luis = self.create_user('luis')
+        self.channel = self.create_channel(members=[self.ana, self.luis])
+        self.messages = self.create_messages(self.channel, self.luis, 3)
+        self.channel.refresh_from_db()
+        # Flushed by the tests themselves, not by its thread
+        self.buffer = ReadReceiptBuffer(interval=3600)
+
+    def membership(self, user):
+        return ChannelMembership.objects.get(user=user, channel=self.channel)
+
+    def test_without_receipt_the_stored_counter_is_kept(self):
+        with self.assertNumQueries(0):
+            count = self.buffer.unread_count(self.ana.id, self.channel.id, 7, self.channel.last_message_at)
+        self.assertEqual(count, 7)
+
+    def test_receipt_after_the_latest_message_needs_no_query(self):
+        self.buffer.mark(self.ana.id, self.channel.id)
+
+        with self.assertNumQueries(0):
+            count = self.buffer.unread_count(self.ana.id, self.channel.id, 3, self.channel.last_message_at)
+        self.assertEqual(count, 0)
+
+    def test_older_receipts_are_recounted_in_one_query(self):
+        other = self.create_channel('otro', members=[self.ana, self.luis])
+        self.create_messages(other, self.luis, 2)
+        other.refresh_from_db()
+        self.buffer.mark(self.ana.id, self.channel.id, self.messages[0].created_at)
+        self.buffer.mark(self.ana.id, other.id, other.last_message_at - timedelta(days=1))
+        self.buffer.mark(self.luis.id, self.channel.id, self.messages[0].created_at)
+
+        with self.assertNumQueries(1):
+            counts = self.buffer.unread_counts([
+                (self.ana.id, self.channel.id, 3, self.channel.last_message_at),
+                (self.ana.id, other.id, 2, other.last_message_at),
+                (self.luis.id, self.channel.id, 0, self.channel.last_message_at),
+            ])
+
+        self.assertEqual(counts, {
+            (self.ana.id, self.channel.id): 2,
+            (self.ana.id, other.id): 2,
+            # Their own messages are never unread
+            (self.luis.id, self.channel.id): 0,
+        })
+
+    def test_flush_writes_read_marks_and_recounts(self):
+        self.assertEqual(self.membership(self.ana).unread_count, 3)
+        read_at = self.messages[1].created_at
+        self.buffer.mark(self.ana.id, self.channel.id, read_at)
+        # Read times never go back
+        self.buffer.mark(self.ana.id, self.channel.id, read_at - timedelta(minutes=1))
+
+        self.buffer.flush()
+
+        membership = self.membership(self.ana)
+        self.assertEqual(membership.last_read_at, read_at)
+        self.assertEqual(membership.unread_count, 1)
+        self.assertIsNone(self.buffer.read_at(self.ana.id, self.channel.id))
+
+    def test_flush_skips_deleted_channels(self):
+        channel_id = self.channel.id
+        self.buffer.mark(self.ana.id, channel_id, timezone.now())
+        self.channel.delete()
+
+        self.buffer.flush()
+
+        self.assertFalse(ChannelMembership.objects.filter(channel_id=channel_id).exists())
+
+
+class ChannelListTests(ChatTestCase):
+    def test_lists_unread_counts_with_pending_receipts(self):
+        ana = self.create_user('ana')
+        luis = self.create_user('luis')
+        read = self.create_channel('leído', members=[ana, luis])
+        unread = self.create_channel('sin leer', members=[ana, luis])
+        self.create_messages(read, luis, 2)
+        self.create_messages(unread, luis, 4)
+        client = APIClient()
+        client.force_authenticate(ana)
+
+        client.post(f'/api/v1/chat/channels/{read.id}/mark-read/')
+        response = client.get('/api/v1/chat/channels/')
+
+        self.assertEqual(response.status_code, 200)
+        counts = {channel['name']: channel['unread_count'] for channel in response.data['results']}
+        self.assertEqual(counts, {'leído': 0, 'sin leer': 4})
+
+    def test_lists_memberships_with_one_recount(self):
+        ana = self.create_user('ana')
+        luis = self.create_user('luis')
+        channels = [self.create_channel(f'canal {i}', members=[ana, luis]) for i in range(4)]
+        for channel in channels:
+            self.create_messages(channel, luis, 3)
+            channel.refresh_from_db()
+        # Read before the last message of two channels, after it of another
+        read_receipts.mark(ana.id, channels[0].id, channels[0].last_message_at - timedelta(days=1))
+        read_receipts.mark(ana.id, channels[1].id, channels[1].last_message_at - timedelta(days=1))
+        read_receipts.mark(ana.id, channels[2].id)
+        client = APIClient()
+        client.force_authenticate(ana)
+
+        # The page count, the page and one recount of the pending receipts
+        with self.assertNumQueries(3):
+            response = client.get('/api/v1/chat/my-channels/')
+
+        self.assertEqual(response.status_code, 200)
+        counts = {
+            membership['channel']['name']: (membership['unread_count'], membership['channel']['unread_count'])
+            for membership in response.data['results']
+        }
+        self.assertEqual(counts, {
+            'canal 0': (3, 3), 'canal 1': (3, 3), 'canal 2': (0, 0), 'canal 3': (3, 3),
+        })
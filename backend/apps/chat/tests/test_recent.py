@@ -0,0 +1,71 @@
+from unittest import mock
+from asgiref.sync import AsyncToSync
+from rest_framework.test import APIClient
+from apps.chat.models import Message
+from apps.chat.recent import recent_messages
+from .base import ChatTestCase
+
+
+class RecentMessagesTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('ana')
+        self.channel = self.create_channel(members=[self.user])
+        self.messages = self.create_messages(self.channel, self.user, 3)
+        # Fill the cache
+        recent_messages.latest(self.channel.id)
+
+    def cached(self, limit=50):
+        with self.assertNumQueries(0):
+            page, _ = recent_messages.latest(self.channel.id, limit)
+        return page
+
+    def test_cache_survives_new_messages(self):
+        Message.objects.create(channel=self.channel, user=self.user, content='nuevo')
+
+        self.assertEqual(len(self.cached()), 3)
+
+    def test_edits_replace_the_cached_entry(self):
+        message = self.messages[1]
+        message.content = 'editado'
+        message.save()
+
+        self.assertEqual(
+            [payload['content'] for payload in self.cached()],
+            ['mensaje 0', 'editado', 'mensaje 2']
+        )
+
+    def test_deletes_replace_the_cached_entry(self):
+        self.messages[2].soft_delete()
+
+        payload = self.cached()[-1]
+        self.assertTrue(payload['is_deleted'])
+        self.assertEqual(payload['content'], '[Mensaje eliminado]')
+
+    def test_rest_messages_are_appended(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.post('/api/v1/chat/messages/', {'channel': self.channel.id, 'content': 'por REST'})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.cached()[-1]['content'], 'por REST')
+
+    def test_appends_keep_one_spare_entry(self):
+        for message in self.create_messages(self.channel, self.user, recent_messages.size + 5):
+            recent_messages.append_sync(message)
+
+        page, has_more = recent_messages.latest(self.channel.id, recent_messages.size)
+        self.assertEqual(len(page), recent_messages.size)
+        self.assertTrue(has_more)
+
+    def test_sync_paths_start_no_event_loop(self):
+        with mock.patch.object(AsyncToSync, '__call__', side_effect=AssertionError("event loop started")):
+            message = self.messages[0]
+            message.content = 'editado'
+            message.save()
+            new = Message.objects.create(channel=self.channel, user=self.user, content='nuevo')
+            recent_messages.append_sync(new)
+            page = self.cached()
+
+        self.assertEqual([payload['content'] for payload in page], ['editado', 'mensaje 1', 'mensaje 2', 'nuevo'])
@@ -0,0 +1,55 @@
+import asyncio
+import time
+from unittest import mock
+from django.test import SimpleTestCase
+from apps.chat import rendering
+from apps.chat.metrics import metrics
+
+
+def slow_render(content):
+    time.sleep(0.3)
+    return content
+
+
+class RenderMarkdownTests(SimpleTestCase):
+
+    def setUp(self):
+        rendering.cache = rendering.RenderCache()
+
+    def counter(self, name):
+        return metrics.counters.get(name, 0)
+
+    def test_renders_and_caches(self):
+        hits = self.counter("render.cache_hits")
+        html = asyncio.run(rendering.render_markdown("**hola**"))
+        self.assertEqual(html, "<p><strong>hola</strong></p>\n")
+        self.assertEqual(asyncio.run(rendering.render_markdown("**hola**")), html)
+        self.assertEqual(self.counter("render.cache_hits"), hits + 1)
+        self.assertGreater(metrics.snapshot()["histograms"]["render.latency"]["count"], 0)
+
+    def test_rejects_long_input(self):
+        with self.assertRaises(rendering.RenderError):
+            asyncio.run(rendering.render_markdown("x" * (rendering.MAX_INPUT_SIZE + 1)))
+
+    @mock.patch.object(rendering, 'RENDER_TIMEOUT', 0.05)
+    @mock.patch.object(rendering, 'render_markdown_sync', slow_render)
+    def test_timed_out_renders_keep_their_workers(self):
+        async def scenario():
+            results = await asyncio.gather(
+                *[rendering.render_markdown(f"slow {i}") for i in range(rendering.RENDER_WORKERS)],
+                return_exceptions=True
+            )
+            self.assertTrue(all(isinstance(r, rendering.RenderError) for r in results))
+
+            # Every worker is still busy: the next render fails without queueing
+            busy = self.counter("render.busy")
+            with self.assertRaises(rendering.RenderError):
+                await rendering.render_markdown("next")
+            self.assertEqual(self.counter("render.busy"), busy + 1)
+
+            # Once the workers finish, their slots are free again
+            await asyncio.sleep(0.4)
+            with mock.patch.object(rendering, 'render_markdown_sync', lambda content: content):
+                self.assertEqual(await rendering.render_markdown("later"), "later")
+
+        asyncio.run(scenario())
@@ -0,0 +1,69 @@
+from apps.chat.replay import ReplayBuffer
+from .base import ChatConsumerTestCase, ChatTestCase
+
+
+def new_message(message_id):
+    return {"type": "new_message", "message": {"id": message_id}}
+
+
+class ReplayBufferTests(ChatTestCase):
+    async def test_since_returns_the_events_after_the_last_seen_message(self):
+        buffer = ReplayBuffer(size=10)
+        deleted = {"type": "message_deleted", "message_id": 1, "channel_id": 1}
+        for event in [new_message(1), new_message(2), deleted, new_message(3)]:
+            await buffer.append(1, event)
+
+        self.assertEqual(await buffer.since(1, 2), [deleted, new_message(3)])
+        self.assertEqual(await buffer.since(1, 3), [])
+
+    async def test_since_returns_none_when_the_buffer_does_not_reach_back(self):
+        buffer = ReplayBuffer(size=2)
+        for message_id in range(1, 5):
+            await buffer.append(1, new_message(message_id))
+
+        self.assertIsNone(await buffer.since(1, 1))
+        self.assertEqual(await buffer.since(1, 3), [new_message(4)])
+
+
+class ResumeTests(ChatConsumerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('ana')
+        self.channel = self.create_channel(members=[self.user])
+        self.messages = self.create_messages(self.channel, self.user, 3)
+
+    async def test_database_fallback_asks_for_a_refresh(self):
+        communicator = await self.connect(self.user)
+        await communicator.send_json_to({
+            "type": "resume",
+            "channels": {str(self.channel.id): self.messages[0].id},
+        })
+
+        catch_up = await self.receive_until(communicator, "catch_up")
+        await communicator.disconnect()
+
+        self.assertEqual(catch_up["source"], "database")
+        self.assertTrue(catch_up["refresh"])
+        self.assertEqual(
+            [event["message"]["id"] for event in catch_up["events"]],
+            [message.id for message in self.messages[1:]]
+        )
+
+    async def test_buffer_replay_needs_no_refresh(self):
+        await ReplayBuffer().append(self.channel.id, new_message(self.messages[0].id))
+        deleted = {"type": "message_deleted", "message_id": self.messages[0].id,
+                   "channel_id": self.channel.id}
+        await ReplayBuffer().append(self.channel.id, deleted)
+
+        communicator = await self.connect(self.user)
+        await communicator.send_json_to({
+            "type": "resume",
+            "channels": {str(self.channel.id): self.messages[0].id},
+        })
+
+        catch_up = await self.receive_until(communicator, "catch_up")
+        await communicator.disconnect()
+
+        self.assertEqual(catch_up["source"], "buffer")
+        self.assertFalse(catch_up["refresh"])
+        self.assertEqual(catch_up["events"], [deleted])
@@ -0,0 +1,67 @@
+from unittest import mock
+from rest_framework.test import APIClient
+from apps.chat import views
+from apps.chat.models import Message
+from .base import ChatTestCase
+
+
+class SearchMessagesTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('ana')
+        self.channel = self.create_channel(members=[self.user])
+        self.other = self.create_channel('otro', members=[self.user])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, **params):
+        response = self.client.get('/api/v1/chat/messages/search/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_cursor_pages_through_every_match_once(self):
+        for i in range(5):
+            Message.objects.create(channel=self.channel, user=self.user, content=f'reunión {i}')
+        Message.objects.create(channel=self.channel, user=self.user, content='otra cosa')
+
+        ids = []
+        cursor = None
+        with mock.patch.object(views, 'SEARCH_PAGE_SIZE', 2):
+            for _ in range(4):
+                page = self.search(q='reunion', cursor=cursor or '')
+                ids += [result['id'] for result in page['results']]
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+        self.assertIsNone(cursor)
+
+    def test_results_have_snippets_and_skip_deleted_messages(self):
+        kept = Message.objects.create(channel=self.channel, user=self.user, content='hola equipo')
+        Message.objects.create(channel=self.channel, user=self.user, content='hola a todos').soft_delete()
+        Message.objects.create(channel=self.other, user=self.user, content='hola otro canal')
+
+        page = self.search(q='equipo hola', channel_id=self.channel.id)
+
+        self.assertEqual([result['id'] for result in page['results']], [kept.id])
+        self.assertIn('<mark>hola</mark>', page['results'][0]['snippet'])
+
+    def test_malformed_cursor_is_rejected(self):
+        response = self.client.get('/api/v1/chat/messages/search/', {'q': 'hola', 'cursor': 'x'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_matches_authors_names_after_the_content(self):
+        author = self.create_user('luis', first_name='Luis', last_name='Martínez_')
+        by_name = Message.objects.create(channel=self.channel, user=author, content='buenos días')
+        by_content = Message.objects.create(channel=self.channel, user=self.user, content='hablé con luis')
+
+        page = self.search(q='luis')
+
+        self.assertEqual([result['id'] for result in page['results']], [by_content.id, by_name.id])
+        self.assertIsNone(page['results'][1]['snippet'])
+        # LIKE wildcards in the query are taken literally
+        self.assertEqual([result['id'] for result in self.search(q='z_')['results']], [by_name.id])
+        self.assertEqual(self.search(q='%')['results'], [])
@@ -0,0 +1,81 @@
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+from apps.chat import store
+from apps.chat.middleware import get_user_version, token_cache
+from .base import ChatTestCase
+
+
+class UnavailableStore:
+    """Store whose server is down."""
+
+    async def get(self, key):
+        raise ConnectionError("store down")
+
+    async def incr(self, key):
+        raise ConnectionError("store down")
+
+
+class InvalidateUserTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('ana', is_verified=True)
+        self.addCleanup(token_cache.invalidate_user, self.user.id)
+
+    def version(self):
+        return async_to_sync(get_user_version)(self.user.id)
+
+    def test_profile_change_bumps_the_version_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.first_name = 'Ana'
+            self.user.save()
+            self.assertEqual(self.version(), 0)
+
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(self.version(), 1)
+
+    def test_profile_change_drops_cached_tokens(self):
+        token_cache.set('token', {'id': self.user.id}, 0, float('inf'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        self.assertIsNone(token_cache.get('token'))
+
+    def test_login_keeps_the_caches(self):
+        token_cache.set('token', {'id': self.user.id}, 0, float('inf'))
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(
+                reverse('authentication:token_obtain_pair'),
+                {'username': 'ana', 'password': 'secret'}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(callbacks, [])
+        self.assertIsNotNone(token_cache.get('token'))
+
+    def test_user_changes_survive_an_unavailable_store(self):
+        store._store = UnavailableStore()
+
+        with self.assertLogs('apps.chat.signals', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.first_name = 'Ana'
+                self.user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Ana')
+
+
+class TokenUserCacheTests(ChatTestCase):
+    def test_invalidate_user_drops_only_their_tokens(self):
+        token_cache.set('ana-1', {'id': 1}, 0, float('inf'))
+        token_cache.set('ana-2', {'id': 1}, 0, float('inf'))
+        token_cache.set('luis', {'id': 2}, 0, float('inf'))
+        self.addCleanup(token_cache.invalidate_user, 2)
+
+        token_cache.invalidate_user(1)
+
+        self.assertIsNone(token_cache.get('ana-1'))
+        self.assertIsNone(token_cache.get('ana-2'))
+        self.assertIsNotNone(token_cache.get('luis'))
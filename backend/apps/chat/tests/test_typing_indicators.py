@@ -0,0 +1,85 @@
+import asyncio
+import json
+from unittest import mock
+from channels.layers import get_channel_layer
+from apps.chat import store, typing_indicators
+from apps.chat.typing_indicators import TypingCoalescer
+from .base import ChatTestCase
+
+
+class TypingCoalescerTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = mock.patch.object(typing_indicators.time, 'time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Flushed by the tests themselves, not by its periodic task
+        patcher = mock.patch.object(TypingCoalescer, '_ensure_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.coalescer = TypingCoalescer(ttl=5)
+
+    async def subscribe(self, channel_id):
+        layer = get_channel_layer()
+        inbox = await layer.new_channel()
+        await layer.group_add(f'chat_{channel_id}', inbox)
+        return inbox
+
+    async def snapshots(self, inbox):
+        """Typing snapshots sent to ``inbox`` by one flush."""
+        await self.coalescer.flush()
+        frames = []
+        while True:
+            try:
+                event = await asyncio.wait_for(get_channel_layer().receive(inbox), 0.05)
+            except asyncio.TimeoutError:
+                return frames
+            frames.append(json.loads(event['text']))
+
+    async def test_updates_between_flushes_become_one_snapshot(self):
+        inbox = await self.subscribe(1)
+        await self.coalescer.set_typing(1, 10, 'Ana', True)
+        await self.coalescer.set_typing(1, 11, 'Luis', True)
+        self.now += 0.5
+        with mock.patch.object(store._store, 'zadd') as zadd:
+            # Still typing, well within the TTL: nothing to store
+            await self.coalescer.set_typing(1, 10, 'Ana', True)
+        zadd.assert_not_called()
+
+        frames = await self.snapshots(inbox)
+
+        self.assertEqual(frames, [{
+            'type': 'typing_snapshot',
+            'channel_id': 1,
+            'users': [{'id': 10, 'name': 'Ana'}, {'id': 11, 'name': 'Luis'}],
+        }])
+        self.assertEqual(await self.snapshots(inbox), [])
+
+    async def test_typers_expire_after_the_ttl(self):
+        inbox = await self.subscribe(1)
+        await self.coalescer.set_typing(1, 10, 'Ana', True)
+        await self.snapshots(inbox)
+
+        self.now += 6
+        frames = await self.snapshots(inbox)
+
+        self.assertEqual(frames, [{'type': 'typing_snapshot', 'channel_id': 1, 'users': []}])
+        self.assertEqual(await self.coalescer.typing_users(1), [])
+
+    async def test_stop_typing_is_sent_once(self):
+        inbox = await self.subscribe(1)
+        await self.coalescer.set_typing(1, 10, 'Ana', True)
+        await self.coalescer.set_typing(1, 11, 'Luis', True)
+        await self.snapshots(inbox)
+
+        await self.coalescer.set_typing(1, 10, 'Ana', False)
+        frames = await self.snapshots(inbox)
+        await self.coalescer.set_typing(1, 10, 'Ana', False)
+
+        self.assertEqual(frames, [{
+            'type': 'typing_snapshot',
+            'channel_id': 1,
+            'users': [{'id': 11, 'name': 'Luis'}],
+        }])
+        self.assertEqual(await self.snapshots(inbox), [])
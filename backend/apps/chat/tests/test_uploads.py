@@ -0,0 +1,144 @@
+import os
+import shutil
+import struct
+import tempfile
+import uuid
+from django.test import SimpleTestCase, override_settings
+from apps.chat.models import Message
+from apps.chat.uploads import CHUNK_SIZE, MAX_CONCURRENT_UPLOADS, UploadError, parse_chunk
+from .base import ChatConsumerTestCase
+
+
+def chunk(upload_id, seq, payload):
+    return uuid.UUID(hex=upload_id).bytes + struct.pack('!I', seq) + payload
+
+
+class ParseChunkTests(SimpleTestCase):
+    def test_splits_the_header(self):
+        upload_id = uuid.uuid4().hex
+        self.assertEqual(parse_chunk(chunk(upload_id, 7, b'abc')), (upload_id, 7, b'abc'))
+
+    def test_rejects_empty_and_oversized_chunks(self):
+        upload_id = uuid.uuid4().hex
+        with self.assertRaises(UploadError):
+            parse_chunk(chunk(upload_id, 0, b''))
+        with self.assertRaises(UploadError):
+            parse_chunk(chunk(upload_id, 0, b'x' * (CHUNK_SIZE + 1)))
+
+
+class ChunkedUploadTests(ChatConsumerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(FILE_UPLOAD_TEMP_DIR=self.temp_dir, MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = self.create_user('ana')
+        self.channel = self.create_channel(members=[self.user])
+
+    def temp_files(self):
+        return os.listdir(self.temp_dir)
+
+    async def start(self, communicator, size, name='informe.pdf'):
+        upload_id = uuid.uuid4().hex
+        await communicator.send_json_to({
+            'type': 'upload_start',
+            'upload_id': upload_id,
+            'channel_id': self.channel.id,
+            'name': name,
+            'size': size,
+        })
+        return upload_id, await communicator.receive_json_from(timeout=2)
+
+    async def send_chunk(self, communicator, upload_id, seq, payload):
+        await communicator.send_to(bytes_data=chunk(upload_id, seq, payload))
+        return await communicator.receive_json_from(timeout=2)
+
+    async def test_chunks_in_order_create_the_message(self):
+        communicator = await self.connect(self.user)
+        await self.receive_until(communicator, 'initial_data')
+        await communicator.send_json_to({'type': 'subscribe', 'channel_id': self.channel.id})
+        await self.receive_until(communicator, 'subscribed')
+
+        upload_id, ready = await self.start(communicator, size=6)
+        first = await self.send_chunk(communicator, upload_id, 0, b'hola ')
+        second = await self.send_chunk(communicator, upload_id, 1, b'!')
+        await communicator.send_json_to({'type': 'upload_commit', 'upload_id': upload_id})
+        await self.receive_until(communicator, 'new_message')
+        await communicator.disconnect()
+
+        self.assertEqual(ready, {'type': 'upload_ready', 'upload_id': upload_id, 'chunk_size': CHUNK_SIZE})
+        self.assertEqual(first, {'type': 'upload_ack', 'upload_id': upload_id, 'seq': 0, 'received': 5})
+        self.assertEqual(second['received'], 6)
+        message = await Message.objects.aget(channel=self.channel)
+        self.assertEqual(message.file_name, 'informe.pdf')
+        with message.file.open('rb') as f:
+            self.assertEqual(f.read(), b'hola !')
+        self.assertEqual(self.temp_files(), [])
+
+    async def test_out_of_order_chunk_aborts_the_upload(self):
+        communicator = await self.connect(self.user)
+        await self.receive_until(communicator, 'initial_data')
+
+        upload_id, _ = await self.start(communicator, size=10)
+        await self.send_chunk(communicator, upload_id, 0, b'abc')
+        error = await self.send_chunk(communicator, upload_id, 2, b'def')
+        # The upload is gone: a later chunk is rejected as unknown
+        unknown = await self.send_chunk(communicator, upload_id, 1, b'def')
+        await communicator.disconnect()
+
+        self.assertEqual(error['type'], 'upload_error')
+        self.assertEqual(error['message'], 'Fragmento fuera de orden: se esperaba 1 y llegó 2')
+        self.assertEqual(unknown['message'], 'Subida desconocida')
+        self.assertEqual(self.temp_files(), [])
+
+    async def test_size_limits(self):
+        communicator = await self.connect(self.user)
+        await self.receive_until(communicator, 'initial_data')
+
+        _, too_big = await self.start(communicator, size=20 * 1024 * 1024 + 1)
+        upload_id, _ = await self.start(communicator, size=4)
+        overflow = await self.send_chunk(communicator, upload_id, 0, b'12345')
+        upload_id, _ = await self.start(communicator, size=4)
+        await self.send_chunk(communicator, upload_id, 0, b'123')
+        await communicator.send_json_to({'type': 'upload_commit', 'upload_id': upload_id})
+        incomplete = await communicator.receive_json_from(timeout=2)
+        await communicator.disconnect()
+
+        self.assertEqual(too_big['message'], 'El archivo no puede superar los 20MB.')
+        self.assertEqual(overflow['message'], 'El archivo supera el tamaño declarado')
+        self.assertEqual(incomplete['message'], 'La subida del archivo está incompleta')
+        self.assertFalse(await Message.objects.filter(channel=self.channel).aexists())
+        self.assertEqual(self.temp_files(), [])
+
+    async def test_concurrent_uploads_are_capped(self):
+        communicator = await self.connect(self.user)
+        await self.receive_until(communicator, 'initial_data')
+
+        for _ in range(MAX_CONCURRENT_UPLOADS):
+            _, ready = await self.start(communicator, size=10)
+            self.assertEqual(ready['type'], 'upload_ready')
+        _, refused = await self.start(communicator, size=10)
+        await communicator.disconnect()
+
+        self.assertEqual(refused['message'], 'Demasiadas subidas simultáneas')
+
+    async def test_abort_and_disconnect_remove_the_temporary_files(self):
+        communicator = await self.connect(self.user)
+        await self.receive_until(communicator, 'initial_data')
+
+        aborted, _ = await self.start(communicator, size=10)
+        await self.send_chunk(communicator, aborted, 0, b'abc')
+        pending, _ = await self.start(communicator, size=10)
+        await self.send_chunk(communicator, pending, 0, b'abc')
+        await communicator.send_json_to({'type': 'upload_abort', 'upload_id': aborted})
+        unknown = await self.send_chunk(communicator, aborted, 1, b'def')
+        self.assertEqual(len(self.temp_files()), 1)
+        await communicator.disconnect()
+
+        self.assertEqual(unknown['message'], 'Subida desconocida')
+        self.assertEqual(self.temp_files(), [])
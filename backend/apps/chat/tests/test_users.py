@@ -0,0 +1,90 @@
+from unittest import mock
+from apps.chat import store
+from apps.chat.middleware import _version_key
+from apps.chat.store import MemoryStore, RedisStore
+from apps.chat.users import UserSnapshotCache
+from .base import ChatTestCase
+
+
+class UserSnapshotCacheTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = [self.create_user(name, first_name=name.title()) for name in ['ana', 'luis', 'eva']]
+        self.ids = [user.id for user in self.users]
+
+    async def test_reads_all_versions_at_once(self):
+        cache = UserSnapshotCache(check_interval=0)
+        await cache.get_many(self.ids)
+        await store._store.incr(_version_key(self.ids[0]))
+
+        with mock.patch.object(store._store, 'get', side_effect=AssertionError("one GET per user")), \
+                mock.patch.object(store._store, 'mget', wraps=store._store.mget) as mget:
+            found = await cache.get_many(self.ids)
+
+        mget.assert_called_once()
+        self.assertEqual(found[self.ids[0]][0], 1)
+        self.assertEqual(found[self.ids[1]], (0, {'id': self.ids[1], 'name': 'Luis', 'avatar': None}))
+
+
+class FakeRedisLayer:
+    """Two Redis shards, picked by the parity of the key's last digit."""
+
+    prefix = 'asgi'
+
+    def __init__(self):
+        self.shards = [MemoryStore(), MemoryStore()]
+        self.calls = []
+
+    def consistent_hash(self, key):
+        return int(key[-1]) % 2
+
+    def connection(self, index):
+        shard = self.shards[index]
+        layer = self
+
+        class Connection:
+            async def mget(self, keys):
+                layer.calls.append((index, keys))
+                return [value.encode() if value else value for value in await shard.mget(keys)]
+
+        return Connection()
+
+
+class RedisStoreTests(ChatTestCase):
+    async def test_mget_reads_each_shard_once(self):
+        layer = FakeRedisLayer()
+        redis_store = RedisStore(layer)
+        layer.shards[0]._data['asgi:chat:k2'] = '2'
+        layer.shards[1]._data['asgi:chat:k1'] = '1'
+
+        values = await redis_store.mget(['k1', 'k2', 'k3', 'k4'])
+
+        self.assertEqual(values, ['1', '2', None, None])
+        self.assertEqual(sorted(layer.calls), [
+            (0, ['asgi:chat:k2', 'asgi:chat:k4']),
+            (1, ['asgi:chat:k1', 'asgi:chat:k3']),
+        ])
+
+    def test_sync_twin_uses_the_same_keys_and_shards(self):
+        layer = FakeRedisLayer()
+        layer.hosts = [{'address': 'redis://shard0'}, {'address': 'redis://shard1'}]
+        redis_store = RedisStore(layer)
+        layer.shards[0]._data['asgi:chat:k2'] = '2'
+        layer.shards[1]._data['asgi:chat:k1'] = '1'
+        clients = {}
+
+        def sync_client(host):
+            index = layer.hosts.index(host)
+            client = mock.Mock()
+            client.mget.side_effect = lambda keys: [
+                layer.shards[index]._data.get(key, '').encode() or None for key in keys
+            ]
+            clients[index] = client
+            return client
+
+        with mock.patch.object(store, '_sync_client', sync_client):
+            values = store.get_sync_store(redis_store).mget(['k1', 'k2', 'k3', 'k4'])
+
+        self.assertEqual(values, ['1', '2', None, None])
+        clients[0].mget.assert_called_once_with(['asgi:chat:k2', 'asgi:chat:k4'])
+        clients[1].mget.assert_called_once_with(['asgi:chat:k1', 'asgi:chat:k3'])
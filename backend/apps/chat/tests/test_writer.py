@@ -0,0 +1,91 @@
+import asyncio
+from unittest import mock
+from django.db import OperationalError
+from apps.chat import writer as writer_module
+from apps.chat.models import ChannelMembership, Message
+from apps.chat.search import get_backend
+from apps.chat.writer import MessageWriteError, MessageWriter, persist_messages
+from .base import ChatConsumerTestCase, ChatTestCase
+
+
+class PersistMessagesTests(ChatTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ana = self.create_user('ana')
+        self.luis = self.create_user('luis')
+        self.channel = self.create_channel(members=[self.ana, self.luis])
+
+    def test_saves_indexes_and_counts_a_batch(self):
+        messages = persist_messages([
+            (self.ana, self.channel.id, 'hola mundo'),
+            (self.luis, self.channel.id, 'hola'),
+            (self.ana, self.channel.id, 'adiós mundo'),
+            (self.ana, self.channel.id + 1, 'canal inexistente'),
+        ])
+
+        self.assertIsNone(messages[3])
+        self.assertEqual(Message.objects.filter(channel=self.channel).count(), 3)
+        found = [row[0] for row in get_backend().search('mundo')]
+        self.assertCountEqual(found, [messages[0].id, messages[2].id])
+
+        self.channel.refresh_from_db()
+        self.assertEqual(self.channel.message_count, 3)
+        self.assertEqual(self.channel.last_message_preview, 'adiós mundo')
+        unread = dict(ChannelMembership.objects.values_list('user__username', 'unread_count'))
+        self.assertEqual(unread, {'ana': 0, 'luis': 1})
+
+    def test_search_index_takes_two_statements_per_batch(self):
+        messages = self.create_messages(self.channel, self.ana, 20)
+        messages[0].is_deleted = True
+        messages[1].content = 'editado'
+
+        with self.assertNumQueries(2):
+            get_backend().index_many(messages)
+
+        self.assertEqual([row[0] for row in get_backend().search('editado')], [messages[1].id])
+        self.assertEqual(len(get_backend().search('mensaje')), 18)
+
+
+class MessageWriterTests(ChatConsumerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ana = self.create_user('ana')
+        self.channel = self.create_channel(members=[self.ana])
+
+    async def submit_all(self, writer, count):
+        return await asyncio.gather(
+            *[writer.submit(self.ana, self.channel.id, f'mensaje {i}') for i in range(count)],
+            return_exceptions=True
+        )
+
+    async def test_a_failed_broadcast_does_not_hold_back_the_batch(self):
+        writer = MessageWriter(batch_size=10, delay=0)
+
+        with mock.patch.object(writer_module, 'broadcast_message',
+                               side_effect=[ConnectionError('redis'), None, None]) as broadcast, \
+                self.assertLogs('apps.chat.writer', 'ERROR'):
+            results = await self.submit_all(writer, 3)
+
+        self.assertEqual([message.content for message in results],
+                         ['mensaje 0', 'mensaje 1', 'mensaje 2'])
+        self.assertEqual(broadcast.call_count, 3)
+
+    async def test_batches_after_a_failed_one_are_written(self):
+        writer = MessageWriter(batch_size=1, delay=0)
+        calls = []
+
+        def persist_messages_once_locked(entries):
+            calls.append(entries)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return persist_messages(entries)
+
+        with mock.patch.object(writer_module, 'persist_messages', persist_messages_once_locked), \
+                mock.patch.object(writer_module, 'broadcast_message'), \
+                self.assertLogs('apps.chat.writer', 'ERROR'):
+            failed, saved = await self.submit_all(writer, 2)
+
+        # Senders get a message of their own, not the database error
+        self.assertIsInstance(failed, MessageWriteError)
+        self.assertEqual(str(failed), 'No se pudo guardar el mensaje')
+        self.assertEqual(saved.content, 'mensaje 1')
@@ -0,0 +1,121 @@
+"""
+Server-side coalescing of typing indicators.
+
+Instead of fanning out every ``typing`` frame, typing state is kept per
+channel in a sorted set of the chat store (scored by expiry) and a
+periodic flusher sends one ``typing_snapshot`` per changed channel with
+everyone currently typing. Repeated "still typing" frames only refresh
+the expiry, repeated "stopped" frames are dropped, and users who stop
+without saying so expire after ``TYPING_TTL`` seconds.
+"""
+import asyncio
+import time
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .events import encode_event
+from .store import get_store
+
+TYPING_TTL = getattr(settings, 'CHAT_TYPING_TTL', 5)
+FLUSH_INTERVAL = getattr(settings, 'CHAT_TYPING_INTERVAL', 0.3)
+
+
+def _typing_key(channel_id):
+    return f"typing:{channel_id}"
+
+
+def _member(user_id, user_name):
+    return f"{user_id}:{user_name}"
+
+
+class TypingCoalescer:
+    """Collapse typing updates into periodic per-channel snapshots."""
+
+    def __init__(self, store=None, ttl=TYPING_TTL, interval=FLUSH_INTERVAL):
+        self._store = store
+        self.ttl = ttl
+        self.interval = interval
+        # (channel_id, user_id) -> time of the last expiry refresh
+        self._refreshed = {}
+        # channel_id -> time until which the flusher keeps watching it
+        self._active = {}
+        self._dirty = set()
+        self._task = None
+
+    @property
+    def store(self):
+        return self._store or get_store()
+
+    async def set_typing(self, channel_id, user_id, user_name, is_typing):
+        """Record a typing update; duplicates never reach the channel layer."""
+        key = (channel_id, user_id)
+        current = time.time()
+
+        if is_typing:
+            last_refresh = self._refreshed.get(key)
+            if last_refresh and current - last_refresh < self.ttl / 3:
+                return
+            await self.store.zadd(
+                _typing_key(channel_id),
+                {_member(user_id, user_name): current + self.ttl}
+            )
+            self._refreshed[key] = current
+            if last_refresh is None:
+                self._dirty.add(channel_id)
+        else:
+            if self._refreshed.pop(key, None) is None:
+                return
+            await self.store.zrem(_typing_key(channel_id), _member(user_id, user_name))
+            self._dirty.add(channel_id)
+
+        self._active[channel_id] = current + self.ttl
+        self._ensure_flusher()
+
+    async def typing_users(self, channel_id):
+        """Users currently typing in a channel."""
+        users = []
+        members = await self.store.zrangebyscore(_typing_key(channel_id), time.time(), '+inf')
+        for member in members:
+            user_id, user_name = member.split(':', 1)
+            users.append({"id": int(user_id), "name": user_name})
+        return users
+
+    def _ensure_flusher(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while self._active:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        """Expire stale typers and broadcast snapshots of changed channels."""
+        current = time.time()
+
+        for channel_id, watch_until in list(self._active.items()):
+            expired = await self.store.zremrangebyscore(
+                _typing_key(channel_id), '-inf', current
+            )
+            if expired:
+                self._dirty.add(channel_id)
+            if watch_until < current:
+                del self._active[channel_id]
+
+        for key, refreshed in list(self._refreshed.items()):
+            if current - refreshed > self.ttl:
+                del self._refreshed[key]
+
+        dirty, self._dirty = self._dirty, set()
+        channel_layer = get_channel_layer()
+        for channel_id in dirty:
+            await channel_layer.group_send(
+                f"chat_{channel_id}",
+                encode_event({
+                    "type": "typing_snapshot",
+                    "channel_id": channel_id,
+                    "users": await self.typing_users(channel_id)
+                })
+            )
+
+
+typing_coalescer = TypingCoalescer()
@@ -0,0 +1,107 @@
+"""
+Chunked attachment uploads over the chat WebSocket.
+
+Protocol:
+
+1. The client sends ``{"type": "upload_start", "upload_id": <32 hex chars>,
+   "channel_id", "name", "size", "content"}``. The server validates the
+   extension and declared size and answers ``upload_ready`` with the
+   maximum chunk size.
+2. The client sends binary frames made of the 16 raw bytes of the upload
+   id, a big-endian unsigned 32-bit sequence number starting at 0, and
+   the chunk payload. Each chunk is appended to a temporary file and
+   acknowledged with ``upload_ack``.
+3. ``upload_commit`` creates the message from the temporary file;
+   ``upload_abort`` discards it.
+
+Only one chunk is held in memory at a time per upload.
+"""
+import os
+import struct
+import tempfile
+import uuid
+from django.conf import settings
+from .models import MAX_FILE_SIZE, ALLOWED_FILE_EXTENSIONS
+
+CHUNK_SIZE = getattr(settings, 'CHAT_UPLOAD_CHUNK_SIZE', 64 * 1024)
+MAX_CONCURRENT_UPLOADS = getattr(settings, 'CHAT_UPLOAD_MAX_CONCURRENT', 3)
+
+HEADER = struct.Struct('!16sI')
+
+
+class UploadError(Exception):
+    """Raised when an upload violates the protocol or the file limits."""
+
+
+def parse_chunk(frame):
+    """Split a binary frame into ``(upload_id, seq, payload)``."""
+    if len(frame) <= HEADER.size:
+        raise UploadError("Fragmento de archivo vacío o incompleto")
+    raw_id, seq = HEADER.unpack_from(frame)
+    payload = frame[HEADER.size:]
+    if len(payload) > CHUNK_SIZE:
+        raise UploadError("Fragmento de archivo demasiado grande")
+    return uuid.UUID(bytes=raw_id).hex, seq, payload
+
+
+class ChunkedUpload:
+    """An attachment being streamed to a temporary file."""
+
+    def __init__(self, upload_id, channel_id, name, size, content=''):
+        try:
+            self.upload_id = uuid.UUID(hex=str(upload_id)).hex
+        except ValueError:
+            raise UploadError("Identificador de subida no válido")
+
+        name = os.path.basename(str(name or ''))
+        ext = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+        if ext not in ALLOWED_FILE_EXTENSIONS:
+            raise UploadError(
+                f"Tipo de archivo no permitido. Extensiones permitidas: {', '.join(ALLOWED_FILE_EXTENSIONS)}"
+            )
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise UploadError("Tamaño de archivo no válido")
+        if size <= 0 or size > MAX_FILE_SIZE:
+            raise UploadError("El archivo no puede superar los 20MB.")
+
+        self.channel_id = channel_id
+        self.name = name
+        self.size = size
+        self.content = content
+        self.received = 0
+        self.next_seq = 0
+
+        fd, self.path = tempfile.mkstemp(
+            prefix='chat-upload-',
+            dir=getattr(settings, 'FILE_UPLOAD_TEMP_DIR', None)
+        )
+        self.file = os.fdopen(fd, 'wb')
+
+    def write_chunk(self, seq, payload):
+        """Append a chunk, enforcing order and the declared size."""
+        if seq != self.next_seq:
+            raise UploadError(
+                f"Fragmento fuera de orden: se esperaba {self.next_seq} y llegó {seq}"
+            )
+        if self.received + len(payload) > self.size:
+            raise UploadError("El archivo supera el tamaño declarado")
+        self.file.write(payload)
+        self.received += len(payload)
+        self.next_seq += 1
+
+    def finish(self):
+        """Close the temporary file once every byte has arrived."""
+        if self.received != self.size:
+            raise UploadError("La subida del archivo está incompleta")
+        self.file.close()
+
+    def discard(self):
+        """Close and remove the temporary file."""
+        if not self.file.closed:
+            self.file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -21,4 +21,7 @@ urlpatterns = [
     # Users
     path('online-users/', views.OnlineUsersView.as_view(), name='online-users'),
     path('my-channels/', views.UserChannelsView.as_view(), name='user-channels'),
+    
+    # Monitoring
+    path('metrics/', views.chat_metrics, name='chat-metrics'),
 ]
\ No newline at end of file
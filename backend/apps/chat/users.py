@@ -0,0 +1,121 @@
+"""
+Compact user snapshots for chat payloads.
+
+Chat payloads identify their authors by ``user_id`` only. The display
+data, ``{"id", "name", "avatar"}``, travels separately as a snapshot: a
+socket is sent each user's snapshot once, in a ``users`` frame ahead of
+the first payload that needs it, and REST history pages carry the
+snapshots of their authors next to the messages.
+
+Snapshots are cached per process, keyed by user id and by the version
+that ``signals.invalidate_user`` bumps on every profile or avatar change.
+A cached snapshot is trusted for ``CHECK_INTERVAL`` seconds before its
+version is checked again, so changes made through another worker show up
+within that time; changes made in this process drop it right away.
+"""
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from .middleware import get_user_versions, get_user_versions_sync
+
+User = get_user_model()
+
+CACHE_SIZE = getattr(settings, 'CHAT_USER_CACHE_SIZE', 10000)
+CHECK_INTERVAL = getattr(settings, 'CHAT_USER_CACHE_CHECK_INTERVAL', 5.0)
+
+
+def user_snapshot(user):
+    """Display data of a user as sent to chat clients."""
+    return {
+        "id": user.id,
+        "name": user.get_full_name(),
+        "avatar": user.avatar.url if user.avatar else None
+    }
+
+
+class UserSnapshotCache:
+    """Bounded cache of user id -> (version, snapshot)."""
+
+    def __init__(self, max_size=CACHE_SIZE, check_interval=CHECK_INTERVAL):
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self._items = OrderedDict()
+
+    async def get_many(self, user_ids):
+        """``{user_id: (version, snapshot)}`` for the existing users among ``user_ids``."""
+        now = time.monotonic()
+        found, to_check = self._cached(user_ids, now)
+        # Read versions before the users so a concurrent change is not cached
+        versions = self._checked(await get_user_versions(to_check), found, now)
+        if versions:
+            users = [user async for user in User.objects.filter(id__in=list(versions))]
+            self._loaded(users, versions, found, now)
+        return found
+
+    def get_many_sync(self, user_ids):
+        """Synchronous variant of ``get_many``."""
+        now = time.monotonic()
+        found, to_check = self._cached(user_ids, now)
+        versions = self._checked(get_user_versions_sync(to_check), found, now)
+        if versions:
+            self._loaded(User.objects.filter(id__in=list(versions)), versions, found, now)
+        return found
+
+    def _cached(self, user_ids, now):
+        """Snapshots recently checked, and the ids whose version needs a check."""
+        found = {}
+        to_check = []
+        for user_id in set(user_ids):
+            item = self._items.get(user_id)
+            if item is not None and item['checked_at'] + self.check_interval > now:
+                self._items.move_to_end(user_id)
+                found[user_id] = (item['version'], item['snapshot'])
+            else:
+                to_check.append(user_id)
+        return found, to_check
+
+    def _checked(self, versions, found, now):
+        """Adds the snapshots still current to ``found``; returns the stale versions."""
+        stale = {}
+        for user_id, version in versions.items():
+            item = self._items.get(user_id)
+            if item is not None and item['version'] == version:
+                item['checked_at'] = now
+                found[user_id] = (version, item['snapshot'])
+            else:
+                stale[user_id] = version
+        return stale
+
+    def _loaded(self, users, versions, found, now):
+        for user in users:
+            snapshot = user_snapshot(user)
+            self._set(user.id, versions[user.id], snapshot, now)
+            found[user.id] = (versions[user.id], snapshot)
+
+    def _set(self, user_id, version, snapshot, checked_at):
+        self._items[user_id] = {
+            'version': version,
+            'snapshot': snapshot,
+            'checked_at': checked_at,
+        }
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def discard(self, user_id):
+        self._items.pop(user_id, None)
+    
+    def snapshots_sync(self, user_ids, request=None):
+        """Snapshots for views, with absolute avatar URLs when given the request."""
+        snapshots = [snapshot for _, snapshot in self.get_many_sync(user_ids).values()]
+        if request:
+            snapshots = [
+                dict(snapshot, avatar=request.build_absolute_uri(snapshot["avatar"]))
+                if snapshot["avatar"] else snapshot
+                for snapshot in snapshots
+            ]
+        return snapshots
+
+
+user_snapshots = UserSnapshotCache()
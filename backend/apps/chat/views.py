@@ -3,17 +3,32 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Count, Max
+from django.db.models import Q, Count, F
 from django.utils import timezone
-from .models import Channel, Message, ChannelMembership
+from django.contrib.auth import get_user_model
+from .metrics import metrics
+from .models import Channel, Message, ChannelMembership, HISTORY_PAGE_SIZE
+from .presence import presence
+from .receipts import read_receipts
+from .recent import recent_messages
+from .users import user_snapshots
+from .search import (
+    get_backend as get_search_backend,
+    encode_cursor,
+    decode_cursor,
+    SEARCH_PAGE_SIZE
+)
 from .serializers import (
     ChannelSerializer,
     MessageSerializer,
+    CompactMessageSerializer,
     MessageCreateSerializer,
     ChannelMembershipSerializer,
     FileUploadSerializer
 )
 
+User = get_user_model()
+
 
 class ChannelListView(generics.ListAPIView):
     """List all active channels with unread counts."""
@@ -21,9 +36,11 @@ class ChannelListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        return Channel.objects.filter(is_active=True).annotate(
-            last_message_time=Max('messages__created_at')
-        ).order_by('-last_message_time', 'name')
+        return Channel.objects.filter(is_active=True).select_related(
+            'created_by'
+        ).with_unread_count(
+            self.request.user
+        ).order_by(F('last_message_at').desc(nulls_last=True), 'name')
 
 
 class ChannelDetailView(generics.RetrieveAPIView):
@@ -33,35 +50,68 @@ class ChannelDetailView(generics.RetrieveAPIView):
     lookup_field = 'id'
     
     def get_queryset(self):
-        return Channel.objects.filter(is_active=True)
+        return Channel.objects.filter(is_active=True).with_unread_count(self.request.user)
 
 
 class ChannelMessagesView(generics.ListAPIView):
-    """List messages for a specific channel."""
-    serializer_class = MessageSerializer
+    """
+    List messages for a specific channel.
+    
+    Without parameters returns the latest messages. ``before_id`` pages back
+    through older history and ``after_id`` fetches newer messages; they are
+    keyset cursors, so every page costs the same regardless of its depth,
+    and only one of them may be given.
+    Messages carry a ``user_id``; the page's authors come once in ``users``.
+    """
+    serializer_class = CompactMessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None
     
-    def get_queryset(self):
-        channel_id = self.kwargs.get('channel_id')
-        channel = get_object_or_404(Channel, id=channel_id, is_active=True)
+    def list(self, request, *args, **kwargs):
+        channel = get_object_or_404(Channel, id=self.kwargs.get('channel_id'), is_active=True)
         
-        # Update membership last read
-        membership, created = ChannelMembership.objects.get_or_create(
-            user=self.request.user,
-            channel=channel
-        )
-        membership.mark_as_read()
+        try:
+            before_id = int(request.GET.get('before_id') or 0) or None
+            after_id = int(request.GET.get('after_id') or 0) or None
+            limit = int(request.GET.get('limit') or HISTORY_PAGE_SIZE)
+        except ValueError:
+            return Response(
+                {'error': 'Parámetros de paginación no válidos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if before_id and after_id:
+            return Response(
+                {'error': 'Usa before_id o after_id, no ambos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = max(1, min(limit, HISTORY_PAGE_SIZE))
         
-        # Get messages
-        return Message.objects.filter(
-            channel=channel
-        ).select_related('user').order_by('-created_at')[:100]  # Last 100 messages
-    
-    def list(self, request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
-        # Reverse the order to show oldest first
-        response.data['results'] = list(reversed(response.data['results']))
-        return response
+        # Scrolling back through history does not mark the channel as read
+        if not before_id:
+            read_receipts.mark(request.user.id, channel.id)
+        
+        if before_id or after_id:
+            messages, has_more = Message.objects.page(
+                channel.id,
+                before_id=before_id,
+                after_id=after_id,
+                limit=limit
+            )
+            results = self.get_serializer(messages, many=True).data
+        else:
+            # Opening a channel is served from the recent messages cache
+            results, has_more = recent_messages.latest(channel.id, limit, request)
+        
+        return Response({
+            'results': results,
+            'users': user_snapshots.snapshots_sync(
+                {message['user_id'] for message in results if message['user_id']},
+                request
+            ),
+            'has_more': has_more,
+            'before_id': results[0]['id'] if results else before_id,
+            'after_id': results[-1]['id'] if results else after_id
+        })
 
 
 class MessageCreateView(generics.CreateAPIView):
@@ -71,13 +121,10 @@ class MessageCreateView(generics.CreateAPIView):
     
     def perform_create(self, serializer):
         message = serializer.save()
+        recent_messages.append_sync(message)
         
         # Update membership
-        membership, created = ChannelMembership.objects.get_or_create(
-            user=self.request.user,
-            channel=message.channel
-        )
-        membership.mark_as_read()
+        read_receipts.mark(self.request.user.id, message.channel_id, message.created_at)
 
 
 class MessageDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -123,9 +170,17 @@ class OnlineUsersView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        # This is a placeholder - in production you'd track this via WebSocket connections
-        # For now, return empty list
-        return Response([])
+        channel_id = request.GET.get('channel_id')
+        user_ids = presence.online_user_ids_sync(channel_id)
+        users = User.objects.filter(id__in=user_ids, is_active=True)
+        return Response([
+            {
+                'id': user.id,
+                'name': user.get_full_name(),
+                'avatar': user.avatar.url if user.avatar else None
+            }
+            for user in users
+        ])
 
 
 class UserChannelsView(generics.ListAPIView):
@@ -137,7 +192,7 @@ class UserChannelsView(generics.ListAPIView):
         return ChannelMembership.objects.filter(
             user=self.request.user,
             channel__is_active=True
-        ).select_related('channel')
+        ).select_related('channel', 'channel__created_by')
 
 
 @api_view(['POST'])
@@ -146,11 +201,7 @@ def mark_channel_as_read(request, channel_id):
     """Mark all messages in a channel as read."""
     channel = get_object_or_404(Channel, id=channel_id, is_active=True)
     
-    membership, created = ChannelMembership.objects.get_or_create(
-        user=request.user,
-        channel=channel
-    )
-    membership.mark_as_read()
+    read_receipts.mark(request.user.id, channel.id)
     
     return Response({'status': 'success'})
 
@@ -158,19 +209,65 @@ def mark_channel_as_read(request, channel_id):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def search_messages(request):
-    """Search messages across all channels."""
+    """
+    Search messages across all channels.
+    
+    Results are ranked by relevance and include a highlighted ``snippet``;
+    messages found only by their author's name come last, without one.
+    ``channel_id`` restricts the search to one channel and ``cursor`` (the
+    ``next_cursor`` of the previous response) fetches the next page.
+    """
     query = request.GET.get('q', '')
+    channel_id = request.GET.get('channel_id')
     
     if not query:
-        return Response({'results': []})
-    
-    messages = Message.objects.filter(
-        Q(content__icontains=query) |
-        Q(user__first_name__icontains=query) |
-        Q(user__last_name__icontains=query),
-        channel__is_active=True,
-        is_deleted=False
-    ).select_related('user', 'channel').order_by('-created_at')[:50]
-    
-    serializer = MessageSerializer(messages, many=True, context={'request': request})
-    return Response({'results': serializer.data})
\ No newline at end of file
+        return Response({'results': [], 'next_cursor': None})
+    
+    backend = get_search_backend()
+    if backend is None:
+        messages = Message.objects.filter(
+            Q(content__icontains=query) |
+            Q(user__first_name__icontains=query) |
+            Q(user__last_name__icontains=query),
+            channel__is_active=True,
+            is_deleted=False
+        ).select_related('user', 'channel').order_by('-created_at')[:SEARCH_PAGE_SIZE]
+        
+        serializer = MessageSerializer(messages, many=True, context={'request': request})
+        return Response({'results': serializer.data, 'next_cursor': None})
+    
+    try:
+        after = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+        if channel_id:
+            channel_id = int(channel_id)
+    except ValueError:
+        return Response(
+            {'error': 'Parámetros de búsqueda no válidos'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    rows = backend.search(query, channel_id=channel_id, after=after, limit=SEARCH_PAGE_SIZE)
+    messages = Message.objects.select_related('user', 'channel').in_bulk(
+        [message_id for message_id, score, snippet in rows]
+    )
+    
+    results = []
+    for message_id, score, snippet in rows:
+        if message_id in messages:
+            data = MessageSerializer(messages[message_id], context={'request': request}).data
+            data['snippet'] = snippet
+            results.append(data)
+    
+    next_cursor = None
+    if len(rows) == SEARCH_PAGE_SIZE:
+        message_id, score, snippet = rows[-1]
+        next_cursor = encode_cursor(score, message_id)
+    
+    return Response({'results': results, 'next_cursor': next_cursor})
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def chat_metrics(request):
+    """Counters, gauges and latency histograms of the chat in this process."""
+    return Response(metrics.snapshot())
\ No newline at end of file
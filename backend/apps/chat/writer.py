@@ -0,0 +1,217 @@
+"""
+Group commit of chat messages.
+
+``send_message`` frames are queued in the message writer instead of being
+saved one by one. A batch is written once ``BATCH_SIZE`` messages are
+queued or ``BATCH_DELAY`` seconds after the first one, in one transaction:
+a single ``bulk_create``, the search index in one or two statements per
+300 messages (none on PostgreSQL), and per channel of the batch its
+summary, its unread counters and one read mark update per sender.
+
+Messages posted through the REST API and messages with an attachment
+(uploads) are saved on their own with ``Message.save``, which keeps the
+same search index, summaries and counters up to date.
+
+Saved messages are broadcast with their real ids in the order they were
+queued, before the senders are answered. Batches never overlap, so the
+messages of a channel always reach clients in id order. Messages still
+queued when the process exits are written without a broadcast.
+"""
+import asyncio
+import atexit
+import logging
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import models, transaction
+from .db import db_executor_async
+from .events import encode_event, message_to_dict
+from .metrics import metrics
+from .models import Channel, Message, ChannelMembership
+from .notifications import unread_notifier
+from .recent import recent_messages
+from .replay import replay_buffer
+from .search import get_backend as get_search_backend
+
+BATCH_SIZE = getattr(settings, 'CHAT_WRITE_BATCH_SIZE', 50)
+BATCH_DELAY = getattr(settings, 'CHAT_WRITE_BATCH_DELAY', 0.005)
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriteError(Exception):
+    """Raised to the senders of a batch that could not be saved."""
+
+
+async def broadcast_message(message):
+    """Send a saved message to its channel group."""
+    event = {
+        "type": "new_message",
+        "message": message_to_dict(message)
+    }
+    await replay_buffer.append(message.channel_id, event)
+    await recent_messages.append(message)
+    await get_channel_layer().group_send(
+        f"chat_{message.channel_id}",
+        encode_event(event, user_ids=[message.user_id])
+    )
+    unread_notifier.channel_changed(message.channel_id)
+
+
+def persist_messages(entries):
+    """
+    Save ``(user, channel_id, content)`` entries in one transaction.
+
+    Returns one saved message per entry, or None where the channel does
+    not exist or is inactive.
+    """
+    channel_ids = {channel_id for _, channel_id, _ in entries}
+    active_ids = set(
+        Channel.objects.filter(id__in=channel_ids, is_active=True).values_list('id', flat=True)
+    )
+    messages = [
+        Message(channel_id=channel_id, user=user, content=content)
+        if channel_id in active_ids else None
+        for user, channel_id, content in entries
+    ]
+    saved = [message for message in messages if message is not None]
+    if not saved:
+        return messages
+
+    with transaction.atomic():
+        Message.objects.bulk_create(saved)
+
+        search_backend = get_search_backend()
+        if search_backend:
+            search_backend.index_many(saved)
+
+        by_channel = {}
+        for message in saved:
+            by_channel.setdefault(message.channel_id, []).append(message)
+        for channel_id, channel_messages in by_channel.items():
+            Channel.objects.record_new_messages(channel_id, channel_messages)
+            update_memberships(channel_id, channel_messages)
+
+    return messages
+
+
+def update_memberships(channel_id, messages):
+    """Apply a batch of new messages to the channel's unread counters."""
+    sender_ids = {message.user_id for message in messages}
+
+    # Members who did not write in the batch have all of it unread
+    ChannelMembership.objects.filter(
+        channel_id=channel_id
+    ).exclude(user_id__in=sender_ids).update(
+        unread_count=models.F('unread_count') + len(messages)
+    )
+
+    # Senders have read the channel up to their own last message; their
+    # memberships were created by ``record_new_messages``
+    for user_id in sender_ids:
+        last = max(
+            index for index, message in enumerate(messages)
+            if message.user_id == user_id
+        )
+        ChannelMembership.objects.filter(
+            channel_id=channel_id,
+            user_id=user_id
+        ).update(
+            last_read_at=messages[last].created_at,
+            unread_count=sum(
+                1 for message in messages[last + 1:]
+                if message.user_id != user_id
+            )
+        )
+
+
+class MessageWriter:
+    """Buffer new messages and persist them in batches."""
+
+    def __init__(self, batch_size=BATCH_SIZE, delay=BATCH_DELAY):
+        self.batch_size = batch_size
+        self.delay = delay
+        # (user, channel_id, content, future) in arrival order
+        self._pending = []
+        self._wakeup = None
+        self._task = None
+
+    async def submit(self, user, channel_id, content):
+        """Queue a message; returns it once saved and broadcast, or None."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((user, int(channel_id), content, future))
+        if len(self._pending) >= self.batch_size and self._wakeup:
+            self._wakeup.set()
+        self._ensure_writer()
+        return await future
+
+    async def flush(self):
+        """Write everything queued so far without waiting for the delay."""
+        if not self._pending:
+            return
+        self._ensure_writer()
+        if self._wakeup:
+            self._wakeup.set()
+        await asyncio.shield(self._task)
+
+    def _ensure_writer(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while self._pending:
+            if len(self._pending) < self.batch_size:
+                self._wakeup = asyncio.Event()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup = None
+            try:
+                await self._write_batch()
+            except Exception:
+                # The messages queued after a failed batch still get written
+                logger.exception("Chat message writer failed")
+
+    async def _write_batch(self):
+        batch = self._pending[:self.batch_size]
+        del self._pending[:self.batch_size]
+
+        metrics.observe("writer.batch_size", len(batch))
+        try:
+            with metrics.timer("writer.persist"):
+                messages = await db_executor_async(persist_messages)(
+                    [(user, channel_id, content) for user, channel_id, content, _ in batch]
+                )
+        except Exception:
+            logger.exception("Could not write a batch of %s chat messages", len(batch))
+            metrics.incr("writer.failed_batches")
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(MessageWriteError("No se pudo guardar el mensaje"))
+            return
+        metrics.incr("writer.messages", len(batch))
+
+        try:
+            for message in messages:
+                if message is None:
+                    continue
+                try:
+                    await broadcast_message(message)
+                except Exception:
+                    # Saved anyway; clients catch up when they reload
+                    logger.exception("Could not broadcast chat message %s", message.id)
+                    metrics.incr("writer.failed_broadcasts")
+        finally:
+            for (_, _, _, future), message in zip(batch, messages):
+                if not future.done():
+                    future.set_result(message)
+
+    def write_pending(self):
+        """Persist whatever is still queued; used when the process exits."""
+        batch, self._pending = self._pending, []
+        if batch:
+            persist_messages([(user, channel_id, content) for user, channel_id, content, _ in batch])
+
+
+message_writer = MessageWriter()
+atexit.register(message_writer.write_pending)
@@ -104,6 +104,55 @@ CHANNEL_LAYERS = {
 #     }
 # }
 
+# Single-node installs can skip Redis with CHANNEL_LAYER=memory: channels
+# and groups then live in the one ASGI process that serves HTTP and WebSockets
+if config('CHANNEL_LAYER', default='redis') == 'memory':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'apps.chat.layers.ShardedInMemoryChannelLayer',
+            'CONFIG': {
+                'capacity': config('CHANNEL_LAYER_CAPACITY', default=500, cast=int),  # queued messages per channel
+                'expiry': config('CHANNEL_LAYER_EXPIRY', default=60, cast=int),  # seconds
+                'shards': config('CHANNEL_LAYER_SHARDS', default=16, cast=int),
+            },
+        },
+    }
+
+# Chat configuration
+CHAT_PRESENCE_TTL = config('CHAT_PRESENCE_TTL', default=60, cast=int)  # seconds
+CHAT_PRESENCE_HEARTBEAT_INTERVAL = config('CHAT_PRESENCE_HEARTBEAT_INTERVAL', default=20, cast=int)  # seconds
+CHAT_PRESENCE_BROADCAST_INTERVAL = config('CHAT_PRESENCE_BROADCAST_INTERVAL', default=1.0, cast=float)  # seconds between presence diffs
+CHAT_UPLOAD_CHUNK_SIZE = config('CHAT_UPLOAD_CHUNK_SIZE', default=64 * 1024, cast=int)  # bytes
+CHAT_UPLOAD_MAX_CONCURRENT = config('CHAT_UPLOAD_MAX_CONCURRENT', default=3, cast=int)
+CHAT_RENDER_EXECUTOR = config('CHAT_RENDER_EXECUTOR', default='thread')  # 'thread' or 'process'
+CHAT_RENDER_WORKERS = config('CHAT_RENDER_WORKERS', default=2, cast=int)
+CHAT_RENDER_TIMEOUT = config('CHAT_RENDER_TIMEOUT', default=2.0, cast=float)  # seconds to wait for a free render worker, and again for the render
+CHAT_RENDER_MAX_INPUT_SIZE = config('CHAT_RENDER_MAX_INPUT_SIZE', default=20000, cast=int)  # characters
+CHAT_RENDER_CACHE_SIZE = config('CHAT_RENDER_CACHE_SIZE', default=1024, cast=int)
+CHAT_REPLAY_BUFFER_SIZE = config('CHAT_REPLAY_BUFFER_SIZE', default=200, cast=int)  # events per channel
+CHAT_REPLAY_DB_CONCURRENCY = config('CHAT_REPLAY_DB_CONCURRENCY', default=4, cast=int)
+CHAT_TYPING_TTL = config('CHAT_TYPING_TTL', default=5, cast=int)  # seconds
+CHAT_TYPING_INTERVAL = config('CHAT_TYPING_INTERVAL', default=0.3, cast=float)  # seconds between snapshots
+CHAT_WS_AUTH_MODE = config('CHAT_WS_AUTH_MODE', default='cache')  # 'db', 'cache' or 'claims'
+CHAT_WS_AUTH_CACHE_TTL = config('CHAT_WS_AUTH_CACHE_TTL', default=300, cast=int)  # seconds
+CHAT_WS_AUTH_CACHE_SIZE = config('CHAT_WS_AUTH_CACHE_SIZE', default=10000, cast=int)
+CHAT_MAX_SUBSCRIPTIONS = config('CHAT_MAX_SUBSCRIPTIONS', default=20, cast=int)  # channel groups per socket
+CHAT_UNREAD_NOTIFY_INTERVAL = config('CHAT_UNREAD_NOTIFY_INTERVAL', default=1.0, cast=float)  # seconds between counter updates
+CHAT_WRITE_BATCH_SIZE = config('CHAT_WRITE_BATCH_SIZE', default=50, cast=int)  # messages per group commit
+CHAT_WRITE_BATCH_DELAY = config('CHAT_WRITE_BATCH_DELAY', default=0.005, cast=float)  # seconds
+CHAT_OUTBOX_SIZE = config('CHAT_OUTBOX_SIZE', default=256, cast=int)  # queued frames per socket
+CHAT_BATCH_WINDOW = config('CHAT_BATCH_WINDOW', default=0.02, cast=float)  # seconds frames are gathered for clients that connect with ?batch=1
+CHAT_MSGPACK_ENABLED = config('CHAT_MSGPACK_ENABLED', default=True, cast=bool)  # offer the msgpack WebSocket subprotocol
+CHAT_READ_FLUSH_INTERVAL = config('CHAT_READ_FLUSH_INTERVAL', default=2.0, cast=float)  # seconds between read receipt writes
+CHAT_ARCHIVE_AFTER_DAYS = config('CHAT_ARCHIVE_AFTER_DAYS', default=365, cast=int)  # messages older than this are archived
+CHAT_ARCHIVE_ROOT = config('CHAT_ARCHIVE_ROOT', default=str(BASE_DIR / 'archive' / 'chat'))
+CHAT_DB_WORKERS = config('CHAT_DB_WORKERS', default=4, cast=int)  # threads for chat database writes; 0 to use the shared sync thread
+CHAT_USER_CACHE_SIZE = config('CHAT_USER_CACHE_SIZE', default=10000, cast=int)  # user snapshots per process
+CHAT_USER_CACHE_CHECK_INTERVAL = config('CHAT_USER_CACHE_CHECK_INTERVAL', default=5.0, cast=float)  # seconds before a snapshot's version is checked again
+CHAT_METRICS_ENABLED = config('CHAT_METRICS_ENABLED', default=True, cast=bool)
+CHAT_METRICS_LOG_INTERVAL = config('CHAT_METRICS_LOG_INTERVAL', default=60, cast=int)  # seconds between metrics log lines
+CHAT_METRICS_PROBE_TIMEOUT = config('CHAT_METRICS_PROBE_TIMEOUT', default=5, cast=float)  # seconds a channel layer probe waits for its reply
+
 # Database configuration
 DATABASES = {
     'default': {